@@ -0,0 +1,64 @@
+"""
+    Worker threads computing the independent sections of the dashboard
+    (maps, price indexes, opportunities) while the script renders the
+    sections above them.
+
+    Jobs run with the Streamlit context of the session that submitted them,
+    so the messages they write (e.g. a failed geofile fetch) still reach
+    that session. Jobs should only compute: widgets and figures are
+    rendered by the script thread, in page order, once a job is done.
+"""
+import importlib
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    ## --- streamlit 1.3
+    from streamlit.report_thread import (add_report_ctx as add_script_run_ctx, get_report_ctx as get_script_run_ctx,
+                                         REPORT_CONTEXT_ATTR_NAME as CONTEXT_ATTR_NAME)
+except ImportError:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    from streamlit.runtime.scriptrunner.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME as CONTEXT_ATTR_NAME
+
+## --- shared by every session of the process, sized by KC_SECTION_WORKERS
+POOL = ThreadPoolExecutor(max_workers=int(os.environ.get('KC_SECTION_WORKERS', 4)),
+                          thread_name_prefix='kc-sections')
+
+
+def submit(func, *args, **kwargs):
+    """
+        Run func(*args, **kwargs) in POOL with the Streamlit context of the
+        calling thread.
+
+        Returns: concurrent.futures.Future
+    """
+    ctx = get_script_run_ctx()
+
+    def run():
+        thread = threading.current_thread()
+        if ctx is not None:
+            add_script_run_ctx(thread, ctx)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            ## --- pool threads are reused by other sessions
+            setattr(thread, CONTEXT_ATTR_NAME, None)
+
+    return POOL.submit(run)
+
+
+def lazy_function(module, name):
+    """
+        Return a function calling module.name, where module is imported by
+        the first call, e.g. in a job of POOL rather than by the script.
+    """
+    def call(*args, **kwargs):
+        func = getattr(importlib.import_module(module), name)
+        ## --- lets Recorder tell cache hits from misses, see count_runs
+        call.counts_runs = getattr(func, 'counts_runs', False)
+        return func(*args, **kwargs)
+
+    call.__name__ = name
+    return call
@@ -0,0 +1,386 @@
+"""
+    Benchmark the functions of my_methods.py and the whole dashboard page on
+    synthetic King-County-shaped data at several scales.
+
+    Streamlit runs in bare mode (no server): widgets return their defaults and
+    st.* output calls are no-ops, so only the Python work is measured. Cached
+    functions are timed through their undecorated version, and figures
+    through the builders whose serialized output the page caches.
+
+    Usage: python benchmark.py [--scales 10000 100000 1000000 10000000]
+                               [--output benchmarks/results.json]
+                               [--baseline benchmarks/baseline.json]
+                               [--save-baseline] [--tolerance 1.25] [--skip-page]
+                               [--import-budget 0.8] [--imports-only]
+
+    The import of my_methods.py is timed first, in a fresh interpreter with
+    python -X importtime: it must stay under the import budget and must not
+    load Streamlit, plotly or the geo stack, which only the dashboard needs.
+
+    Timings are then compared with the baseline: the exit code is 1 on a
+    regression and 2 when there is no baseline, which --save-baseline creates.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy  as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(HERE, 'kc_house_data.csv')
+
+## --- regressions below this wall time are noise
+MIN_SECONDS = 0.01
+
+## --- import time allowed for my_methods.py, and the packages it must leave to my_plots.py and my_maps.py
+IMPORT_BUDGET = 0.8
+HEAVY_PACKAGES = ('streamlit', 'plotly', 'geopandas', 'folium', 'branca', 'shapely', 'fiona', 'pyogrio')
+
+
+## --- csv rows per chunk of the chunked ingestion
+INGEST_CHUNKSIZE = 50000
+
+
+def make_synthetic(n, seed=0, source=SOURCE, repeat_rate=0.01):
+    """
+        Build n raw sales shaped like kc_house_data.csv by resampling its
+        rows, jittering the coordinates and assigning fresh ids, a fraction
+        repeat_rate of which are repeat sales of an earlier id.
+
+        Returns: DataFrame
+                 Columns and formats of the raw csv file.
+    """
+    rng = np.random.default_rng(seed)
+    base = pd.read_csv(source)
+
+    data = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+
+    ids = np.arange(1000000000, 1000000000 + n, dtype=np.int64)
+    repeats = np.flatnonzero(rng.random(n) < repeat_rate)
+    ids[repeats] = ids[rng.integers(0, np.maximum(repeats, 1))]
+    data['id'] = ids
+
+    data['lat'] = np.round(data['lat'] + rng.normal(0, 0.002, n), 4)
+    data['long'] = np.round(data['long'] + rng.normal(0, 0.002, n), 3)
+
+    dates = pd.to_datetime(base['date'])
+    days = rng.integers(0, (dates.max() - dates.min()).days + 1, n)
+    data['date'] = (dates.min() + pd.to_timedelta(days, unit='D')).strftime('%Y%m%dT000000')
+
+    return data
+
+
+def measure(func, *args, **kwargs):
+    """
+        Run func twice: once for wall time, once under tracemalloc for the
+        peak of Python and NumPy allocations.
+
+        Returns: dict
+                 seconds and peak_mb.
+    """
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': seconds, 'peak_mb': peak / 1024. ** 2}
+
+
+def read_proc_status(field):
+    """
+        Return a memory field (e.g. VmRSS, VmHWM) of /proc/self/status in MB,
+        None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024.
+    except OSError:
+        return None
+
+
+def reset_peak_rss():
+    """
+        Reset the peak resident set size of this process to its current
+        size, so peak_rss_mb measures from now on. Only Linux allows it:
+        returns False elsewhere.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+        Return the peak resident set size of this process in MB, since the
+        start of the process or the last reset_peak_rss.
+    """
+    peak = read_proc_status('VmHWM')
+    if peak is not None:
+        return peak
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## --- ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024. ** 2 if sys.platform == 'darwin' else peak / 1024.
+
+
+def measure_rss(func, *args, **kwargs):
+    """
+        Run func once and report the resident set size before the call, its
+        peak during the call and their difference, in MB. The peak is only
+        reset for the call on Linux, elsewhere it is the peak of the whole
+        process and the difference is None.
+    """
+    reset = reset_peak_rss()
+    before = read_proc_status('VmRSS') if reset else None
+
+    func(*args, **kwargs)
+
+    peak = peak_rss_mb()
+    return {'rss_before_mb': before, 'peak_rss_mb': peak, 'rss_mb': peak - before if reset else None}
+
+
+def run_page(workdir, csv_path):
+    """
+        Execute st_dashboard.py as a script from a fresh directory under
+        workdir, where the data file is the synthetic csv and geodata links
+        to the repository's store. Caches are cleared first, so every run is
+        a cold start.
+    """
+    from caching import clear_caches
+
+    workdir = tempfile.mkdtemp(dir=workdir)
+    clear_caches()
+
+    shutil.copy(csv_path, os.path.join(workdir, 'kc_house_data.csv'))
+    if os.path.isdir(os.path.join(HERE, 'geodata')) and not os.path.exists(os.path.join(workdir, 'geodata')):
+        os.symlink(os.path.join(HERE, 'geodata'), os.path.join(workdir, 'geodata'))
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        runpy.run_path(os.path.join(HERE, 'st_dashboard.py'), run_name='__main__')
+    finally:
+        os.chdir(cwd)
+
+
+def measure_import(module='my_methods', repeat=3):
+    """
+        Import module in fresh interpreters under python -X importtime.
+
+        Returns: dict
+                 Best cumulative import time in seconds over repeat runs, and
+                 the HEAVY_PACKAGES loaded by the import.
+    """
+    code = 'import sys, {}; print(" ".join(sys.modules))'.format(module)
+    seconds, heavy = [], set()
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=HERE,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        ## --- lines read: import time: self [us] | cumulative | imported package
+        seconds += [int(line.split('|')[1]) / 1e6 for line in proc.stderr.splitlines()
+                    if line.split('|')[-1].strip() == module]
+        heavy |= {name.split('.')[0] for name in proc.stdout.split()} & set(HEAVY_PACKAGES)
+
+    return {'seconds': min(seconds), 'heavy': sorted(heavy)}
+
+
+def check_import(budget):
+    """
+        Measure the import of my_methods.py and print whether it keeps to
+        the budget.
+
+        Returns: (dict, bool)
+                 The measure and whether the budget is kept.
+    """
+    imports = measure_import()
+    ok = imports['seconds'] <= budget and not imports['heavy']
+    print('{:<10} import my_methods {:>9.3f} s (budget {:.3f} s){}'.format(
+        'OK' if ok else 'OVER', imports['seconds'], budget,
+        '  loads ' + ', '.join(imports['heavy']) if imports['heavy'] else ''))
+
+    return (imports, ok)
+
+
+def bytes_per_row(data):
+    return data.memory_usage(index=True, deep=True).sum() / max(len(data), 1)
+
+
+def bench_scale(n, workdir, skip_page=False):
+    import my_methods as mm
+    import my_plots   as mp
+    import my_maps    as mg
+
+    raw = make_synthetic(n)
+    csv_path = os.path.join(workdir, 'synthetic_{}.csv'.format(n))
+    raw.to_csv(csv_path, index=False)
+
+    plain = lambda func: getattr(func, '__wrapped__', func)
+    features = ['bedrooms', 'bathrooms', 'floors', 'yr_built', 'yr_renovated', 'zipcode']
+
+    deduped = plain(mm.hand_nonunique)(raw, 'id')
+    integers, _ = mm.check_integers(deduped, features)
+    cache_dir = os.path.join(workdir, 'cache_{}'.format(n))
+    data, _ = plain(mm.load_dataset)(csv_path, cache_dir)
+    history, _ = mm.load_sales(csv_path, cache_dir)
+    zip_cube, season_cube = plain(mm.get_cubes)(data)
+    to_buy, timing = plain(mm.display_houses_tobuy)(data, zip_cube)[0], plain(mm.get_sell_timing)(data)
+
+    ## --- figures are timed through their builders, over the full range of their filters
+    years = (int(data['yr_built'].min()), int(data['yr_built'].max()))
+    days = (data['date'].min().date(), data['date'].max().date())
+    prices = (int(np.floor(data['price'].min())), int(np.ceil(data['price'].max())))
+
+    ## --- memory of the cleaned dataset with inferred dtypes and with CACHE_SCHEMA
+    inferred = mm.build_features(integers)
+    memory = {'inferred': bytes_per_row(inferred), 'compact': bytes_per_row(data)}
+    print('{:>10} rows  bytes per row: {:.0f} inferred, {:.0f} compact'.format(n, memory['inferred'],
+                                                                               memory['compact']))
+
+    cases = [('get_data', plain(mm.get_data), (csv_path,)),
+             ('hand_nonunique', plain(mm.hand_nonunique), (raw, 'id')),
+             ('check_integers', mm.check_integers, (deduped, features)),
+             ('build_features', plain(mm.build_features), (integers,)),
+             ('load_sales_cold', lambda: (shutil.rmtree(cache_dir, ignore_errors=True),
+                                          plain(mm.load_sales)(csv_path, cache_dir)), ()),
+             ('load_sales_warm', plain(mm.load_sales), (csv_path, cache_dir)),
+             ('sale_history_index', lambda: mm.SaleHistory(history.sales, history.n_latest).index(), ()),
+             ('repeat_sales_table', plain(mm.repeat_sales_table), (history,)),
+             ('get_repeat_index', plain(mm.get_repeat_index), (history,)),
+             ('apply_schema', mm.apply_schema, (inferred,)),
+             ('get_cubes', plain(mm.get_cubes), (data,)),
+             ('display_data_averaged', plain(mm.display_data_averaged), (zip_cube, [])),
+             ('display_descriptive', plain(mm.display_descriptive), (data, [], 0.25)),
+             ('table_rows', plain(mm.table_rows), (data, 'price', False, (('bedrooms', 2, 4),))),
+             ('dist_renv_figure', plain(mp.dist_renv_figure), (data, ['to_renovate'])),
+             ('display_map_markers', plain(mg.display_map_markers), (data,)),
+             ('display_map_markers_legacy', plain(mg.display_map_markers), (data, 'markers')),
+             ('map_html', mg.map_html, (plain(mg.display_map_markers)(data)[0],)),
+             ('yrbuilt_figure', plain(mp.yrbuilt_figure), (data, years)),
+             ('season_figure', plain(mp.season_figure), (season_cube,)),
+             ('isold_figure', plain(mp.isold_figure), (data,)),
+             ('basement_figures', plain(mp.basement_figures), (data,)),
+             ('waterfront_figure', plain(mp.waterfront_figure), (data,)),
+             ('date_figure', plain(mp.date_figure), (data, days)),
+             ('price_dist_figure', plain(mp.price_dist_figure), (data, (), prices)),
+             ('att_hist_figure', plain(mp.att_hist_figure), (data, 'bedrooms')),
+             ('sell_timing_figure', plain(mp.sell_timing_figure), (data,)),
+             ('display_houses_tobuy', plain(mm.display_houses_tobuy), (data, zip_cube)),
+             ('get_sell_timing', plain(mm.get_sell_timing), (data,)),
+             ('sell_timing_table', plain(mm.sell_timing_table), (to_buy, timing)),
+             ('ingest_chunked', mm.ingest_chunked, (csv_path, INGEST_CHUNKSIZE))]
+
+    results = {}
+    for name, func, args in cases:
+        results[name] = measure(func, *args)
+        print('{:>10} rows  {:<28} {:>9.3f} s {:>9.1f} MB'.format(n, name, results[name]['seconds'],
+                                                                 results[name]['peak_mb']))
+
+    if not skip_page:
+        results['page'] = measure(run_page, workdir, csv_path)
+        print('{:>10} rows  {:<28} {:>9.3f} s {:>9.1f} MB'.format(n, 'page', results['page']['seconds'],
+                                                                 results['page']['peak_mb']))
+
+    ## --- peak RSS of the chunked ingestion, bounded by the chunk size plus the distinct ids
+    results['ingest_rss'] = measure_rss(mm.ingest_chunked, csv_path, INGEST_CHUNKSIZE)
+    print('{:>10} rows  {:<28} {:>9} MB RSS'.format(n, 'ingest_chunked', '{:.1f}'.format(results['ingest_rss']['rss_mb'])
+                                                     if results['ingest_rss']['rss_mb'] is not None else '-'))
+
+    results['bytes_per_row'] = memory
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+        Return the (scale, function, baseline seconds, seconds) entries slower
+        than tolerance times their baseline.
+    """
+    regressions = []
+    for scale, functions in results['results'].items():
+        for name, result in functions.items():
+            base = baseline['results'].get(scale, {}).get(name)
+            if 'seconds' not in result:
+                continue
+            if base and result['seconds'] > MIN_SECONDS and result['seconds'] > tolerance * base['seconds']:
+                regressions.append((scale, name, base['seconds'], result['seconds']))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark my_methods.py and the dashboard page.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='numbers of synthetic rows (10000000 is supported but slow)')
+    parser.add_argument('--output', default=os.path.join(HERE, 'benchmarks', 'results.json'))
+    parser.add_argument('--baseline', default=os.path.join(HERE, 'benchmarks', 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='allowed slowdown over the baseline')
+    parser.add_argument('--skip-page', action='store_true', help='do not time the whole page build')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET,
+                        help='seconds allowed for importing my_methods.py')
+    parser.add_argument('--imports-only', action='store_true', help='only check the import of my_methods.py')
+    args = parser.parse_args(argv)
+
+    imports, imports_ok = check_import(args.import_budget)
+    if args.imports_only:
+        return 0 if imports_ok else 1
+
+    ## --- a missing baseline fails the run up front, else the regression check would compare nothing
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        print('ERROR no baseline at {}: run with --save-baseline on the reference machine to create it.'.format(
+              args.baseline), file=sys.stderr)
+        return 2
+
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    sys.path.insert(0, HERE)
+
+    workdir = tempfile.mkdtemp(prefix='kc_bench_')
+    try:
+        results = {'meta': {'python': platform.python_version(), 'numpy': np.__version__,
+                            'pandas': pd.__version__, 'machine': platform.machine(),
+                            'date': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                   'imports': imports,
+                   'results': {str(n): bench_scale(n, workdir, args.skip_page) for n in args.scales}}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        shutil.copy(args.output, args.baseline)
+        return 0 if imports_ok else 1
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+
+    for scale, name, before, after in regressions:
+        print('REGRESSION {:>10} rows  {:<28} {:.3f} s -> {:.3f} s'.format(scale, name, before, after))
+
+    return 1 if regressions or not imports_ok else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,463 @@
+"""
+    Bounded in-memory caches shared by all dashboard sessions.
+
+    Two stores are kept apart: DATA_CACHE holds DataFrames and other values
+    derived from the dataset, bounded by entries, bytes and age. RESOURCE_CACHE
+    holds heavy objects built once and reused as they are (zipcode boundaries,
+    maps, spatial indexes), bounded by entries, bytes and age. Both evict the least
+    recently used entry first. FIGURE_CACHE holds figures serialized for the
+    browser (plotly JSON, folium HTML) and also keeps them as files of
+    FIGURE_DIR, so that every process of a deployment shares them and they
+    can be written ahead of the first visit (see warm_figures.py); the least
+    recently used files are removed beyond FIGURE_DIR_MAX_BYTES.
+
+    Cache keys are built from cheap fingerprints of the arguments instead of
+    hashing their content: every DataFrame returned by a cached function is
+    registered under a fingerprint derived from the function and its own key,
+    and load_sales registers the dataset version. Cached values are shared
+    between sessions and must not be modified by the callers.
+"""
+import functools
+import glob
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+
+from collections import OrderedDict
+
+import numpy  as np
+import pandas as pd
+
+
+class BoundedCache:
+    """
+        Thread-safe LRU cache with a maximum number of entries, a maximum
+        total size in bytes and a time to live.
+
+        Inputs: name: str
+                Name shown in the statistics.
+
+                max_entries: int
+                max_bytes: int or None
+                Size budget, estimated with value_nbytes. None for no limit.
+
+                ttl: float or None
+                Seconds after which an entry is stale. None for no limit.
+    """
+
+    def __init__(self, name, max_entries=128, max_bytes=None, ttl=None):
+        self.name = name
+        self.max_entries, self.max_bytes, self.ttl = max_entries, max_bytes, ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+            Return (True, value) for a fresh entry, (False, None) otherwise.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._drop(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return (False, None)
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return (True, entry[0])
+
+    def put(self, key, value):
+        nbytes = value_nbytes(value) if self.max_bytes is not None else 0
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            ## --- a value larger than the whole budget is returned but not kept
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                return
+
+            self._entries[key] = (value, nbytes, time.monotonic())
+            self.nbytes += nbytes
+
+            while len(self._entries) > self.max_entries or \
+                    (self.max_bytes is not None and self.nbytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self.nbytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """
+            Return the entries, size, hits, misses, hit rate and evictions.
+        """
+        calls = self.hits + self.misses
+        return {'cache': self.name, 'entries': len(self._entries), 'mb': self.nbytes / 1024. ** 2,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / calls if calls else None, 'evictions': self.evictions}
+
+
+DATA_CACHE = BoundedCache('data', max_entries=256, max_bytes=512 * 1024 ** 2, ttl=6 * 3600)
+RESOURCE_CACHE = BoundedCache('resource', max_entries=32, max_bytes=1024 ** 3, ttl=24 * 3600)
+FIGURE_CACHE = BoundedCache('figures', max_entries=512, max_bytes=128 * 1024 ** 2, ttl=24 * 3600)
+
+## --- serialized figures on disk, shared by the processes of a deployment, and their size budget
+FIGURE_DIR = os.environ.get('KC_FIGURE_DIR', os.path.join('.cache', 'figures'))
+FIGURE_DIR_MAX_BYTES = int(os.environ.get('KC_FIGURE_DIR_MB', 256)) * 1024 ** 2
+
+## --- bump to drop every stored figure, e.g. after upgrading plotly or folium; changes to the project modules are
+## --- caught by code_version, changes to installed packages are not
+FIGURE_VERSION = 1
+
+## --- FIGURE_DIR is trimmed on the first figure written by a process, then every so many
+FIGURE_TRIM_EVERY = 64
+
+
+def value_nbytes(value, seen=None):
+    """
+        Estimate the memory held by a cached value. Objects (indexes, maps)
+        are measured through their attributes, each object counted once.
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage.sum()) if isinstance(value, pd.DataFrame) else int(usage)
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list, set, frozenset)):
+        return sys.getsizeof(value) + sum(value_nbytes(item, seen) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_nbytes(item, seen) for item in value.values())
+    if hasattr(value, '__dict__') and not isinstance(value, type):
+        return sys.getsizeof(value) + value_nbytes(vars(value), seen)
+
+    return sys.getsizeof(value)
+
+
+## --- id(obj) -> (weak reference, fingerprint) of frames and resources returned by cached functions
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def register_fingerprint(obj, fingerprint):
+    """
+        Register the fingerprint of obj, e.g. the version of a dataset, used
+        in place of its content when obj is passed to a cached function.
+        An object already registered keeps its first fingerprint.
+    """
+    key = id(obj)
+    try:
+        ref = weakref.ref(obj, lambda _, key=key: _fingerprints.pop(key, None))
+    except TypeError:
+        return
+
+    with _fingerprints_lock:
+        known = _fingerprints.get(key)
+        if known is None or known[0]() is not obj:
+            _fingerprints[key] = (ref, fingerprint)
+
+
+def registered_fingerprint(obj):
+    known = _fingerprints.get(id(obj))
+    if known is not None and known[0]() is obj:
+        return known[1]
+
+    return None
+
+
+def fingerprint(value):
+    """
+        Return a hashable key for value. Registered objects cost a lookup;
+        unregistered DataFrames, Series and arrays are hashed once and then
+        registered.
+    """
+    known = registered_fingerprint(value)
+    if known is not None:
+        return known
+
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(fingerprint(item) for item in value)
+    if isinstance(value, dict):
+        return ('dict',) + tuple((key, fingerprint(item)) for key, item in sorted(value.items()))
+
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index, np.ndarray)):
+        if isinstance(value, np.ndarray):
+            content = np.ascontiguousarray(value).tobytes()
+            digest = hashlib.sha256(content).hexdigest()[:16]
+        else:
+            rows = pd.util.hash_pandas_object(value, index=True).values
+            columns = repr(list(getattr(value, 'columns', [getattr(value, 'name', None)])))
+            digest = hashlib.sha256(rows.tobytes() + columns.encode()).hexdigest()[:16]
+        key = ('content', digest)
+        register_fingerprint(value, key)
+        return key
+
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return ('repr', repr(value))
+
+
+def call_key(func, signature, args, kwargs):
+    """
+        Return the cache key of func(*args, **kwargs). Arguments are bound to
+        the signature of func, so that passing one by position, by keyword
+        or leaving it to its default gives the same key.
+    """
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+
+    return (func.__module__, func.__qualname__,
+            tuple((name, fingerprint(arg)) for name, arg in bound.arguments.items()))
+
+
+def failed(value):
+    """
+        Tell whether value is a failed (value, check) result, with a check
+        of 0, or None. Failures are not cached, the call is tried again.
+    """
+    if value is None:
+        return True
+
+    return isinstance(value, tuple) and len(value) == 2 and type(value[1]) is int and value[1] == 0
+
+
+def _cached(store, func):
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = call_key(func, signature, args, kwargs)
+
+        found, value = store.get(key)
+        if found:
+            return value
+
+        value = func(*args, **kwargs)
+        if failed(value):
+            return value
+
+        ## --- results passed on to other cached functions are keyed by where they come from
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+        items = value if isinstance(value, tuple) else (value,)
+        for position, item in enumerate(items):
+            if item is not None and not isinstance(item, (int, float, str, bool, np.number)):
+                register_fingerprint(item, ('derived', digest, position))
+
+        store.put(key, value)
+        return value
+
+    wrapper.cache = store
+    return wrapper
+
+
+def cache_data(func):
+    """
+        Cache the results of func in DATA_CACHE.
+    """
+    return _cached(DATA_CACHE, func)
+
+
+def cache_resource(func):
+    """
+        Cache the results of func in RESOURCE_CACHE.
+    """
+    return _cached(RESOURCE_CACHE, func)
+
+
+def figure_path(key, folder=None):
+    """
+        Return the file of FIGURE_DIR (or folder) holding the figure cached
+        under key, None when the key would not name the same figure in
+        another process, i.e. when it holds the address of an object.
+    """
+    text = repr(key)
+    if ' at 0x' in text:
+        return None
+
+    return os.path.join(folder or FIGURE_DIR, hashlib.sha256(text.encode()).hexdigest()[:32] + '.json')
+
+
+@functools.lru_cache(maxsize=None)
+def source_version(folder):
+    """
+        Return a hash of the names and sources of every module of folder.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(folder, '*.py'))):
+        with open(path, 'rb') as f:
+            digest.update(os.path.basename(path).encode() + b'\0' + f.read())
+
+    return digest.hexdigest()[:12]
+
+
+def code_version(func):
+    """
+        Return FIGURE_VERSION and a hash of the sources of every module of
+        the project defining func (the modules of its directory), so figures
+        stored by an older version of the code are not served after a
+        deploy, whichever module changed: a figure also depends on
+        my_methods.py, range_index.py or caching.py, not only on the module
+        building it.
+    """
+    try:
+        source = source_version(os.path.dirname(os.path.abspath(sys.modules[func.__module__].__file__)))
+    except (AttributeError, KeyError, OSError, TypeError):
+        source = None
+
+    return 'v{}-{}'.format(FIGURE_VERSION, source)
+
+
+def read_figure(path):
+    """
+        Return the figure stored in path, None if it is missing or unreadable.
+        Its modification time is updated, which trim_figures ranks files by.
+    """
+    try:
+        with open(path) as f:
+            value = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+
+    return tuple(value) if isinstance(value, list) else value
+
+
+_writes = [0]
+_writes_lock = threading.Lock()
+
+
+def write_figure(path, value):
+    ## --- written aside then renamed, so other processes never read half a file
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(value, f)
+        os.replace(temporary, path)
+    except OSError:
+        return
+
+    with _writes_lock:
+        trim = _writes[0] % FIGURE_TRIM_EVERY == 0
+        _writes[0] += 1
+    if trim:
+        trim_figures(os.path.dirname(path))
+
+
+def trim_figures(folder=None, max_bytes=None):
+    """
+        Remove the least recently used files of FIGURE_DIR (or folder) until
+        they take less than 90% of max_bytes, by default FIGURE_DIR_MAX_BYTES.
+        Figures of older code versions are never read again, so they go
+        first.
+
+        Returns: int
+                 The number of files removed.
+    """
+    folder = folder or FIGURE_DIR
+    max_bytes = FIGURE_DIR_MAX_BYTES if max_bytes is None else max_bytes
+
+    try:
+        files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in os.scandir(folder)
+                 if entry.name.endswith('.json')]
+    except OSError:
+        return 0
+
+    total = sum(size for _, size, _ in files)
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= 0.9 * max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    return removed
+
+
+def cache_figure(func):
+    """
+        Cache the serialized figures returned by func in FIGURE_CACHE and in
+        FIGURE_DIR. Figures are keyed like cache_data results, by the
+        dataset version and the exact filter inputs, plus the code version
+        (see code_version), and must be JSON: a string, or a tuple of
+        strings, numbers and dicts of them. FIGURE_DIR is kept under
+        FIGURE_DIR_MAX_BYTES by trim_figures.
+    """
+    signature = inspect.signature(func)
+    version = code_version(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = call_key(func, signature, args, kwargs) + (version,)
+
+        found, value = FIGURE_CACHE.get(key)
+        if found:
+            return value
+
+        path = figure_path(key)
+        value = read_figure(path) if path is not None else None
+        if value is None:
+            value = func(*args, **kwargs)
+            ## --- None stands for a figure that could not be built, tried again on the next call
+            if value is None:
+                return value
+            if path is not None:
+                write_figure(path, value)
+
+        FIGURE_CACHE.put(key, value)
+        return value
+
+    wrapper.cache = FIGURE_CACHE
+    return wrapper
+
+
+def cache_stats():
+    """
+        Return the statistics of the stores as a DataFrame.
+    """
+    return pd.DataFrame([DATA_CACHE.stats(), RESOURCE_CACHE.stats(), FIGURE_CACHE.stats()])
+
+
+def clear_caches():
+    """
+        Empty the in-memory stores. Statistics and the files of FIGURE_DIR
+        are kept.
+    """
+    DATA_CACHE.clear()
+    RESOURCE_CACHE.clear()
+    FIGURE_CACHE.clear()
@@ -0,0 +1,249 @@
+"""
+    Timing and profiling of the dashboard reruns: wall time per section and
+    per my_methods call, cache hits and misses, rows processed and bytes sent
+    to the browser per figure and table.
+"""
+import cProfile
+import functools
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+
+import pandas as pd
+
+LOGGER = logging.getLogger('kc_dashboard.timing')
+
+## --- per thread state: Streamlit runs each session's script in its own thread
+_local = threading.local()
+
+
+def count_runs(func):
+    """
+        Count the executions of func in the current thread. Placed right
+        under @cache_data or @cache_resource, every execution is a cache miss.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _local.runs = getattr(_local, 'runs', 0) + 1
+        return func(*args, **kwargs)
+
+    wrapper.counts_runs = True
+    return wrapper
+
+
+def payload_bytes(obj):
+    """
+        Approximate size in bytes of what the browser receives for obj: a
+        DataFrame, a plotly Figure, a folium Map or a serialized figure.
+    """
+    if isinstance(obj, str):
+        return len(obj)
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if hasattr(obj, 'to_plotly_json'):
+        return len(obj.to_json())
+    if hasattr(obj, 'get_root'):
+        return len(obj.get_root().render())
+    return None
+
+
+def call_name(func):
+    ## --- functools.partial objects have no name of their own, and their repr shows their arguments in full
+    func = getattr(func, 'func', func)
+    return getattr(func, '__name__', None) or repr(func)
+
+
+def record_sent(kind, obj):
+    """
+        Record a payload sent to the browser without going through the
+        wrapped Streamlit functions, e.g. a cached serialized figure.
+    """
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is not None:
+        recorder.sent(kind, obj)
+
+
+def install_output_hooks():
+    """
+        Wrap st.dataframe and st.plotly_chart (on the page, the sidebar and
+        in columns) once per process, so that the recorder of the running
+        thread, if any, sees every table and figure sent.
+    """
+    import streamlit as st
+    from streamlit.delta_generator import DeltaGenerator
+
+    for name in ('dataframe', 'plotly_chart'):
+        original = getattr(DeltaGenerator, name)
+        if getattr(original, 'recorded', False):
+            continue
+
+        def hook(self, data=None, *args, _original=original, _name=name, **kwargs):
+            record_sent(_name, data)
+            return _original(self, data, *args, **kwargs)
+
+        hook.recorded = True
+        setattr(DeltaGenerator, name, functools.wraps(original)(hook))
+        setattr(st, name, getattr(st._main, name))
+
+
+class Recorder:
+    """
+        Collect the timings of one rerun. A disabled recorder only forwards
+        calls, so the dashboard code is the same whether timings are shown
+        or not.
+
+        Inputs: enabled: bool
+                Record timings, cache use and payload sizes.
+
+                profile: bool
+                Also run cProfile over the whole rerun.
+    """
+
+    def __init__(self, enabled=True, profile=False):
+        self.enabled = enabled
+        self.records = []
+        self.section_name, self.section_start = None, None
+        self.start = time.perf_counter()
+        self.profiler = None
+
+        if enabled:
+            install_output_hooks()
+            _local.recorder = self
+            if profile:
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+
+    def section(self, name):
+        """
+            Close the current section, if any, and start timing a new one.
+        """
+        if not self.enabled:
+            return
+        self._close_section()
+        self.section_name, self.section_start = name, time.perf_counter()
+
+    def _close_section(self):
+        if self.section_name is not None:
+            self.records.append({'kind': 'section', 'section': self.section_name, 'name': self.section_name,
+                                 'seconds': time.perf_counter() - self.section_start,
+                                 'cache': None, 'rows': None, 'bytes': None})
+            self.section_name = None
+
+    def call(self, func, *args, **kwargs):
+        """
+            Call func(*args, **kwargs), recording its wall time, whether it
+            was served from the cache and the number of rows of its first
+            argument.
+        """
+        if not self.enabled:
+            return func(*args, **kwargs)
+
+        return self._timed(self.section_name, func, args, kwargs)
+
+    def submit(self, func, *args, **kwargs):
+        """
+            Start func(*args, **kwargs) in a worker thread (see background.py),
+            recording it like call under the current section.
+
+            Returns: concurrent.futures.Future
+                     To be passed to wait.
+        """
+        import background
+
+        if not self.enabled:
+            future = background.submit(func, *args, **kwargs)
+        else:
+            future = background.submit(self._timed, self.section_name, func, args, kwargs)
+        future.call_name = call_name(func)
+
+        return future
+
+    def wait(self, future):
+        """
+            Return the result of a submitted call, recording how long the
+            rerun was blocked on it.
+        """
+        if not self.enabled:
+            return future.result()
+
+        start = time.perf_counter()
+        result = future.result()
+        self.records.append({'kind': 'wait', 'section': self.section_name, 'name': future.call_name,
+                             'seconds': time.perf_counter() - start, 'cache': None, 'rows': None, 'bytes': None})
+
+        return result
+
+    def _timed(self, section, func, args, kwargs):
+        ## --- runs are counted per thread, so this also holds in worker threads
+        runs = getattr(_local, 'runs', 0)
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+
+        cache = None
+        if getattr(func, 'counts_runs', False):
+            cache = 'miss' if getattr(_local, 'runs', 0) > runs else 'hit'
+
+        rows = len(args[0]) if args and isinstance(args[0], pd.DataFrame) else None
+        self.records.append({'kind': 'call', 'section': section, 'name': call_name(func), 'seconds': seconds,
+                             'cache': cache, 'rows': rows, 'bytes': None})
+
+        return result
+
+    def mark(self, name):
+        """
+            Record the time elapsed since the start of the rerun, e.g. when
+            the first content is sent.
+        """
+        if not self.enabled:
+            return
+        self.records.append({'kind': 'mark', 'section': self.section_name, 'name': name,
+                             'seconds': time.perf_counter() - self.start, 'cache': None, 'rows': None, 'bytes': None})
+
+    def sent(self, kind, obj):
+        """
+            Record the payload of a table, figure or map sent to the browser.
+        """
+        if not self.enabled:
+            return
+        self.records.append({'kind': kind, 'section': self.section_name, 'name': type(obj).__name__,
+                             'seconds': None, 'cache': None,
+                             'rows': len(obj) if isinstance(obj, pd.DataFrame) else None,
+                             'bytes': payload_bytes(obj)})
+
+    def finish(self):
+        """
+            Stop recording and log every record as one JSON line.
+
+            Returns: DataFrame or None
+                     The records of the rerun, None when disabled.
+        """
+        if not self.enabled:
+            return None
+
+        self._close_section()
+        if self.profiler is not None:
+            self.profiler.disable()
+        _local.recorder = None
+
+        self.records.append({'kind': 'rerun', 'section': None, 'name': 'total',
+                             'seconds': time.perf_counter() - self.start,
+                             'cache': None, 'rows': None, 'bytes': None})
+        for record in self.records:
+            LOGGER.info(json.dumps(record))
+
+        return pd.DataFrame(self.records)
+
+    def profile_text(self, limit=60):
+        """
+            Return the cProfile statistics of the rerun, sorted by cumulative
+            time, as text.
+        """
+        if self.profiler is None:
+            return ''
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
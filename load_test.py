@@ -0,0 +1,449 @@
+"""
+    Load test of the dashboard with many simultaneous sessions.
+
+    st_dashboard.py is served by a local headless Streamlit server, from a
+    fresh directory holding a copy of kc_house_data.csv, and each session is
+    a websocket client speaking the browser protocol: it asks for a rerun
+    with the states of the widgets, reads the page back until the script has
+    finished and moves on to the next step of its trace. Traces are
+    sequences of sidebar interactions (sliders, multiselects, radios and
+    checkboxes) with think times in between, drawn at random from a seed or
+    replayed from a JSON file.
+
+    For every number of sessions, the report gives the latency percentiles
+    of the first page load and of the interaction reruns, the bytes sent per
+    rerun, and the peak RSS and the CPU time of the server, per session.
+    RSS and CPU are read from /proc, so they are only reported on Linux.
+    Nothing is fetched from the network: the density map is drawn over the
+    local geodata/ store when there is one to link, over zipcode areas
+    approximated from the sales otherwise (see display_map_density).
+
+    Usage: python load_test.py [--sessions 1 10 50] [--steps 20] [--think 1.0]
+                               [--seed 0] [--traces traces.json] [--save-traces traces.json]
+                               [--output benchmarks/load_test.json] [--warm-figures]
+
+    Streamlit's AppTest would run the script in the test process and needs
+    Streamlit 1.28, while the dashboard is pinned to 1.3: the websocket
+    client works with both (/stream on 1.3, /_stcore/stream on later
+    versions) and measures a real server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(HERE, 'kc_house_data.csv')
+
+## --- sidebar widgets the traces act on, by label, and how often analysts touch them
+TRACE_WIDGETS = [('Select attributes', 'multiselect', 1),
+                 ('Select zipcodes to display', 'multiselect', 2),
+                 ('Select attributes to describe', 'multiselect', 2),
+                 ('Pick a percentile to show', 'radio', 1),
+                 ('Select attributes to plot distribution', 'multiselect', 2),
+                 ('Select one of the following options to display commercial plots:', 'radio', 1),
+                 ('Select year built range', 'slider', 3),
+                 ('Select date range', 'slider', 3),
+                 ('Select zip codes to display prices distribution', 'multiselect', 2),
+                 ('Select price range', 'slider', 3),
+                 ('Select one of the following options to display attributes plots:', 'radio', 1),
+                 ('Compare houses with their 10 nearest sales', 'checkbox', 1)]
+
+## --- latency percentiles reported
+PERCENTILES = (50, 90, 95, 99)
+
+
+def make_trace(rng, steps, think=1.0):
+    """
+        Draw a trace of steps interactions. Values are kept as fractions of
+        the range or of the options of the widget, so a trace does not
+        depend on the data it is replayed on.
+
+        Returns: list of dict
+                 widget (label), kind, value and think (seconds to wait
+                 before the step).
+    """
+    labels, kinds, weights = zip(*TRACE_WIDGETS)
+    trace = []
+    for _ in range(steps):
+        position = rng.choices(range(len(labels)), weights=weights)[0]
+        kind = kinds[position]
+        if kind == 'slider':
+            value = sorted(rng.random() for _ in range(2))
+        elif kind == 'multiselect':
+            value = [rng.random() for _ in range(rng.randint(0, 3))]
+        elif kind == 'radio':
+            value = rng.random()
+        else:
+            value = rng.random() < 0.5
+        trace.append({'widget': labels[position], 'kind': kind, 'value': value,
+                      'think': rng.expovariate(1. / think) if think > 0 else 0.})
+
+    return trace
+
+
+def widget_state(widget, kind, value):
+    """
+        Build the WidgetState a browser would send for a trace value.
+
+        Inputs: widget: protobuf message
+                The widget element as sent by the server.
+
+                kind: str
+                slider, multiselect, radio or checkbox.
+
+                value: see make_trace
+    """
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    state = WidgetState(id=widget.id)
+    if kind == 'slider':
+        ## --- on the grid of the slider steps, as dragging the handles would give
+        steps = max(int(round((widget.max - widget.min) / widget.step)), 1) if widget.step > 0 else 1000
+        values = [widget.min + round(fraction * steps) * (widget.max - widget.min) / steps for fraction in value]
+        state.double_array_value.data.extend(values[-len(widget.default):] if len(widget.default) == 1 else values)
+    elif kind == 'multiselect':
+        state.int_array_value.data.extend(sorted({int(fraction * len(widget.options)) for fraction in value}))
+    elif kind == 'radio':
+        state.int_value = int(value * len(widget.options))
+    else:
+        state.bool_value = bool(value)
+
+    return state
+
+
+class Session:
+    """
+        One browser session on the dashboard, replaying a trace.
+
+        Inputs: url: str
+                Websocket endpoint of the server.
+
+                trace: list of dict
+                See make_trace.
+
+                timeout: float
+                Seconds allowed for one rerun.
+    """
+
+    def __init__(self, url, trace, timeout=300.):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        self.url, self.trace, self.timeout = url, trace, timeout
+        self.records = []
+        self.widgets, self.states = {}, {}
+
+        ## --- report_finished up to Streamlit 1.3, script_finished later
+        self.finished = 'script_finished' if 'script_finished' in ForwardMsg.DESCRIPTOR.fields_by_name else 'report_finished'
+        self.finished_names = ForwardMsg.DESCRIPTOR.fields_by_name[self.finished].enum_type.values_by_number
+
+    async def run(self, start_delay=0.):
+        from tornado.websocket import websocket_connect
+
+        await asyncio.sleep(start_delay)
+        connection = await websocket_connect(self.url, max_message_size=512 * 1024 ** 2)
+        try:
+            await self.rerun(connection, 'load', None)
+            for step in self.trace:
+                await asyncio.sleep(step['think'])
+                widget = self.widgets.get(step['widget'])
+                if widget is None or widget[0] != step['kind']:
+                    ## --- not on the page in the current state, e.g. the date slider with one commercial option
+                    self.records.append({'kind': 'skipped', 'widget': step['widget']})
+                    continue
+                self.states[widget[1].id] = widget_state(widget[1], step['kind'], step['value'])
+                await self.rerun(connection, 'rerun', step['widget'])
+        finally:
+            connection.close()
+
+        return self.records
+
+    async def rerun(self, connection, kind, widget):
+        """
+            Ask for a rerun with the current widget states and read the page
+            until the script has finished, recording the latency.
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        ## --- states of widgets no longer on the page are dropped, as the browser does
+        message.rerun_script.widget_states.widgets.extend(state for state in self.states.values())
+
+        start = time.perf_counter()
+        await connection.write_message(message.SerializeToString(), binary=True)
+
+        widgets, received, errors, status = {}, 0, 0, None
+        try:
+            while True:
+                payload = await asyncio.wait_for(connection.read_message(), self.timeout)
+                if payload is None:
+                    status = 'closed'
+                    break
+                received += len(payload)
+                forward = ForwardMsg()
+                forward.ParseFromString(payload)
+                field = forward.WhichOneof('type')
+
+                if field == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                    element = forward.delta.new_element
+                    element_kind = element.WhichOneof('type')
+                    if element_kind in ('slider', 'multiselect', 'radio', 'checkbox'):
+                        widgets[getattr(element, element_kind).label] = (element_kind, getattr(element, element_kind))
+                    elif element_kind == 'exception':
+                        errors += 1
+                elif field == self.finished:
+                    status = self.finished_names[getattr(forward, field)].name
+                    if status != 'FINISHED_EARLY_FOR_RERUN':
+                        break
+        except asyncio.TimeoutError:
+            status = 'timeout'
+
+        self.widgets = widgets
+        current = {widget.id for _, widget in widgets.values()}
+        self.states = {widget_id: state for widget_id, state in self.states.items() if widget_id in current}
+
+        self.records.append({'kind': kind, 'widget': widget, 'seconds': time.perf_counter() - start,
+                             'bytes': received, 'errors': errors, 'status': status})
+
+
+class ProcessMonitor(threading.Thread):
+    """
+        Sample the RSS of a process in the background and read its CPU
+        time, from /proc. Values are None where /proc is not available.
+    """
+
+    def __init__(self, pid, interval=0.1):
+        super(ProcessMonitor, self).__init__(daemon=True)
+        self.pid, self.interval = pid, interval
+        self.peak_mb = 0.
+        self._stopped = threading.Event()
+
+    def rss_mb(self):
+        try:
+            with open('/proc/{}/status'.format(self.pid)) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024.
+        except OSError:
+            return None
+
+    def cpu_seconds(self):
+        try:
+            with open('/proc/{}/stat'.format(self.pid)) as f:
+                ## --- the command name may hold spaces, fields are counted after it
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError):
+            return None
+
+    def reset_peak(self):
+        self.peak_mb = self.rss_mb() or 0.
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            rss = self.rss_mb()
+            if rss is not None:
+                self.peak_mb = max(self.peak_mb, rss)
+
+    def stop(self):
+        self._stopped.set()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir, port, warm_figures=False):
+    """
+        Serve st_dashboard.py from workdir, where the data file is a copy of
+        kc_house_data.csv and geodata links to the repository's store.
+
+        Returns: (subprocess.Popen, str)
+                 The server process and the websocket url.
+    """
+    shutil.copy(SOURCE, os.path.join(workdir, 'kc_house_data.csv'))
+    if os.path.isdir(os.path.join(HERE, 'geodata')):
+        os.symlink(os.path.join(HERE, 'geodata'), os.path.join(workdir, 'geodata'))
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([HERE, os.environ.get('PYTHONPATH', '')]))
+    if warm_figures:
+        subprocess.run([sys.executable, os.path.join(HERE, 'warm_figures.py')], cwd=workdir, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+    server = subprocess.Popen([sys.executable, '-m', 'streamlit', 'run', os.path.join(HERE, 'st_dashboard.py'),
+                               '--server.headless', 'true', '--server.port', str(port),
+                               '--server.address', '127.0.0.1', '--server.runOnSave', 'false',
+                               '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false',
+                               '--global.developmentMode', 'false'],
+                              cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    ## --- /healthz and /stream up to Streamlit 1.3, under /_stcore later
+    deadline = time.monotonic() + 60.
+    while time.monotonic() < deadline:
+        for health, stream in (('_stcore/health', '_stcore/stream'), ('healthz', 'stream')):
+            try:
+                with urllib.request.urlopen('http://127.0.0.1:{}/{}'.format(port, health), timeout=1.) as response:
+                    if response.status == 200:
+                        return (server, 'ws://127.0.0.1:{}/{}'.format(port, stream))
+            except OSError:
+                pass
+        if server.poll() is not None:
+            break
+        time.sleep(0.2)
+
+    server.kill()
+    raise RuntimeError('The Streamlit server did not start.')
+
+
+async def run_sessions(url, traces, timeout):
+    ## --- analysts do not all arrive at the same instant: starts are spread over the first think time
+    sessions = [Session(url, trace, timeout) for trace in traces]
+    delays = [trace[0]['think'] if trace else 0. for trace in traces]
+    results = await asyncio.gather(*(session.run(delay) for session, delay in zip(sessions, delays)),
+                                   return_exceptions=True)
+
+    records = []
+    for result in results:
+        if isinstance(result, Exception):
+            records.append({'kind': 'failed', 'error': '{}: {}'.format(type(result).__name__, result)})
+        else:
+            records.extend(result)
+
+    return records
+
+
+def latency_stats(seconds):
+    if not seconds:
+        return None
+    stats = {'p{}'.format(p): float(np.percentile(seconds, p)) for p in PERCENTILES}
+    stats.update({'mean': float(np.mean(seconds)), 'max': float(np.max(seconds)), 'count': len(seconds)})
+
+    return stats
+
+
+def run_level(url, monitor, traces, timeout):
+    """
+        Run one session per trace at the same time.
+
+        Returns: dict
+                 Latencies of loads and reruns, bytes, failures, and RSS and
+                 CPU of the server, in total and per session.
+    """
+    sessions = len(traces)
+    idle_mb = monitor.rss_mb()
+    monitor.reset_peak()
+    cpu_start, start = monitor.cpu_seconds(), time.perf_counter()
+
+    records = asyncio.run(run_sessions(url, traces, timeout))
+
+    wall = time.perf_counter() - start
+    cpu_end = monitor.cpu_seconds()
+    cpu = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+    runs = [record for record in records if record['kind'] in ('load', 'rerun')]
+
+    return {'sessions': sessions, 'wall_seconds': wall,
+            'load': latency_stats([r['seconds'] for r in runs if r['kind'] == 'load']),
+            'rerun': latency_stats([r['seconds'] for r in runs if r['kind'] == 'rerun']),
+            'reruns_per_second': len(runs) / wall if wall > 0 else None,
+            'kb_per_rerun': float(np.mean([r['bytes'] for r in runs])) / 1024. if runs else None,
+            'skipped_steps': sum(r['kind'] == 'skipped' for r in records),
+            'script_errors': sum(r['errors'] for r in runs),
+            'unfinished_runs': sum(r['status'] not in ('FINISHED_SUCCESSFULLY',) for r in runs),
+            'failed_sessions': [r['error'] for r in records if r['kind'] == 'failed'],
+            'idle_rss_mb': idle_mb, 'peak_rss_mb': monitor.peak_mb if idle_mb is not None else None,
+            'rss_mb_per_session': (monitor.peak_mb - idle_mb) / sessions if idle_mb is not None else None,
+            'cpu_seconds': cpu, 'cpu_seconds_per_session': cpu / sessions if cpu is not None else None,
+            'cpu_utilization': cpu / wall if cpu is not None and wall > 0 else None}
+
+
+def print_level(result):
+    fmt = lambda value, spec='{:.3f}': spec.format(value) if value is not None else '-'
+    rerun, load = result['rerun'] or {}, result['load'] or {}
+    print('{:>4} sessions  load p50 {} s  rerun p50 {} p90 {} p99 {} max {} s  {} reruns/s  {} KB/rerun'.format(
+        result['sessions'], fmt(load.get('p50')), fmt(rerun.get('p50')), fmt(rerun.get('p90')),
+        fmt(rerun.get('p99')), fmt(rerun.get('max')), fmt(result['reruns_per_second'], '{:.1f}'),
+        fmt(result['kb_per_rerun'], '{:.0f}')))
+    print('{:>4} sessions  server RSS {} MB peak, {} MB/session  CPU {} s, {} s/session ({} busy)  '
+          'errors {}  unfinished {}  failed sessions {}'.format(
+              result['sessions'], fmt(result['peak_rss_mb'], '{:.0f}'), fmt(result['rss_mb_per_session'], '{:.1f}'),
+              fmt(result['cpu_seconds'], '{:.1f}'), fmt(result['cpu_seconds_per_session'], '{:.2f}'),
+              fmt(result['cpu_utilization'], '{:.0%}'), result['script_errors'], result['unfinished_runs'],
+              len(result['failed_sessions'])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the dashboard with simultaneous sessions.')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 50], help='numbers of simultaneous sessions')
+    parser.add_argument('--steps', type=int, default=20, help='interactions per session')
+    parser.add_argument('--think', type=float, default=1.0, help='mean think time between interactions, in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random traces')
+    parser.add_argument('--traces', help='replay the traces of this JSON file, reused when there are more sessions')
+    parser.add_argument('--save-traces', help='write the traces of the run to this JSON file')
+    parser.add_argument('--timeout', type=float, default=300., help='seconds allowed for one rerun')
+    parser.add_argument('--warm-figures', action='store_true', help='run warm_figures.py before starting the server')
+    parser.add_argument('--output', default=os.path.join(HERE, 'benchmarks', 'load_test.json'))
+    args = parser.parse_args(argv)
+
+    if args.traces:
+        with open(args.traces) as f:
+            traces = json.load(f)
+    else:
+        rng = random.Random(args.seed)
+        traces = [make_trace(rng, args.steps, args.think) for _ in range(max(args.sessions))]
+    if args.save_traces:
+        with open(args.save_traces, 'w') as f:
+            json.dump(traces, f, indent=1)
+
+    workdir = tempfile.mkdtemp(prefix='kc_load_')
+    server = None
+    try:
+        server, url = start_server(workdir, free_port(), args.warm_figures)
+        monitor = ProcessMonitor(server.pid)
+        monitor.start()
+
+        ## --- one session first, so the levels measure a warm server rather than the first load of the data
+        warmup = run_level(url, monitor, [[]], args.timeout)
+        print('warm-up load {:.2f} s, server RSS {} MB'.format(warmup['load']['max'] if warmup['load'] else float('nan'),
+                                                               '{:.0f}'.format(monitor.rss_mb()) if monitor.rss_mb() else '-'))
+
+        levels = []
+        for sessions in args.sessions:
+            level = run_level(url, monitor, [traces[i % len(traces)] for i in range(sessions)], args.timeout)
+            print_level(level)
+            levels.append(level)
+        monitor.stop()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    import streamlit
+    results = {'meta': {'python': sys.version.split()[0], 'streamlit': streamlit.__version__,
+                        'cpus': os.cpu_count(), 'steps': args.steps, 'think': args.think, 'seed': args.seed,
+                        'date': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'warmup': warmup, 'levels': levels}
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    return 1 if any(level['failed_sessions'] or level['unfinished_runs'] for level in levels) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+    Folium maps of the dashboard and the store of zipcode boundaries, the
+    only users of geopandas and folium.
+"""
+import geopandas
+import streamlit as st
+import streamlit.components.v1 as components
+import pandas    as pd
+import numpy     as np
+import folium
+import functools
+import glob
+import json
+import os
+import time
+
+from folium.plugins   import MarkerCluster
+from branca.element   import MacroElement
+from jinja2           import Template
+from instrumentation  import count_runs
+from caching          import cache_figure, cache_resource
+from my_methods       import cube_means, file_digest
+
+
+## --- local store of the King County zipcode boundaries. GEO_SOURCE is not in the repository yet: until it is
+## --- downloaded with fetch_geo_source and committed, the density map falls back to approximate_zipcodes
+GEO_DIR = 'geodata'
+GEO_SOURCE = os.path.join(GEO_DIR, 'kc_zipcodes.geojson')
+GEO_URL = 'https://opendata.arcgis.com/datasets/83fc2e72903343aabff6de8cb445b81c_2.geojson'
+
+
+## --- size of the maps on the page, the defaults of streamlit_folium.folium_static
+MAP_WIDTH, MAP_HEIGHT = 700, 500
+
+
+## --- simplification tolerances in degrees precomputed by the store, 0 is full resolution
+GEO_TOLERANCES = (0., 0.0001, 0.0005, 0.002)
+
+
+def geo_tolerance(zoom):
+    """
+        Return the coarsest stored tolerance smaller than one screen pixel
+        at the given map zoom level.
+    """
+    pixel = 360. / (256. * 2 ** zoom)
+
+    return max(tol for tol in GEO_TOLERANCES if tol <= pixel)
+
+
+def bounds_zoom(lat, long, width=MAP_WIDTH, height=MAP_HEIGHT):
+    """
+        Return the largest zoom level at which points spanning lat and long
+        fit in a web mercator map of width x height pixels.
+    """
+    mercator = lambda la: np.log(np.tan(np.pi / 4. + np.radians(la) / 2.))
+    lat, long = np.asarray(lat, dtype=np.float64), np.asarray(long, dtype=np.float64)
+
+    ## --- fraction of the world width spanned by the points along each axis
+    span_x = (long.max() - long.min()) / 360.
+    span_y = (mercator(lat.max()) - mercator(lat.min())) / (2. * np.pi)
+
+    zooms = [np.log2(pixels / (256. * span)) for pixels, span in ((width, span_x), (height, span_y)) if span > 0]
+
+    return int(np.clip(np.floor(min(zooms)), 0, 18)) if zooms else 18
+
+
+def build_geo_store(source=GEO_SOURCE, geo_dir=GEO_DIR):
+    """
+        Simplify the zipcode boundaries at every level of GEO_TOLERANCES and
+        write them to geo_dir as Feather files (geometries as WKB), keyed by
+        the content hash of the source file.
+
+        Returns: dict
+                 tolerance -> path of the stored level.
+    """
+    key = file_digest(source)[:16]
+    paths = {tol: os.path.join(geo_dir, 'zipcodes-{}-{}.feather'.format(key, tol)) for tol in GEO_TOLERANCES}
+
+    if not all(os.path.exists(path) for path in paths.values()):
+        geofile = geopandas.read_file(source)[['ZIP', 'geometry']]
+
+        for old_path in glob.glob(os.path.join(geo_dir, 'zipcodes-*.feather')):
+            os.remove(old_path)
+
+        for tol, path in paths.items():
+            level = geofile.copy()
+            if tol > 0:
+                level['geometry'] = level.simplify(tol, preserve_topology=True)
+            level.to_feather(path)
+
+    return paths
+
+
+def fetch_geo_source(url=GEO_URL, source=GEO_SOURCE):
+    """
+        Download the zipcode boundaries to the local source file, to be
+        committed with the dashboard. The dashboard itself never downloads
+        them, see get_geofile.
+    """
+    geofile = geopandas.read_file(url)[['ZIP', 'geometry']]
+    os.makedirs(os.path.dirname(source), exist_ok=True)
+    geofile.to_file(source, driver='GeoJSON')
+
+    return source
+
+
+@functools.lru_cache(maxsize=8)
+def source_digest(source, size, mtime_ns):
+    return file_digest(source)[:16]
+
+
+def boundaries_version(source=GEO_SOURCE):
+    """
+        Return the version of the zipcode boundaries the density map is
+        drawn over: the content hash of the local source file, or
+        'approximate' when there is none (see approximate_zipcodes).
+    """
+    try:
+        info = os.stat(source)
+    except OSError:
+        return 'approximate'
+
+    return source_digest(source, info.st_size, info.st_mtime_ns)
+
+
+@cache_resource
+@count_runs
+def get_geofile(tolerance=0., source=GEO_SOURCE):
+    """
+        Read the zipcode boundaries simplified at the given tolerance (one of
+        GEO_TOLERANCES) from the local store, built on first use from the
+        local source file. Nothing is downloaded: without the source file,
+        the check is 0 (and the failure is not cached).
+
+        Returns: (GeoDataFrame, check)
+    """
+    if not os.path.exists(source):
+        return (None, 0)
+
+    try:
+        paths = build_geo_store(source, os.path.dirname(source))
+        return (geopandas.read_feather(paths[tolerance]), 1)
+    except:
+        st.write('No zipcode boundaries could be read.')
+        return (None, 0)
+
+
+def approximate_zipcodes(data):
+    """
+        Approximate the area of each zipcode by the convex hull of the
+        locations of its sales, for the density map when the boundaries
+        are not available.
+
+        Returns: GeoDataFrame
+                 ZIP and geometry, like the boundaries of get_geofile.
+    """
+    points = geopandas.GeoDataFrame({'ZIP': np.asarray(data['zipcode'], dtype=np.int64)},
+                                    geometry=geopandas.points_from_xy(data['long'], data['lat']), crs='EPSG:4326')
+    hulls = points.dissolve(by='ZIP').convex_hull
+
+    return geopandas.GeoDataFrame({'ZIP': hulls.index.values}, geometry=hulls.values, crs='EPSG:4326')
+
+
+## --- zoom levels the markers map is clustered for, and cluster size in screen pixels
+CLUSTER_ZOOMS = range(8, 14)
+CLUSTER_PIXELS = 60
+
+
+def cluster_points(lat, long, price, zoom, pixels=CLUSTER_PIXELS):
+    """
+        Group points falling in the same pixels x pixels square of the web
+        mercator map at a given zoom level, the way a client-side marker
+        cluster would.
+
+        Returns: numpy array
+                 One [lat, long, count, average price] row per cluster,
+                 located at the mean position of its points.
+    """
+    world = 256. * 2 ** zoom
+    sin_lat = np.sin(np.radians(lat))
+    x = (np.asarray(long) + 180.) / 360. * world
+    y = (0.5 - np.log((1. + sin_lat) / (1. - sin_lat)) / (4. * np.pi)) * world
+
+    cells = np.floor(x / pixels).astype(np.int64) * (int(world) // pixels + 1) + np.floor(y / pixels).astype(np.int64)
+    _, members = np.unique(cells, return_inverse=True)
+
+    count = np.bincount(members)
+    return np.column_stack([np.bincount(members, weights=lat) / count,
+                            np.bincount(members, weights=long) / count,
+                            count,
+                            np.bincount(members, weights=price) / count])
+
+
+class ClusterLayer(MacroElement):
+    """
+        Folium element drawing pre-computed clusters, picking the level of
+        the current zoom (clamped to the computed levels) on every zoom change.
+
+        Inputs: levels: dict
+                zoom level -> list of [lat, long, count, average price].
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var levels = {{ this.levels|tojson }};
+            var layer = L.layerGroup().addTo(map);
+            function draw() {
+                var zoom = Math.min(Math.max(map.getZoom(), {{ this.min_zoom }}), {{ this.max_zoom }});
+                layer.clearLayers();
+                levels[zoom].forEach(function(c) {
+                    L.circleMarker([c[0], c[1]], {radius: 5 + 3 * Math.log10(c[2]), weight: 1, fillOpacity: 0.6})
+                     .bindTooltip(c[2] + (c[2] > 1 ? ' houses, average price ' : ' house, price ') + c[3] + ' USD')
+                     .addTo(layer);
+                });
+            }
+            map.on('zoomend', draw);
+            draw();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, levels):
+        super(ClusterLayer, self).__init__()
+        self._name = 'ClusterLayer'
+        self.levels = levels
+        self.min_zoom = min(levels)
+        self.max_zoom = max(levels)
+
+
+@cache_resource
+@count_runs
+def display_map_markers(data, mode='cluster'):
+    """
+        Build the house markers map.
+
+        Inputs: data: pandas DataFrame
+                The cleaned dataset.
+
+                mode: str, optional
+                'cluster' (default) clusters all houses on the server for each
+                zoom level in CLUSTER_ZOOMS, so the page size depends on the
+                covered area rather than on the number of houses. 'markers'
+                draws one folium Marker per house, limited to the first 500.
+
+        Returns: (folium Map, dict)
+                 The map and its build stats: houses, markers, payload size
+                 in KB and build time in seconds.
+    """
+    start = time.perf_counter()
+
+    if mode == 'cluster':
+        b_map = folium.Map(location=[data['lat'].mean(), data['long'].mean()], zoom_start=10)
+
+        lat, long, price = (np.asarray(data[col], dtype=np.float64) for col in ('lat', 'long', 'price'))
+        levels = {zoom: [[round(la, 5), round(lo, 5), int(n), int(p)] for la, lo, n, p in
+                         cluster_points(lat, long, price, zoom)] for zoom in CLUSTER_ZOOMS}
+        ClusterLayer(levels).add_to(b_map)
+
+        markers = sum(len(level) for level in levels.values())
+        payload = len(json.dumps(levels))
+    else:
+        data = data.head(500)
+
+        b_map = folium.Map(location=[data['lat'].mean(), data['long'].mean()], default_zoom_start=15)
+        marker_cluster = MarkerCluster().add_to(b_map)
+
+        for name, row in data.iterrows():
+            folium.Marker([row['lat'], row['long']],
+                          popup='Sold {0} USD on: {1:%Y-%m-%d}. Features: {2} sqft, {3} bedrooms, {4} bathrooms, year built: {5}'.format(
+                              row['price'], row['date'], row['sqft_living'], row['bedrooms'], row['bathrooms'],
+                              row['yr_built'])).add_to(marker_cluster)
+
+        markers = len(data)
+        payload = len(b_map.get_root().render())
+
+    stats = {'houses': len(data), 'markers': markers, 'payload_kb': payload / 1024.,
+             'build_seconds': time.perf_counter() - start}
+
+    return (b_map, stats)
+
+
+@cache_resource
+@count_runs
+def display_map_density(data, cube, zoom=None, boundaries=None):
+    """
+        Build the prices density map over the zipcode boundaries, fitted to
+        the extent of the sales. Until the boundaries are added to GEO_DIR
+        (see fetch_geo_source), it is drawn over zipcode areas approximated
+        from the sales (approximate_zipcodes), as the legend then says.
+
+        Inputs: zoom: int, optional
+                Zoom level the boundaries are simplified for, by default
+                the one the map opens at (bounds_zoom).
+
+                boundaries: str, optional
+                Version of the boundaries (see boundaries_version), only
+                used to key the cache.
+    """
+    df_map = pd.DataFrame({'Zipcode': cube.index.values, 'Price': cube_means(cube)['price'].values})
+    legend = 'Average Price'
+
+    bounds = [[float(data['lat'].min()), float(data['long'].min())], [float(data['lat'].max()), float(data['long'].max())]]
+    if zoom is None:
+        zoom = bounds_zoom(data['lat'], data['long'])
+
+    ## --- boundaries simplified to the detail visible at the map zoom
+    geodata, mute = get_geofile(geo_tolerance(zoom))
+    if mute == 0:
+        geodata = approximate_zipcodes(data)
+        legend = 'Average Price (zipcode areas approximated from the sales)'
+
+    geodata = geodata[geodata['ZIP'].isin(df_map['Zipcode'].tolist())]
+
+    b_map = folium.Map(location=[(bounds[0][0] + bounds[1][0]) / 2., (bounds[0][1] + bounds[1][1]) / 2.],
+                       zoom_start=zoom)
+    folium.Choropleth(data=df_map, geo_data=geodata, columns=['Zipcode', 'Price'], key_on='feature.properties.ZIP',
+                      fill_color='YlOrRd', fill_opacity=0.7, line_opacity=0.2, legend_name=legend).add_to(b_map)
+    b_map.fit_bounds(bounds)
+
+    return b_map
+
+
+def map_html(b_map):
+    """
+        Render a folium map to the HTML page folium_static would send.
+
+        Returns: str
+    """
+    return folium.Figure().add_child(b_map).render()
+
+
+@cache_figure
+@count_runs
+def markers_map_html(data):
+    """
+        Page of the house markers map, see display_map_markers.
+
+        Returns: (str, dict)
+                 The HTML page and the build stats of the map.
+    """
+    b_map, stats = display_map_markers(data)
+
+    return (map_html(b_map), stats)
+
+
+def density_map_html(data, cube):
+    """
+        Page of the prices density map, see display_map_density, cached by
+        the version of the zipcode boundaries too, so a page drawn over
+        approximate areas is not served once the boundaries are added.
+    """
+    return density_page(data, cube, boundaries_version())
+
+
+@cache_figure
+@count_runs
+def density_page(data, cube, boundaries):
+    return map_html(display_map_density(data, cube, boundaries=boundaries))
+
+
+def show_map(html, container):
+    """
+        Draw a page rendered by map_html in a Streamlit container.
+    """
+    with container:
+        components.html(html, height=MAP_HEIGHT + 10, width=MAP_WIDTH)
@@ -1,16 +1,36 @@
-import geopandas
-import streamlit as st
 import pandas    as pd
 import numpy     as np
-import plotly.express as px
-import folium
-import sys
-
+import pyarrow         as pa
+import pyarrow.feather as feather
+import hashlib
+import glob
+import os
+import time
+
+from dataclasses import dataclass
 from datetime import date
-from streamlit_folium import folium_static
-from folium.plugins   import MarkerCluster
+from spatial_index    import SpatialIndex
+from range_index      import SortedIndex
+from instrumentation  import count_runs
+from caching          import cache_data, cache_resource, register_fingerprint, registered_fingerprint
+from sketches         import build_sketches, describe_sketches, load_sketches, save_sketches
+from sell_timing      import TimingIndex
+from sale_history     import RepeatSalesIndex, SaleHistory, arrange_sales
+
+## --- figures and maps live in my_plots.py and my_maps.py: loading and aggregating data never imports plotly or the geo stack
+
+
+def show_message(message):
+    """
+        Write a message on the dashboard, importing Streamlit only when a
+        function below fails.
+    """
+    import streamlit as st
+    st.write(message)
+
 
-@st.cache(allow_output_mutation=True)
+@cache_data
+@count_runs
 def get_data(path):
     """
         Read a comma-separated values (csv) file into a DataFrame.
@@ -28,11 +48,10 @@ def get_data(path):
         data = pd.read_csv(path)
         return (data, 1)
     except:
-        st.write('No data could be read.')
+        show_message('No data could be read.')
         return (0, 0)
 
 
-@st.cache(allow_output_mutation=True)
 def get_season(dt):
     ## --- 1: Winter, 2: Spring, 3: Summer, 4: Autumn
     Y = 2000  # dummy leap year to allow input X-02-29 (leap day)
@@ -45,14 +64,6 @@ def get_season(dt):
     return next(season for season, (start, end) in seasons if start <= dt <= end)
 
 
-@st.cache(allow_output_mutation=True)
-def get_geofile(url):
-    geofile = geopandas.read_file(url)
-
-    return geofile
-
-
-@st.cache(allow_output_mutation=True, suppress_st_warning=True)
 def check_integers(data, features=None):
     """
         Convert type of selected features of a pandas DataFrame to integer.
@@ -67,9 +78,11 @@ def check_integers(data, features=None):
                 will be applied. If None, then all features will become integer.
 
         Returns: (pandas DataFrame, check)
+                 A converted copy of data, the input is left unchanged.
     """
 
     if isinstance(data, pd.DataFrame):
+        data = data.copy()
         if features == None:
             if_data = data.select_dtypes(include=['int64', 'float64']).astype(int)
             data.loc[:, if_data.columns] = if_data
@@ -81,11 +94,10 @@ def check_integers(data, features=None):
 
 
     else:
-        st.write('Invalid data format for input data. It should be an instance of pandas DataFrame. ')
+        show_message('Invalid data format for input data. It should be an instance of pandas DataFrame. ')
         return (data, 0)
 
 
-@st.cache(allow_output_mutation=True)
 def to_str_fromdt(arg):
     """
         Convert arg to datetime object and then transforms it into
@@ -100,11 +112,10 @@ def to_str_fromdt(arg):
     try:
         return pd.to_datetime(arg).dt.strftime('%Y-%m-%d')
     except:
-        st.write('No date object transformed.')
+        show_message('No date object transformed.')
         return arg
 
 
-@st.cache(allow_output_mutation=True)
 def hand_nonunique(data, feat='id'):
     """
         Return DataFrame with duplicate rows removed by keeping
@@ -124,316 +135,1093 @@ def hand_nonunique(data, feat='id'):
     try:
         return data.drop_duplicates(subset=feat, keep='last')
     except:
-        st.write('No duplicate values were removed.\n\n')
+        show_message('No duplicate values were removed.\n\n')
         return data
 
 
-@st.cache(allow_output_mutation=True, suppress_st_warning=True)
-def display_data_overview(data, attributes):
-    if attributes == []:
-        return data
-    else:
-        to_show = list(attributes)
-        to_show.append('id')
-        return data[to_show[::-1]]
+## --- season label for each month of the year (index 0 is unused)
+SEASON_BY_MONTH = np.array(['', 'Win', 'Win', 'Spr', 'Spr', 'Spr', 'Sum',
+                            'Sum', 'Sum', 'Aut', 'Aut', 'Aut', 'Win'], dtype=object)
 
 
-# return None
+def build_features(data):
+    """
+        Derive the engineered features used across the dashboard with
+        vectorized operations: date, month, year, season, price_sqft, old
+        and to_renovate. Meteorological seasons start on the first day of
+        a month, so the season is looked up from the month number.
 
-@st.cache(allow_output_mutation=True, suppress_st_warning=True)
-def display_data_averaged(data, zipcodes):
-    try:
-        dcount = data[['id', 'zipcode']].groupby('zipcode').count()
-        dprice = data[['price', 'zipcode']].groupby('zipcode').mean()
-        dsqft = data[['sqft_living', 'zipcode']].groupby('zipcode').mean()
-        dppsf = data[['price_sqft', 'zipcode']].groupby('zipcode').mean().reset_index()
+        Inputs: data: pandas DataFrame
+                A data frame with at least the date, price, sqft_living,
+                yr_built and yr_renovated columns, as read from the csv file.
 
-        m1 = pd.merge(dcount, dprice, on='zipcode', how='inner')
-        m2 = pd.merge(m1, dsqft, on='zipcode', how='inner')
-        data = pd.merge(m2, dppsf, on='zipcode', how='inner')
+        Returns: DataFrame
+                 A copy of data with the engineered columns added.
+    """
+    data = data.copy()
+    dates = pd.to_datetime(data['date'])
 
-        data.columns = ['Zipcode', 'Total Houses', 'Price', 'Sqft Living', 'Price/Sqft']
+    data['date'] = dates.dt.normalize()
+    data['month'] = dates.dt.month.astype(np.int64)
+    data['year'] = dates.dt.year.astype(np.int64)
+    data['season'] = SEASON_BY_MONTH[data['month'].values]
 
-        if zipcodes == []:
-            return (data, 195)
-        else:
-            return (data[data['Zipcode'].isin(f_zipcode)], None)
+    data['price_sqft'] = data['price'] / data['sqft_living']
+
+    data['old'] = np.where(data['yr_built'].values < 1960, 1, 0).astype(np.int64)
+
+    yr_renovated = data['yr_renovated'].values
+    data['to_renovate'] = np.where(yr_renovated != 0, yr_renovated - data['yr_built'].values, np.nan)
+
+    return data
+
+
+## --- bump whenever clean_data or CACHE_SCHEMA change, so stale cache files are rebuilt
+PIPELINE_VERSION = 4
+
+
+## --- dtypes used to parse the raw csv file without type inference
+CSV_DTYPES = {'id': 'int64', 'date': 'str', 'price': 'float64', 'bedrooms': 'int64', 'bathrooms': 'float64',
+              'sqft_living': 'int64', 'sqft_lot': 'int64', 'floors': 'float64', 'waterfront': 'int64',
+              'view': 'int64', 'condition': 'int64', 'grade': 'int64', 'sqft_above': 'int64',
+              'sqft_basement': 'int64', 'yr_built': 'int64', 'yr_renovated': 'int64', 'zipcode': 'int64',
+              'lat': 'float64', 'long': 'float64', 'sqft_living15': 'int64', 'sqft_lot15': 'int64'}
+
+
+## --- narrowest dtypes of the cleaned dataset, in memory and in the Feather cache
+CACHE_SCHEMA = {'id': 'int64', 'date': 'datetime64[ns]', 'price': 'float64', 'bedrooms': 'int8', 'bathrooms': 'int8',
+                'sqft_living': 'int32', 'sqft_lot': 'int32', 'floors': 'int8', 'waterfront': 'int8',
+                'view': 'int8', 'condition': 'int8', 'grade': 'int8', 'sqft_above': 'int32',
+                'sqft_basement': 'int32', 'yr_built': 'int16', 'yr_renovated': 'int16', 'zipcode': 'category',
+                'lat': 'float32', 'long': 'float32', 'sqft_living15': 'int32', 'sqft_lot15': 'int32',
+                'month': 'int8', 'year': 'int16', 'season': 'category', 'price_sqft': 'float32',
+                'old': 'int8', 'to_renovate': 'float32'}
+
+
+## --- attributes left out of descriptive statistics and distribution plots
+NON_DESCRIPTIVE = ['id', 'lat', 'long', 'zipcode', 'yr_renovated', 'waterfront', 'view']
+
+
+def apply_schema(data, schema=CACHE_SCHEMA):
+    """
+        Cast the columns of data to the dtypes of schema, checking first that
+        values cast to integers are whole numbers fitting in their narrower
+        type, since astype would truncate or wrap them around silently.
+
+        Inputs: data: pandas DataFrame
+                The cleaned dataset, or a batch of cleaned rows.
+
+                schema: dict, optional
+                Column label to dtype, by default CACHE_SCHEMA. Columns of
+                data not in schema keep their dtype.
+
+        Returns: DataFrame
+                 A copy of data with the narrow dtypes.
+    """
+    schema = {col: dtype for col, dtype in schema.items() if col in data}
+
+    for col, dtype in schema.items():
+        if dtype in ('category', 'datetime64[ns]') or np.dtype(dtype).kind != 'i' or data.empty:
+            continue
+        values = np.asarray(data[col])
+        if values.dtype.kind == 'f' and np.any(np.mod(values, 1) != 0):
+            raise ValueError('{} values are not whole numbers, they do not fit in {}.'.format(col, dtype))
+        limits = np.iinfo(dtype)
+        if values.min() < limits.min or values.max() > limits.max:
+            raise ValueError('{} values do not fit in {}.'.format(col, dtype))
+
+    return data.astype(schema)
+
+
+def descriptive_attributes(data):
+    """
+        Return the numerical attributes of data worth describing, i.e. all
+        numerical columns but identifiers, coordinates and flags.
+    """
+    return data.select_dtypes(include='number').columns.drop(NON_DESCRIPTIVE, errors='ignore')
+
+
+def clean_data(data, keep_history=False):
+    """
+        Run the whole cleaning pipeline over raw data: duplicates removal,
+        integer coercion and feature engineering.
+
+        Inputs: data: pandas DataFrame
+                Raw data as read from the csv file.
+
+                keep_history: bool, optional
+                Keep every sale of the ids sold more than once, in file
+                order, instead of their latest sale only.
+
+        Returns: (DataFrame, check)
+    """
+    if not keep_history:
+        data = hand_nonunique(data, 'id')
+
+    data, mute = check_integers(data, ['bedrooms', 'bathrooms', 'floors', 'yr_built', 'yr_renovated', 'zipcode'])
+    if mute == 0:
+        return (data, 0)
+
+    return (build_features(data), 1)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+        Return the sha256 hex digest of the file content at path, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def source_key(path):
+    """
+        Name the cache files of a csv file after its stem and a hash of its
+        absolute path, so files sharing a name in different folders, e.g.
+        the exports of several counties, never share cache files.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return '{}-{}'.format(stem, hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:12])
+
+
+## --- schema metadata key of the Feather cache holding the number of properties
+LATEST_KEY = b'kc_latest_sales'
+
+
+@cache_resource
+@count_runs
+def load_sales(path, cache_dir='.cache'):
+    """
+        Load every sale of the cleaned and feature-engineered dataset as a
+        SaleHistory, repeat sales of a house included. The first call for a
+        csv file (by absolute path, see source_key) and content parses it,
+        runs clean_data and writes the sales,
+        arranged by arrange_sales, to an uncompressed Feather file with the
+        dtypes of CACHE_SCHEMA. Later calls, also across restarts, memory-map
+        that file instead of parsing the csv again. Numerical columns are not
+        copied out of the mapped file, so they are read-only and their pages
+        are shared by every process serving the dashboard.
+
+        Inputs: path: str
+                Path to the raw csv file.
+
+                cache_dir: str, optional
+                Directory holding the Feather files, by default .cache
+
+        Returns: (SaleHistory, check)
+    """
+    try:
+        source = source_key(path)
+        key = '{}-{}-v{}'.format(source, file_digest(path)[:16], PIPELINE_VERSION)
+        cache_path = os.path.join(cache_dir, key + '.feather')
+
+        if os.path.exists(cache_path):
+            return (read_sales(cache_path, key), 1)
+
+        data = pd.read_csv(path, dtype=CSV_DTYPES)
     except:
-        st.write('Streamlit is unable to display averaged data by zipcodes.')
+        show_message('No data could be read.')
+        return (0, 0)
 
+    data, mute = clean_data(data, keep_history=True)
+    if mute == 0:
+        return (data, 0)
 
-@st.cache(allow_output_mutation=True, suppress_st_warning=True)
-def display_descriptive(data, atts, percts):
-    num_attributes = data.select_dtypes(include=['int64', 'float64'])
-    desc = num_attributes.drop(['id', 'lat', 'long', 'zipcode', 'yr_renovated', 'waterfront', 'view'], axis=1)
+    try:
+        sales, n_latest = arrange_sales(data)
+        sales = apply_schema(sales)
+    except ValueError as error:
+        show_message('The data does not fit the dataset schema: {}'.format(error))
+        return (data, 0)
 
-    desc = desc.describe(percentiles=[percts])
-    desc = desc.rename(
-        index={'count': '# entries', 'mean': 'Mean', 'std': 'Std Dev', 'min': 'Min', '50%': 'Median', 'max': 'Max'})
+    ## --- write atomically through a file of this process, then drop files cached for older contents or versions of the same source
+    table = pa.Table.from_pandas(sales, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, LATEST_KEY: str(n_latest).encode()})
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, cache_path)
 
-    if atts == []:
-        return (desc, 205)
+    for old_path in glob.glob(os.path.join(cache_dir, glob.escape(source) + '-*')):
+        name = os.path.basename(old_path)
+        if not name.startswith(key + '.') and not name.endswith('.tmp'):
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    ## --- serve the mapped file from the first call on, like the later ones
+    return (read_sales(cache_path, key), 1)
+
+
+## --- dataset version key -> Feather file it was read from, where files derived from it are stored too
+DATASET_FILES = {}
+
+
+def read_sales(cache_path, key):
+    """
+        Memory-map the sales cached by load_sales and index them.
+
+        Returns: SaleHistory
+                 Registered under the dataset version key, so it is keyed
+                 by it in the caches of the functions it is passed to.
+    """
+    table = feather.read_table(cache_path, memory_map=True)
+    history = SaleHistory(table.to_pandas(split_blocks=True), int(table.schema.metadata[LATEST_KEY]))
+
+    register_fingerprint(history, ('sales', key))
+    register_fingerprint(history.sales, ('sales', key, 'frame'))
+    DATASET_FILES[key] = cache_path
+    return history
+
+
+@cache_data
+@count_runs
+def load_dataset(path, cache_dir='.cache'):
+    """
+        Load the latest sale of each house, the rows the dashboard and the
+        reports work on, as a view of the sales of load_sales: no column is
+        copied, and within a process the frame is shared by all sessions
+        through DATA_CACHE.
+
+        Inputs: path: str
+                Path to the raw csv file.
+
+                cache_dir: str, optional
+                Directory holding the Feather files, by default .cache
+
+        Returns: (DataFrame, check)
+    """
+    history, mute = load_sales(path, cache_dir)
+    if mute == 0:
+        return (history, 0)
+
+    data = history.latest()
+
+    ## --- frames are keyed by dataset version in the caches of the functions they are passed to
+    register_fingerprint(data, ('dataset', registered_fingerprint(history)[1]))
+    return (data, 1)
+
+
+## --- metrics and statistics kept by the aggregate cubes
+CUBE_METRICS = ['price', 'sqft_living', 'sqft_lot', 'price_sqft']
+CUBE_STATS = ['count', 'sum', 'min', 'max']
+
+
+def build_cube(data, keys=('zipcode',)):
+    """
+        Compute count, sum, min and max of CUBE_METRICS for each group of keys
+        in a single groupby pass. Means are derived from sums and counts by
+        cube_means, so the cube can be updated incrementally by update_cube.
+
+        Inputs: data: pandas DataFrame
+                The cleaned dataset, or a batch of new cleaned rows.
+
+                keys: tuple of column labels, optional
+                Columns to group by, by default zipcode.
+
+        Returns: DataFrame
+                 Indexed by keys, with (metric, stat) MultiIndex columns.
+    """
+    ## --- plain key values, so cubes built from different categoricals can be combined
+    frame = pd.DataFrame({key: np.asarray(data[key]) for key in keys})
+    for metric in CUBE_METRICS:
+        frame[metric] = np.asarray(data[metric], dtype=np.float64)
+
+    return frame.groupby(list(keys)).agg(CUBE_STATS)
+
+
+def update_cube(cube, rows, keys=('zipcode',)):
+    """
+        Fold new rows into a cube computed by build_cube, aggregating only
+        the new rows.
+
+        Inputs: cube: DataFrame
+                A cube returned by build_cube with the same keys.
+
+                rows: pandas DataFrame
+                The appended cleaned rows.
+
+        Returns: DataFrame
+                 The updated cube.
+    """
+    delta = build_cube(rows, keys)
+    index = cube.index.union(delta.index)
+    cube = cube.reindex(index)
+    delta = delta.reindex(index)
+
+    for metric in CUBE_METRICS:
+        for stat in ('count', 'sum'):
+            cube[(metric, stat)] = cube[(metric, stat)].fillna(0) + delta[(metric, stat)].fillna(0)
+        cube[(metric, 'min')] = np.fmin(cube[(metric, 'min')], delta[(metric, 'min')])
+        cube[(metric, 'max')] = np.fmax(cube[(metric, 'max')], delta[(metric, 'max')])
+
+    return cube
+
+
+def cube_means(cube):
+    """
+        Return the mean of each metric of a cube, indexed like the cube.
+    """
+    return cube.xs('sum', axis=1, level=1) / cube.xs('count', axis=1, level=1)
+
+
+def rollup_cube(cube, keys):
+    """
+        Aggregate a cube over its index levels not in keys, e.g. the
+        zipcode x year x season cube into a year x season cube.
+    """
+    grouped = cube.groupby(level=list(keys))
+
+    rolled, mins, maxs = grouped.sum(), grouped.min(), grouped.max()
+    for metric in CUBE_METRICS:
+        rolled[(metric, 'min')] = mins[(metric, 'min')]
+        rolled[(metric, 'max')] = maxs[(metric, 'max')]
+
+    return rolled
+
+
+@cache_data
+@count_runs
+def get_cubes(data):
+    """
+        Build the aggregates read by the display functions.
+
+        Returns: (DataFrame, DataFrame)
+                 The zipcode cube and the zipcode x year x season cube.
+    """
+    return (build_cube(data, ('zipcode',)), build_cube(data, ('zipcode', 'year', 'season')))
+
+
+@cache_resource
+@count_runs
+def get_spatial_index(data):
+    """
+        Build the latitude/longitude index of data, see SpatialIndex.
+    """
+    return SpatialIndex(data['lat'].values, data['long'].values)
+
+
+@cache_resource
+@count_runs
+def get_range_indexes(data):
+    """
+        Build the sorted indexes answering the slider filters of the price
+        plots, see SortedIndex: prices by date and by year built, and prices
+        overall and per zipcode.
+
+        Returns: dict
+                 SortedIndex by name, plus the zipcodes of the groups of the
+                 'price_zipcode' index under 'zipcodes'.
+    """
+    price = np.asarray(data['price'])
+    zipcode = pd.Categorical(data['zipcode'])
+
+    return {'date': SortedIndex(np.asarray(data['date'], dtype='datetime64[ns]'), price),
+            'yr_built': SortedIndex(np.asarray(data['yr_built']), price),
+            'price': SortedIndex(price),
+            'price_zipcode': SortedIndex(price, groups=zipcode.codes, n_groups=len(zipcode.categories)),
+            'zipcodes': pd.Index(zipcode.categories)}
+
+
+def range_histogram(index, groups, low, high, nbins=30):
+    """
+        Bin the keys between low and high of each group of a SortedIndex on
+        shared edges, by binary search over the sorted keys.
+
+        Returns: (edges, counts, boxes)
+                 See grouped_histogram and box_stats.
+    """
+    spans = [index.span(low, high, group) for group in groups]
+    ends = np.array([[index.keys[start], index.keys[stop - 1]] for start, stop in spans if stop > start],
+                    dtype=index.keys.dtype)
+    edges = histogram_edges(ends, nbins) if len(ends) else np.array([low, high], dtype=np.float64)
+
+    counts = np.vstack([index.histogram(low, high, edges, group) for group in groups])
+    boxes = [index.box_stats(low, high, group) for group in groups]
+
+    return (edges, counts, boxes)
+
+
+def visible_houses(data, index, bounds):
+    """
+        Return the rows of data inside a map viewport.
+
+        Inputs: index: SpatialIndex
+                Index built over data.
+
+                bounds: tuple
+                (lat_min, lat_max, long_min, long_max) of the viewport.
+    """
+    return data.iloc[np.sort(index.bbox(*bounds))]
+
+
+@dataclass(frozen=True)
+class FlipConfig:
+    """
+        Assumptions of a flipping strategy.
+
+        markup, markup_waterfront: selling price over purchase price, for
+        houses without and with waterfront view.
+        reno_good, reno_other: renovation expenditures over purchase price,
+        for houses in good condition and for the others.
+        good_condition: lowest condition deemed as good.
+        below_average: a house is bought only if its price is lower than
+        this fraction of its zipcode average price.
+        comps_k: when positive, compare each house with the average price of
+        its comps_k nearest sales instead of its zipcode average price.
+    """
+    markup: float = 1.3
+    markup_waterfront: float = 1.5
+    reno_good: float = 0.07
+    reno_other: float = 0.12
+    good_condition: int = 4
+    below_average: float = 1.0
+    comps_k: int = 0
+
+
+def flip_inputs(data, cube, config=FlipConfig(), index=None):
+    """
+        Return the columns the opportunity engine works on as numpy arrays:
+        price, condition, waterfront flag and the reference price of each
+        house, i.e. its zipcode average price or, when config.comps_k is
+        positive, the average price of its nearest comparable sales.
+
+        Inputs: index: SpatialIndex, optional
+                Index built over data, used for the nearest comparable sales.
+                Built on the fly when needed and not given.
+    """
+    price = np.asarray(data['price'], dtype=np.float64)
+
+    if config.comps_k > 0:
+        if index is None:
+            index = get_spatial_index(data)
+        comps, _ = index.neighbours(config.comps_k)
+        reference = price[comps].mean(axis=1)
     else:
-        desc = desc[atts]
-        return (desc, 205)
+        reference = cube_means(cube)['price'].reindex(np.asarray(data['zipcode'])).values
 
+    return (price, np.asarray(data['condition']), np.asarray(data['waterfront']) > 0, reference)
 
-def display_dist_renv(data, atts):
-    num_attributes = data.select_dtypes(include=['int64', 'float64'])
-    dens = num_attributes.drop(['id', 'lat', 'long', 'zipcode', 'yr_renovated', 'waterfront', 'view'], axis=1)
 
-    dens_plot = px.histogram(data, x=atts)
+def flip_profit_matrix(price, condition, waterfront, reference, configs, block_size=1 << 22):
+    """
+        Score many flipping strategies against every house at once.
 
-    return dens_plot
+        A house is selected by a strategy when its price is lower than
+        below_average times its reference price and it is either in good
+        condition or has a waterfront view, but not both (such houses are
+        left out, as done since the first version of the dashboard).
 
+        Inputs: price, condition, waterfront, reference: numpy arrays
+                As returned by flip_inputs, one entry per house. The reference
+                prices are shared by all scenarios, so comps_k is not read
+                from configs.
 
-@st.cache(allow_output_mutation=True, suppress_st_warning=True)
-def display_map_markers(data):
-    data = data.head(500)
+                configs: list of FlipConfig
+                The strategies (scenarios) to score.
 
-    b_map = folium.Map(location=[data['lat'].mean(), data['long'].mean()], default_zoom_start=15)
-    marker_cluster = MarkerCluster().add_to(b_map)
+                block_size: int, optional
+                Maximum number of scenario x house cells computed at a time,
+                bounding the temporaries.
 
-    for name, row in data.iterrows():
-        folium.Marker([row['lat'], row['long']],
-                      popup='Sold {0} USD on: {1}. Features: {2} sqft, {3} bedrooms, {4} bathrooms, year built: {5}'.format(
-                          row['price'], row['date'], row['sqft_living'], row['bedrooms'], row['bathrooms'],
-                          row['yr_built'])).add_to(marker_cluster)
+        Returns: (numpy array, numpy array)
+                 The scenarios x houses profit matrix (zero where a house is
+                 not selected) and the boolean selection matrix.
+    """
+    params = np.array([[c.markup, c.markup_waterfront, c.reno_good, c.reno_other,
+                        c.good_condition, c.below_average] for c in configs], dtype=np.float64)
 
-    return b_map
+    profit = np.zeros((len(configs), len(price)), dtype=np.float64)
+    selected = np.zeros((len(configs), len(price)), dtype=bool)
 
+    step = max(1, block_size // max(1, len(price)))
+    for start in range(0, len(configs), step):
+        markup, markup_wat, reno_good, reno_other, good_cond, below = \
+            [col[:, None] for col in params[start:start + step].T]
 
-@st.cache(allow_output_mutation=True, suppress_st_warning=True)
-def display_map_density(data, geodata):
-    data = data.head(500)
+        good = condition >= good_cond
+        sel = (price < below * reference) & (good != waterfront)
 
-    df_map = data[['price', 'zipcode']].groupby('zipcode').mean().reset_index()
-    df_map.columns = ['Zipcode', 'Price']
+        sell_price = price * np.where(waterfront, markup_wat, markup)
+        expend = price * np.where(good, reno_good, reno_other)
 
-    geodata = geodata[geodata['ZIP'].isin(df_map['Zipcode'].tolist())]
+        profit[start:start + step] = np.where(sel, sell_price - expend - price, 0.)
+        selected[start:start + step] = sel
 
-    b_map = folium.Map(location=[data['lat'].mean(), data['long'].mean()], default_zoom_start=15)
-    b_map.choropleth(data=df_map, geo_data=geodata, columns=['Zipcode', 'Price'], key_on='feature.properties.ZIP',
-                     fill_color='YlOrRd', fill_opacity=0.7, line_opacity=0.2, legend_name='Average Price')
+    return (profit, selected)
 
-    return b_map
 
+def last_sales(path, chunksize=100000):
+    """
+        Find the row of the last sale of each id of a csv file, the row
+        hand_nonunique keeps, reading only the id column chunk by chunk.
+        Memory grows with the number of distinct ids, not of rows: one id
+        and one row number are kept per id, plus one chunk.
+
+        Returns: (numpy array, numpy array, int)
+                 The sorted distinct ids, the row number of the last sale of
+                 each and the number of rows of the file.
+    """
+    ids, rows, offset = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), 0
+    for chunk in pd.read_csv(path, usecols=['id'], dtype={'id': 'int64'}, chunksize=chunksize):
+        chunk_ids = chunk['id'].values
+        ids = np.concatenate([ids, chunk_ids])
+        rows = np.concatenate([rows, np.arange(offset, offset + len(chunk_ids))])
+        offset += len(chunk_ids)
+
+        ## --- first occurrence in the reversed arrays is the last sale so far
+        ids, first_reversed = np.unique(ids[::-1], return_index=True)
+        rows = rows[::-1][first_reversed]
+
+    return ids, rows, offset
 
-def display_price_yrbuilt(data):
-    ## --- Filtering by yr_built
-    min_yr_built = int(data['yr_built'].min())
-    max_yr_built = int(data['yr_built'].max())
 
-    f_yr_built = st.sidebar.slider('Select year built range', min_yr_built, max_yr_built, (min_yr_built, max_yr_built))
+def read_clean_chunks(path, last, chunksize=100000):
+    """
+        Yield the cleaned chunks of a csv file, with the last sale of each id
+        only (see last_sales) and the dtypes of CACHE_SCHEMA but for
+        categories, which would differ from one chunk to the next.
+    """
+    chunk_schema = {col: dtype for col, dtype in CACHE_SCHEMA.items() if dtype != 'category'}
+    ids, rows, _ = last
 
-    data_yr = data[data['yr_built'].between(f_yr_built[0], f_yr_built[1])]
-    data_yr = data_yr.groupby('yr_built').mean().reset_index()
+    offset = 0
+    for chunk in pd.read_csv(path, dtype=CSV_DTYPES, chunksize=chunksize):
+        positions = np.arange(offset, offset + len(chunk))
+        offset += len(chunk)
+        chunk = chunk[rows[np.searchsorted(ids, chunk['id'].values)] == positions]
 
-    yr_built_plot = px.line(data_yr, x='yr_built', y='price',
-                            labels={'price': 'Average Price (USD)', 'yr_built': 'Year of Construction'})
-    st.header('Average Price per Year Built')
-    st.markdown(
-        'How prices vary according to the year houses were built. You can filter the horizontal axis range using the commercial options in the sidebar.')
-    st.plotly_chart(yr_built_plot, use_container_width=True)
+        chunk, mute = check_integers(chunk, ['bedrooms', 'bathrooms', 'floors', 'yr_built', 'yr_renovated', 'zipcode'])
+        yield apply_schema(build_features(chunk), chunk_schema)
+
+
+def ingest_chunked(path, chunksize=100000, config=FlipConfig()):
+    """
+        Read a sales csv file in chunks of bounded size, cleaning each chunk
+        and folding it into the zipcode aggregates, then read it again to
+        score each chunk against the final zipcode averages and keep only
+        the houses to buy. The raw file is never held in memory: besides one
+        chunk, only the last row of each distinct id (see last_sales), the
+        cubes and the houses to buy are kept, so memory is bounded by the
+        chunk size plus O(distinct ids). benchmark.py reports its peak RSS.
+
+        Inputs: path: str
+                Path to the raw csv file.
+
+                chunksize: int, optional
+                Number of csv rows parsed at a time.
+
+                config: FlipConfig, optional
+                Strategy used to pick the houses to buy. Only the zipcode
+                average rule is available, comps_k must be 0.
+
+        Returns: (DataFrame, DataFrame, tuple, dict)
+                 The zipcode cube, the zipcode x year x season cube, the
+                 display_houses_tobuy output and ingestion stats: rows read
+                 and kept, chunks and seconds.
+    """
+    if config.comps_k > 0:
+        raise ValueError('Nearest comparable sales need the whole dataset, use display_houses_tobuy instead.')
+
+    start = time.perf_counter()
+    last = last_sales(path, chunksize)
+
+    ## --- first pass: aggregates, built from the functions themselves so chunks are not stored in DATA_CACHE
+    zip_cube, season_cube, chunks = None, None, 0
+    for chunk in read_clean_chunks(path, last, chunksize):
+        chunks += 1
+        if zip_cube is None:
+            zip_cube, season_cube = build_cube(chunk, ('zipcode',)), build_cube(chunk, ('zipcode', 'year', 'season'))
+        else:
+            zip_cube = update_cube(zip_cube, chunk, ('zipcode',))
+            season_cube = update_cube(season_cube, chunk, ('zipcode', 'year', 'season'))
 
-    return None
+    ## --- second pass: houses to buy against the final averages, good condition first as in opportunities_table
+    good, waterfront = [], []
+    for chunk in read_clean_chunks(path, last, chunksize):
+        price, condition, wat, reference = flip_inputs(chunk, zip_cube, config)
+        selected = flip_selection(price, condition, wat, reference, config)
+        to_buy = opportunities_table(chunk, price, condition, wat, selected, config)[0]
 
+        is_good = (to_buy['condition'] == 'good').values
+        good.append(to_buy[is_good])
+        waterfront.append(to_buy[~is_good])
 
-def display_price_season(data):
-    ## --- grouping data by year and season
-    data_season = data[['price', 'year', 'season']].groupby(['year', 'season']).mean().reset_index()
+    to_buy = pd.concat(good + waterfront)
 
-    season_plot = px.histogram(data_season, x='year', y='price', color='season', barmode='group',
-                               labels={'year': 'Year', 'season': 'Season'}).update_yaxes(
-        {'title': 'Average Price (USD)'})
-    st.header('Average Price per Meteorological Season')
-    st.markdown('The bar chart below shows how average prices vary according to seasons from 2014 to 2015.')
-    st.plotly_chart(season_plot, use_container_width=True)
+    stats = {'rows_read': last[2], 'rows_kept': len(last[0]), 'chunks': chunks,
+             'seconds': time.perf_counter() - start}
 
+    return (zip_cube, season_cube, (to_buy,) + opportunity_totals(to_buy), stats)
 
-def display_price_isold(data):
-    ## --- selecting average prices
-    data_isold = data[['price', 'old']].groupby('old').mean().reset_index()
-    perc_dif = (abs(data_isold.iloc[0]['price'] - data_isold.iloc[1]['price']) / data_isold.iloc[1]['price']) * 100.
 
-    isold_plot = px.bar(data_isold, x='old', y='price', labels={'price': 'Average Price (USD)', 'old': ''})
-    isold_plot.update_layout(xaxis=dict(tickmode='array',
-                                        tickvals=[0, 1],
-                                        ticktext=['New Houses', 'Old Houses']))
-    st.header('Average Price for New and Old Houses')
-    st.markdown('From the bar plot below we can see that the average price for new houses deviates {}% relatively '
-                'from the average price of old houses.'.format(str(round(perc_dif, 2))))
-    st.plotly_chart(isold_plot, use_container_width=True)
-    return None
+def histogram_edges(values, nbins=30):
+    """
+        Bin edges shared by all groups of a histogram: one bin per integer
+        when values are integers spanning fewer than nbins units, nbins
+        equal-width bins otherwise.
 
+        Inputs: values: numpy array
+                Finite, non-empty values to bin.
+    """
+    low, high = float(values.min()), float(values.max())
 
-def display_price_basement(data):
-    ## --- selecting average price and average total area according to basement
-    data_basement = data[['price', 'sqft_basement', 'sqft_lot']]
-    data_basement['sqft_basement'] = data_basement['sqft_basement'].apply(lambda x: 1 if x > 0 else 0).astype(np.int64)
-    data_basement = data_basement.groupby('sqft_basement').mean().reset_index()
+    if high - low < nbins and (values.dtype.kind in 'iub' or np.all(np.mod(values, 1) == 0)):
+        return np.arange(low - 0.5, high + 1.)
+    if high == low:
+        return np.array([low - 0.5, high + 0.5])
 
-    perc_dif_price = (abs(data_basement.iloc[0]['price'] - data_basement.iloc[1]['price']) / data_basement.iloc[1][
-        'price']) * 100
-    perc_dif_price = str(round(perc_dif_price, 2))
+    return np.linspace(low, high, nbins + 1)
 
-    perc_dif_area = (abs(data_basement.iloc[0]['sqft_lot'] - data_basement.iloc[1]['sqft_lot']) / data_basement.iloc[1][
-        'sqft_lot']) * 100
-    perc_dif_area = str(round(perc_dif_area, 2))
 
-    basement_plot_price = px.bar(data_basement, x='sqft_basement', y='price', labels={'price': 'Average Price (USD)',
-                                                                                      'sqft_basement': ''})
-    basement_plot_price.update_layout(xaxis=dict(tickmode='array',
-                                                 tickvals=[0, 1],
-                                                 ticktext=['No Basement', 'Has Basement']))
+def grouped_histogram(values, groups=None, nbins=30):
+    """
+        Count values in bins with numpy, for each group at once.
 
-    basement_plot_area = px.bar(data_basement, x='sqft_basement', y='sqft_lot',
-                                labels={'sqft_lot': 'Average square footage lot',
-                                        'sqft_basement': ''})
-    basement_plot_area.update_layout(xaxis=dict(tickmode='array',
-                                                tickvals=[0, 1],
-                                                ticktext=['No Basement', 'Has Basement']))
+        Inputs: values: array-like
+                Values to bin, NaNs are left out.
 
-    st.header('Average Price and Average Total Area vs Basement')
-    st.markdown(
-        'As we can see from the bar plot below, houses having no basement are {}% cheaper on average. Furthermore, these houses are, on average, '
-        '{}% bigger considering their total area.'.format(perc_dif_price, perc_dif_area))
-    ca, cb = st.columns((1, 1))
-    with ca:
-        ca.plotly_chart(basement_plot_price, use_container_width=True)
-    with cb:
-        cb.plotly_chart(basement_plot_area, use_container_width=True)
+                groups: array-like or pandas Categorical, optional
+                Group label of each value. All values form one group if None.
+                Categories without values are left out.
 
-    return None
+        Returns: (edges, labels, counts, codes, values)
+                 The bin edges, the sorted group labels, the (groups, bins)
+                 count matrix, and the group code of each binned value
+                 along with the values themselves.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    keep = ~np.isnan(values)
+    values = values[keep]
+
+    if groups is None:
+        labels, codes = np.array([None]), np.zeros(len(values), dtype=np.int64)
+    elif isinstance(groups, pd.Categorical):
+        codes = groups.codes[keep].astype(np.int64)
+        present = np.bincount(codes, minlength=len(groups.categories)) > 0
+        labels, codes = np.asarray(groups.categories)[present], (np.cumsum(present) - 1)[codes]
+    else:
+        labels, codes = np.unique(np.asarray(groups)[keep], return_inverse=True)
 
+    if len(values) == 0:
+        return (np.array([0., 1.]), labels, np.zeros((len(labels), 1), dtype=np.int64), codes, values)
 
-def display_price_waterfront(data):
-    ## --- selecting average price accordin to waterfront
-    data_waterfront = data[['price', 'waterfront']].groupby('waterfront').mean().reset_index()
+    ## --- edges are evenly spaced, so bins are found arithmetically
+    edges = histogram_edges(values, nbins)
+    n_bins = len(edges) - 1
+    bins = np.clip(((values - edges[0]) / (edges[1] - edges[0])).astype(np.int64), 0, n_bins - 1)
+    counts = np.bincount(codes * n_bins + bins, minlength=len(labels) * n_bins).reshape(len(labels), n_bins)
 
-    perc_dif_price = (abs(data_waterfront.iloc[0]['price'] - data_waterfront.iloc[1]['price']) /
-                      data_waterfront.iloc[0]['price']) * 100
-    perc_dif_price = str(round(perc_dif_price, 2))
+    return (edges, labels, counts, codes, values)
 
-    price_plot = px.bar(data_waterfront, x='waterfront', y='price', labels={'price': 'Average Price (USD)',
-                                                                            'waterfront': ''})
-    price_plot.update_layout(xaxis=dict(tickmode='array',
-                                        tickvals=[0, 1],
-                                        ticktext=['No Waterfront', 'Waterfront View']))
 
-    st.header('Average Price vs Waterfront View')
-    st.markdown(
-        'This bar plot tells us that houses having a waterfront view cost {}% more, on average.'.format(perc_dif_price))
-    st.plotly_chart(price_plot, use_container_width=True)
+def box_stats(values, codes, n_groups):
+    """
+        Quartiles and Tukey fences (the farthest values within 1.5 IQR of
+        the quartiles) of each group, as drawn by a plotly box plot.
 
-    return None
+        Returns: list of dict
+                 q1, median, q3, lowerfence, upperfence and mean per group.
+    """
+    ## --- a stable sort of small integers is a radix sort in numpy
+    order = np.argsort(codes.astype(np.int16) if n_groups < 1 << 15 else codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(n_groups + 1))
 
+    stats = []
+    for group in range(n_groups):
+        group_values = values[order[bounds[group]:bounds[group + 1]]]
+        if len(group_values) == 0:
+            stats.append(None)
+            continue
 
-def display_price_date(data):
-    ## --- Filtering by date
-    min_date = data['date'].min()
-    max_date = data['date'].max()
+        q1, median, q3 = np.percentile(group_values, [25, 50, 75])
+        low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+        stats.append({'q1': q1, 'median': median, 'q3': q3,
+                      'lowerfence': group_values[group_values >= low].min(),
+                      'upperfence': group_values[group_values <= high].max(),
+                      'mean': group_values.mean()})
 
-    f_date = st.sidebar.slider('Select date range', min_date, max_date, (min_date, max_date))
+    return stats
 
-    data_dt = data[data['date'].between(f_date[0], f_date[1])]
-    data_dt = data_dt.groupby('date').mean().reset_index()
 
-    date_plot = px.line(data_dt, x='date', y='price')
-    st.header('Daily Price Evolution')
-    st.markdown(
-        'Daily price variation according to the date of registration. You can filter the horizontal axis range using the commercial options in the sidebar.')
-    st.plotly_chart(date_plot, use_container_width=True)
+def display_data_overview(data, attributes):
+    """
+        Return the columns of the Data Overview table: all of them, or the
+        id and the selected attributes, last selected first. Pages of the
+        table take these columns from data, see display_table.
+    """
+    if attributes == []:
+        return list(data.columns)
+    else:
+        to_show = list(attributes)
+        to_show.append('id')
+        return to_show[::-1]
 
-    return None
 
+## --- rows sent to the browser per page of the tables
+PAGE_SIZE = 50
 
-def display_price_dist(data):
-    ## --- Price distribution
 
-    f_zipcode = st.sidebar.multiselect('Select zip codes to display prices distribution',
-                                       options=data['zipcode'].sort_values().unique())
+def sort_keys(values):
+    """
+        Return the values of a Series as an array ordering rows like
+        Series.sort_values: categories are ranked by their labels and
+        missing categories become NaN.
+    """
+    if values.dtype.name == 'category':
+        ranks = np.argsort(np.argsort(np.asarray(values.cat.categories), kind='stable'))
+        codes = np.asarray(values.cat.codes)
+        return np.where(codes < 0, np.nan, ranks[codes])
 
-    data_pr = data.loc[data['zipcode'].isin(f_zipcode), ['price', 'zipcode']] if sum(
-        data['zipcode'].isin(f_zipcode)) > 0 \
-        else data[['price', 'zipcode']].copy()
+    return np.asarray(values)
 
-    min_price = int(data_pr['price'].min())
-    max_price = int(data_pr['price'].max())
-    avg_price = int(data_pr['price'].mean())
 
-    f_price = st.sidebar.slider('Select price range', min_price, max_price, (min_price, max_price))
+@cache_data
+@count_runs
+def table_rows(data, sort_by=None, ascending=True, filters=()):
+    """
+        Positions of the rows of data to show in a table, sorted and
+        filtered without copying any column of data.
 
-    data_pr = data_pr[data_pr['price'].between(f_price[0], f_price[1])]
+        Inputs: sort_by: str, optional
+                Column to sort by, the original order if None. Missing values
+                come last in both orders.
 
-    price_plot = px.histogram(data_pr, x='price', color='zipcode' if f_zipcode != [] else None,
-                              marginal='box')
-    st.header('Prices Distribution')
-    st.markdown(
-        'An histogram showing how prices are distributed in the dataset. You can adjust the horizontal axis range using the commercial options in the sidebar.')
-    st.plotly_chart(price_plot, use_container_width=True)
+                ascending: bool, optional
 
-    return None
+                filters: tuple of (str, low, high[, keep_missing]), optional
+                Keep the rows with low <= value <= high in each column. Rows
+                missing the value (NaN) are dropped, unless keep_missing.
 
+        Returns: numpy array
+                 Row positions, int32 when they fit.
+    """
+    rows = np.arange(len(data))
+    if sort_by is not None:
+        keys = sort_keys(data[sort_by])
+        rows = np.argsort(keys, kind='stable')
+        if not ascending:
+            valid = len(rows) - int(pd.isna(keys).sum())
+            rows = np.concatenate([rows[:valid][::-1], rows[valid:]])
+
+    if filters:
+        keep = np.ones(len(data), dtype=bool)
+        for col, low, high, *keep_missing in filters:
+            values = np.asarray(data[col])
+            inside = (values >= low) & (values <= high)
+            if keep_missing and keep_missing[0]:
+                inside |= pd.isna(values)
+            keep &= inside
+        rows = rows[keep[rows]]
+
+    return rows.astype(np.int32) if len(data) < 1 << 31 else rows
+
+
+def table_page(data, columns, rows, page, page_size=PAGE_SIZE):
+    """
+        Return the rows of the given (1-based) page, copying only these rows
+        of the given columns out of data.
+    """
+    positions = rows[(page - 1) * page_size:page * page_size]
 
-def display_phys_radio():
-    st.sidebar.title('Physical Attributes')
+    return data.iloc[positions, data.columns.get_indexer(columns)]
 
-    phys_opt = st.sidebar.radio('Select one of the following options to display attributes plots:',
-                                options=('1 - Houses per bedrooms',
-                                         '2 - Houses per bathrooms',
-                                         '3 - Houses per floors',
-                                         '4 - Houses per waterfront view',
-                                         '5 - Show all'),
-                                index=4)
 
-    phys_opt = int(phys_opt.split('-')[0].strip())
+@cache_data
+@count_runs
+def column_bounds(data, col):
+    """
+        Return the lowest and highest values of a column, as Python scalars,
+        and the number of missing (NaN) values. Both bounds are None when
+        every value is missing.
+    """
+    values = np.asarray(data[col])
+    missing = int(pd.isna(values).sum())
+    if missing == len(values):
+        return (None, None, missing)
 
-    return phys_opt
+    return (np.nanmin(values).item(), np.nanmax(values).item(), missing)
 
 
-def display_att_hist(data, col, nbins=30):
-    data = data[col]
+# return None
 
-    fig = px.histogram(data, x=col, nbins=nbins)
-    st.plotly_chart(fig, use_container_width=True)
 
-    return None
+@cache_data
+@count_runs
+def display_data_averaged(cube, zipcodes):
+    try:
+        means = cube_means(cube)
+        data = pd.DataFrame({'Zipcode': cube.index.values,
+                             'Total Houses': cube[('price', 'count')].values.astype(np.int64),
+                             'Price': means['price'].values,
+                             'Sqft Living': means['sqft_living'].values,
+                             'Price/Sqft': means['price_sqft'].values})
 
+        if zipcodes == []:
+            return (data, 195)
+        else:
+            return (data[data['Zipcode'].isin(zipcodes)], None)
+    except:
+        show_message('Streamlit is unable to display averaged data by zipcodes.')
 
-@st.cache(allow_output_mutation=True, suppress_st_warning=True)
-def display_houses_tobuy(data):
-    avg_price_reg = data[['price', 'zipcode']].groupby('zipcode').mean()
 
-    ## --- selecting houses in good conditions (condition >= 4)
-    to_buy_good = data[data['condition'] >= 4]
-    to_buy_good = to_buy_good.loc[to_buy_good['price'].values <
-                                  avg_price_reg.loc[to_buy_good['zipcode'], 'price'].values]
-    to_buy_good['condition'] = to_buy_good['condition'].apply(lambda x: 'good').astype(str)
+@cache_resource
+@count_runs
+def get_sketches(data):
+    """
+        Mergeable moments and quantile sketches of the descriptive attributes
+        of data, see sketches.py. For a dataset returned by load_dataset they
+        are stored next to its Feather file, in the cache_dir it was loaded
+        with, so they are built once per csv content and pipeline version and
+        removed along with the Feather file by load_sales.
+
+        Returns: dict
+                 ColumnSketch by attribute.
+    """
+    fingerprint = registered_fingerprint(data)
+    path = None
+    if isinstance(fingerprint, tuple) and len(fingerprint) == 2 and fingerprint[0] == 'dataset' \
+            and fingerprint[1] in DATASET_FILES:
+        path = os.path.splitext(DATASET_FILES[fingerprint[1]])[0] + '.sketches.json'
+        if os.path.exists(path):
+            return load_sketches(path)
+
+    sketches = build_sketches(data, descriptive_attributes(data))
+    if path is not None:
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        save_sketches(sketches, tmp_path)
+        os.replace(tmp_path, path)
+
+    return sketches
+
+
+@cache_data
+@count_runs
+def display_descriptive(data, atts, percts, exact=False):
+    """
+        Describe the descriptive attributes of data: count, mean, standard
+        deviation, min, the chosen percentile, median and max. Statistics are
+        read from the sketches of get_sketches, with percentiles within about
+        1% in rank of the exact ones; exact runs DataFrame.describe instead.
+    """
+    if exact:
+        desc = data[descriptive_attributes(data)].describe(percentiles=[percts])
+    else:
+        desc = describe_sketches(get_sketches(data), percentiles=[percts])
 
-    ## --- selecting houses having waterfront view
-    to_buy_wat = data[data['waterfront'] > 0]
-    to_buy_wat = to_buy_wat.loc[to_buy_wat['price'].values <
-                                avg_price_reg.loc[to_buy_wat['zipcode'], 'price'].values]
-    to_buy_wat['condition'] = to_buy_wat['condition'].apply(lambda x: 'good' if x >= 4
-    else 'ok' if x == 3
-    else 'poor')
+    desc = desc.rename(
+        index={'count': '# entries', 'mean': 'Mean', 'std': 'Std Dev', 'min': 'Min', '50%': 'Median', 'max': 'Max'})
 
-    ## --- calculating prices
-    to_buy = pd.concat([to_buy_good, to_buy_wat]).drop_duplicates('id', keep=False).drop(
-        ['view', 'grade', 'lat', 'long'], axis=1)
+    if atts == []:
+        return (desc, 205)
+    else:
+        desc = desc[atts]
+        return (desc, 205)
+
+
+## --- binary attributes compared by the price plots, as (label, flag of the houses having it)
+PRICE_COMPARISONS = [('old', lambda data: np.asarray(data['old']) > 0),
+                     ('basement', lambda data: np.asarray(data['sqft_basement']) > 0),
+                     ('waterfront', lambda data: np.asarray(data['waterfront']) > 0)]
+
+
+def price_comparisons(data):
+    """
+        Average prices of the houses with and without each attribute of
+        PRICE_COMPARISONS: built before 1960, with a basement and with a
+        waterfront view, as shown by the price plots.
+
+        Returns: DataFrame
+                 Indexed by attribute, with the number of houses and the
+                 average price of the houses without and with it, and the
+                 difference in percent of the price without it.
+    """
+    price = np.asarray(data['price'], dtype=np.float64)
+
+    rows = []
+    for label, flag in PRICE_COMPARISONS:
+        having = flag(data)
+        price_without, price_with = price[~having].mean(), price[having].mean()
+        rows.append({'attribute': label, 'houses_without': int((~having).sum()), 'houses_with': int(having.sum()),
+                     'price_without': price_without, 'price_with': price_with,
+                     'difference_pct': (price_with - price_without) / price_without * 100.})
+
+    return pd.DataFrame(rows).set_index('attribute')
+
+
+def flip_selection(price, condition, waterfront, reference, config=FlipConfig()):
+    """
+        Flag the houses to buy: cheaper than their reference price and either
+        in good condition or having waterfront view, but not both.
+    """
+    good = condition >= config.good_condition
+    return (price < config.below_average * reference) & (good != waterfront)
+
+
+def opportunities_table(data, price, condition, waterfront, selected, config=FlipConfig()):
+    """
+        Build the Business Opportunities table of the selected houses of data
+        and its totals, see display_houses_tobuy.
+    """
+    good = condition >= config.good_condition
+
+    ## --- houses in good conditions first, then houses having waterfront view
+    rows = np.concatenate([np.flatnonzero(selected & good), np.flatnonzero(selected & waterfront)])
+
+    to_buy = data.iloc[rows].drop(['view', 'grade', 'lat', 'long'], axis=1)
     to_buy.rename(columns={'price': 'purc_price'}, inplace=True)
-    to_buy['sell_price'] = to_buy[['purc_price', 'waterfront']].apply(
-        lambda x: x['purc_price'] * 1.3 if x['waterfront'] < 1 else
-        x['purc_price'] * 1.5, axis=1)
-    to_buy['expend'] = to_buy[['purc_price', 'condition']].apply(
-        lambda x: x['purc_price'] * 0.07 if x['condition'] == 'good' else
-        x['purc_price'] * 0.12, axis=1)
-    to_buy['profit'] = to_buy['sell_price'] - to_buy['expend'] - to_buy['purc_price']
 
+    good, waterfront, price = good[rows], waterfront[rows], price[rows]
+    to_buy['condition'] = np.where(good, 'good',
+                                   np.where(condition[rows] == config.good_condition - 1, 'ok', 'poor'))
+
+    ## --- calculating prices
+    to_buy['sell_price'] = price * np.where(waterfront, config.markup_waterfront, config.markup)
+    to_buy['expend'] = price * np.where(good, config.reno_good, config.reno_other)
+    to_buy['profit'] = to_buy['sell_price'] - to_buy['expend'] - price
+
+    return (to_buy,) + opportunity_totals(to_buy)
+
+
+def opportunity_totals(to_buy):
+    """
+        Return the totals of a Business Opportunities table: investment,
+        expenditure, profit in percent of the investment and profit.
+    """
     tot_prof = np.round(to_buy['profit'].sum(), 2)
     tot_exp = to_buy['expend'].sum()
     tot_inv = to_buy['purc_price'].sum()
     perct = np.round((tot_prof / tot_inv) * 100, 2)
 
-    return (to_buy, tot_inv, tot_exp, perct, tot_prof)
+    return (tot_inv, tot_exp, perct, tot_prof)
+
+
+@cache_data
+@count_runs
+def display_houses_tobuy(data, cube, config=FlipConfig(), index=None):
+    price, condition, waterfront, reference = flip_inputs(data, cube, config, index)
+    selected = flip_selection(price, condition, waterfront, reference, config)
+
+    return opportunities_table(data, price, condition, waterfront, selected, config)
+
+
+def find_opportunities(data, cube, config=FlipConfig()):
+    """
+        Return display_houses_tobuy(data, cube, config), building the spatial
+        index first when houses are compared with their nearest sales.
+    """
+    index = get_spatial_index(data) if config.comps_k > 0 else None
+
+    return display_houses_tobuy(data, cube, config, index)
+
+
+## --- months and seasons of the sell timing indexes, and weight in sales of the county level in them
+MONTH_NAMES = np.array(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
+SEASON_NAMES = np.array(['Win', 'Spr', 'Sum', 'Aut'])
+SEASON_OF_MONTH = np.array([np.flatnonzero(SEASON_NAMES == season)[0] for season in SEASON_BY_MONTH[1:]])
+TIMING_PRIOR = 20.
+
+
+@cache_resource
+@count_runs
+def get_sell_timing(data, prior=TIMING_PRIOR):
+    """
+        Build the zipcode x month and zipcode x season price indexes of the
+        sales, see TimingIndex, over the price per square foot.
+
+        Returns: dict
+                 The zipcodes (pandas Index) and the 'month' and 'season'
+                 TimingIndex, whose group codes are positions in zipcodes.
+    """
+    zipcode = pd.Categorical(data['zipcode'])
+    months = np.asarray(data['month'], dtype=np.int64) - 1
+    values = np.asarray(data['price_sqft'], dtype=np.float64)
+
+    return {'zipcodes': pd.Index(zipcode.categories),
+            'month': TimingIndex(zipcode.codes, months, values, len(zipcode.categories), 12, prior),
+            'season': TimingIndex(zipcode.codes, SEASON_OF_MONTH[months], values, len(zipcode.categories), 4, prior)}
+
+
+@cache_data
+@count_runs
+def sell_timing_table(to_buy, timing):
+    """
+        Answer when to sell each house of the Business Opportunities table:
+        the best month and season to sell in its zipcode, and the selling
+        price and profit expected in that month, i.e. the sell_price scaled
+        by the month index of the zipcode relative to the month of purchase.
+
+        Returns: (DataFrame, float)
+                 The houses with their timing, and the total expected profit.
+    """
+    codes = timing['zipcodes'].get_indexer(np.asarray(to_buy['zipcode']))
+    bought = np.asarray(to_buy['month'], dtype=np.int64) - 1
+
+    best_month, timed_price = timing['month'].best(codes, bought, to_buy['sell_price'])
+    best_season = timing['season'].best_periods[timing['season'].rows(codes)]
+
+    table = to_buy[['id', 'zipcode', 'date', 'purc_price', 'sell_price', 'expend']].copy()
+    table['sell_month'] = MONTH_NAMES[best_month]
+    table['sell_season'] = SEASON_NAMES[best_season]
+    table['timed_sell_price'] = timed_price
+    table['timed_profit'] = timed_price - table['expend'] - table['purc_price']
+
+    return (table, np.round(table['timed_profit'].sum(), 2))
+
+
+## --- weight in pairs of sales of the county level in the repeat-sales index
+REPEAT_PRIOR = 5.
+
+
+@cache_data
+@count_runs
+def repeat_sales_table(history):
+    """
+        Pairs of consecutive sales of the houses sold more than once, with
+        their holding period and price appreciation, see SaleHistory.
+
+        Returns: DataFrame
+    """
+    return history.repeat_sales()
+
+
+@cache_resource
+@count_runs
+def get_repeat_index(history, prior=REPEAT_PRIOR):
+    """
+        Build the zipcode x month repeat-sales price index of the houses sold
+        more than once, see RepeatSalesIndex.
+
+        Returns: dict
+                 The zipcodes (pandas Index), the first day of each month
+                 (DatetimeIndex) and the 'index' RepeatSalesIndex, whose
+                 group codes are positions in zipcodes.
+    """
+    pairs = repeat_sales_table(history)
+    zipcode = pd.Categorical(history.sales['zipcode'])
+    months = pd.date_range(history.sales['date'].min().to_period('M').to_timestamp(),
+                           history.sales['date'].max(), freq='MS')
+
+    def month_codes(dates):
+        dates = pd.DatetimeIndex(dates)
+        return (dates.year - months[0].year) * 12 + dates.month - months[0].month
+
+    codes = pd.Index(zipcode.categories).get_indexer(pairs['zipcode'])
+    index = RepeatSalesIndex(codes, month_codes(pairs['buy_date']), month_codes(pairs['sell_date']),
+                             pairs['sell_price'] / pairs['buy_price'], len(zipcode.categories), len(months), prior)
+
+    return {'zipcodes': pd.Index(zipcode.categories), 'months': months, 'index': index}
+
+
+def repeat_index_table(repeat):
+    """
+        Return the repeat-sales index of get_repeat_index as a zipcode x
+        month table, the county on the last row.
+    """
+    zipcodes = list(repeat['zipcodes']) + ['county']
+    return pd.DataFrame(repeat['index'].index, index=pd.Index(zipcodes, name='zipcode'),
+                        columns=repeat['months'].strftime('%Y-%m'))
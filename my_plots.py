@@ -0,0 +1,480 @@
+"""
+    Figures, tables and widgets of the dashboard, drawn with plotly and
+    Streamlit from the data and aggregates of my_methods.py.
+
+    Figures are built by the *_figure functions, which return them
+    serialized (see figure_json) and are cached with cache_figure, keyed by
+    the dataset version and the filter inputs. The display_* functions read
+    the filter widgets and send the cached figures with show_figure, so a
+    section whose inputs did not change costs a cache lookup.
+"""
+import json
+
+import streamlit as st
+import pandas    as pd
+import numpy     as np
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.utils
+
+from plotly.subplots  import make_subplots
+from caching          import cache_figure
+from instrumentation  import count_runs, record_sent
+from my_methods       import (MONTH_NAMES, box_stats, cube_means, get_range_indexes, get_sell_timing,
+                              grouped_histogram, range_histogram, rollup_cube)
+
+## --- message show_figure sends, private to Streamlit: st.plotly_chart is used where it is gone
+try:
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+except ImportError:
+    PlotlyChartProto = None
+
+
+## --- colors of the histogram groups, the plotly express default sequence
+HISTOGRAM_COLORS = px.colors.qualitative.Plotly
+
+## --- default attribute of the distribution plot, and bins of the physical attributes histograms when all are shown
+DIST_DEFAULT = 'to_renovate'
+PHYSICAL_BINS = {'bedrooms': 17, 'bathrooms': 10, 'floors': 10, 'waterfront': 5}
+
+## --- the config st.plotly_chart sends by default
+PLOTLY_CONFIG = json.dumps({'showLink': False, 'linkText': False})
+
+
+def figure_json(fig):
+    """
+        Serialize a plotly figure the way st.plotly_chart does.
+
+        Returns: str
+    """
+    return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def show_figure(spec, container=None, use_container_width=True):
+    """
+        Send a figure serialized by figure_json to the browser, like
+        st.plotly_chart but without validating and serializing it again.
+        This goes through Streamlit internals (the PlotlyChart message and
+        DeltaGenerator._enqueue); where they are missing, the figure is
+        passed to st.plotly_chart instead.
+
+        Inputs: spec: str
+                The serialized figure.
+
+                container: Streamlit container, optional
+                Where to draw the figure, by default the current one.
+    """
+    record_sent('plotly_chart', spec)
+    dg = container if container is not None else getattr(st, '_main', None)
+
+    if PlotlyChartProto is not None and hasattr(dg, '_enqueue'):
+        proto = PlotlyChartProto()
+        proto.use_container_width = use_container_width
+        proto.figure.spec = spec
+        proto.figure.config = PLOTLY_CONFIG
+        ## --- newer Streamlit versions apply their theme to figures by default
+        if 'theme' in proto.DESCRIPTOR.fields_by_name:
+            proto.theme = 'streamlit'
+        try:
+            return dg._enqueue('plotly_chart', proto)
+        except TypeError:
+            pass
+
+    return (container if container is not None else st).plotly_chart(json.loads(spec),
+                                                                      use_container_width=use_container_width)
+
+
+def histogram_figure(values, groups=None, nbins=30, box=False, x_title=None, group_title=None):
+    """
+        Build a histogram figure from counts computed on the server, so the
+        figure holds one bar per bin and group instead of one value per row
+        and its size does not depend on the number of rows.
+
+        Inputs: values, groups, nbins: see grouped_histogram
+
+                box: bool, optional
+                Draw a box plot of each group above the histogram, like the
+                marginal='box' option of px.histogram. Outliers are not drawn.
+
+                x_title, group_title: str, optional
+                Titles of the x axis and of the legend.
+
+        Returns: plotly Figure
+    """
+    edges, labels, counts, codes, values = grouped_histogram(values, groups, nbins)
+    boxes = box_stats(values, codes, len(labels)) if box else None
+
+    return draw_histogram(edges, labels, counts, boxes, x_title, group_title)
+
+
+def draw_histogram(edges, labels, counts, boxes=None, x_title=None, group_title=None):
+    """
+        Draw binned counts as bars, one trace per group, with a horizontal
+        box plot of each group above them when boxes are given.
+
+        Inputs: edges, labels, counts: see grouped_histogram
+
+                boxes: list of dict, optional
+                Box plot statistics of each group, see box_stats. Groups
+                whose statistics are None get no box.
+
+        Returns: plotly Figure
+    """
+    centers, widths = (edges[:-1] + edges[1:]) / 2., np.diff(edges)
+    box = boxes is not None
+
+    if box:
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.26, 0.74], vertical_spacing=0.03)
+        position = {'row': 2, 'col': 1}
+    else:
+        fig = go.Figure()
+        position = {}
+
+    for group, label in enumerate(labels):
+        color = HISTOGRAM_COLORS[group % len(HISTOGRAM_COLORS)]
+        name = str(label) if label is not None else x_title
+        fig.add_trace(go.Bar(x=centers, y=counts[group], width=widths, name=name, marker_color=color,
+                             legendgroup=name, showlegend=label is not None), **position)
+
+    if box:
+        for group, stats in enumerate(boxes):
+            if stats is None:
+                continue
+            name = str(labels[group]) if labels[group] is not None else x_title
+            fig.add_trace(go.Box(y=[name], orientation='h', name=name, legendgroup=name, showlegend=False,
+                                 marker_color=HISTOGRAM_COLORS[group % len(HISTOGRAM_COLORS)],
+                                 **{key: [value] for key, value in stats.items()}), row=1, col=1)
+        fig.update_yaxes(showticklabels=False, row=1, col=1)
+
+    fig.update_layout(barmode='relative', bargap=0, legend_title_text=group_title)
+    fig.update_xaxes(title_text=x_title, **position)
+    fig.update_yaxes(title_text='count', **position)
+
+    return fig
+
+
+@cache_figure
+@count_runs
+def dist_renv_figure(data, atts):
+    ## --- the selected attributes are binned together, on shared edges
+    atts = list(atts)
+    values = np.concatenate([np.asarray(data[att], dtype=np.float64) for att in atts]) if atts else np.empty(0)
+    groups = pd.Categorical.from_codes(np.repeat(np.arange(len(atts)), len(data)), atts)
+
+    return figure_json(histogram_figure(values, groups, x_title='value', group_title='variable'))
+
+
+def display_dist_renv(data, atts):
+    show_figure(dist_renv_figure(data, list(atts)))
+
+    return None
+
+
+@cache_figure
+@count_runs
+def yrbuilt_figure(data, f_yr_built):
+    ## --- average price per year built in the range, from prefix sums
+    years, prices = get_range_indexes(data)['yr_built'].key_means(f_yr_built[0], f_yr_built[1])
+    data_yr = pd.DataFrame({'yr_built': years, 'price': prices})
+
+    yr_built_plot = px.line(data_yr, x='yr_built', y='price',
+                            labels={'price': 'Average Price (USD)', 'yr_built': 'Year of Construction'})
+
+    return figure_json(yr_built_plot)
+
+
+def yrbuilt_bounds(data):
+    return tuple(int(year) for year in get_range_indexes(data)['yr_built'].bounds())
+
+
+def display_price_yrbuilt(data):
+    ## --- Filtering by yr_built
+    min_yr_built, max_yr_built = yrbuilt_bounds(data)
+
+    f_yr_built = st.sidebar.slider('Select year built range', min_yr_built, max_yr_built, (min_yr_built, max_yr_built))
+
+    st.header('Average Price per Year Built')
+    st.markdown(
+        'How prices vary according to the year houses were built. You can filter the horizontal axis range using the commercial options in the sidebar.')
+    show_figure(yrbuilt_figure(data, tuple(f_yr_built)))
+
+    return None
+
+
+@cache_figure
+@count_runs
+def season_figure(season_cube):
+    ## --- rolling the zipcode x year x season cube up to year and season
+    data_season = cube_means(rollup_cube(season_cube, ['year', 'season']))[['price']].reset_index()
+
+    season_plot = px.histogram(data_season, x='year', y='price', color='season', barmode='group',
+                               labels={'year': 'Year', 'season': 'Season'}).update_yaxes(
+        {'title': 'Average Price (USD)'})
+
+    return figure_json(season_plot)
+
+
+def display_price_season(season_cube):
+    st.header('Average Price per Meteorological Season')
+    st.markdown('The bar chart below shows how average prices vary according to seasons from 2014 to 2015.')
+    show_figure(season_figure(season_cube))
+
+
+@cache_figure
+@count_runs
+def isold_figure(data):
+    ## --- selecting average prices
+    data_isold = data[['price', 'old']].groupby('old').mean().reset_index()
+    perc_dif = (abs(data_isold.iloc[0]['price'] - data_isold.iloc[1]['price']) / data_isold.iloc[1]['price']) * 100.
+
+    isold_plot = px.bar(data_isold, x='old', y='price', labels={'price': 'Average Price (USD)', 'old': ''})
+    isold_plot.update_layout(xaxis=dict(tickmode='array',
+                                        tickvals=[0, 1],
+                                        ticktext=['New Houses', 'Old Houses']))
+
+    return (figure_json(isold_plot), str(round(perc_dif, 2)))
+
+
+def display_price_isold(data):
+    isold_plot, perc_dif = isold_figure(data)
+
+    st.header('Average Price for New and Old Houses')
+    st.markdown('From the bar plot below we can see that the average price for new houses deviates {}% relatively '
+                'from the average price of old houses.'.format(perc_dif))
+    show_figure(isold_plot)
+    return None
+
+
+@cache_figure
+@count_runs
+def basement_figures(data):
+    ## --- selecting average price and average total area according to basement
+    data_basement = data[['price', 'sqft_basement', 'sqft_lot']]
+    data_basement['sqft_basement'] = data_basement['sqft_basement'].apply(lambda x: 1 if x > 0 else 0).astype(np.int64)
+    data_basement = data_basement.groupby('sqft_basement').mean().reset_index()
+
+    perc_dif_price = (abs(data_basement.iloc[0]['price'] - data_basement.iloc[1]['price']) / data_basement.iloc[1][
+        'price']) * 100
+    perc_dif_price = str(round(perc_dif_price, 2))
+
+    perc_dif_area = (abs(data_basement.iloc[0]['sqft_lot'] - data_basement.iloc[1]['sqft_lot']) / data_basement.iloc[1][
+        'sqft_lot']) * 100
+    perc_dif_area = str(round(perc_dif_area, 2))
+
+    basement_plot_price = px.bar(data_basement, x='sqft_basement', y='price', labels={'price': 'Average Price (USD)',
+                                                                                      'sqft_basement': ''})
+    basement_plot_price.update_layout(xaxis=dict(tickmode='array',
+                                                 tickvals=[0, 1],
+                                                 ticktext=['No Basement', 'Has Basement']))
+
+    basement_plot_area = px.bar(data_basement, x='sqft_basement', y='sqft_lot',
+                                labels={'sqft_lot': 'Average square footage lot',
+                                        'sqft_basement': ''})
+    basement_plot_area.update_layout(xaxis=dict(tickmode='array',
+                                                tickvals=[0, 1],
+                                                ticktext=['No Basement', 'Has Basement']))
+
+    return (figure_json(basement_plot_price), figure_json(basement_plot_area), perc_dif_price, perc_dif_area)
+
+
+def display_price_basement(data):
+    basement_plot_price, basement_plot_area, perc_dif_price, perc_dif_area = basement_figures(data)
+
+    st.header('Average Price and Average Total Area vs Basement')
+    st.markdown(
+        'As we can see from the bar plot below, houses having no basement are {}% cheaper on average. Furthermore, these houses are, on average, '
+        '{}% bigger considering their total area.'.format(perc_dif_price, perc_dif_area))
+    ca, cb = st.columns((1, 1))
+    with ca:
+        show_figure(basement_plot_price, ca)
+    with cb:
+        show_figure(basement_plot_area, cb)
+
+    return None
+
+
+@cache_figure
+@count_runs
+def waterfront_figure(data):
+    ## --- selecting average price accordin to waterfront
+    data_waterfront = data[['price', 'waterfront']].groupby('waterfront').mean().reset_index()
+
+    perc_dif_price = (abs(data_waterfront.iloc[0]['price'] - data_waterfront.iloc[1]['price']) /
+                      data_waterfront.iloc[0]['price']) * 100
+    perc_dif_price = str(round(perc_dif_price, 2))
+
+    price_plot = px.bar(data_waterfront, x='waterfront', y='price', labels={'price': 'Average Price (USD)',
+                                                                            'waterfront': ''})
+    price_plot.update_layout(xaxis=dict(tickmode='array',
+                                        tickvals=[0, 1],
+                                        ticktext=['No Waterfront', 'Waterfront View']))
+
+    return (figure_json(price_plot), perc_dif_price)
+
+
+def display_price_waterfront(data):
+    price_plot, perc_dif_price = waterfront_figure(data)
+
+    st.header('Average Price vs Waterfront View')
+    st.markdown(
+        'This bar plot tells us that houses having a waterfront view cost {}% more, on average.'.format(perc_dif_price))
+    show_figure(price_plot)
+
+    return None
+
+
+@cache_figure
+@count_runs
+def date_figure(data, f_date):
+    ## --- average price per day in the range, from prefix sums
+    index = get_range_indexes(data)['date']
+    days, prices = index.key_means(pd.Timestamp(f_date[0]).to_datetime64(), pd.Timestamp(f_date[1]).to_datetime64())
+    data_dt = pd.DataFrame({'date': days, 'price': prices})
+
+    return figure_json(px.line(data_dt, x='date', y='price'))
+
+
+def date_bounds(data):
+    return tuple(pd.Timestamp(day).date() for day in get_range_indexes(data)['date'].bounds())
+
+
+def display_price_date(data):
+    ## --- Filtering by date
+    min_date, max_date = date_bounds(data)
+
+    f_date = st.sidebar.slider('Select date range', min_date, max_date, (min_date, max_date))
+
+    st.header('Daily Price Evolution')
+    st.markdown(
+        'Daily price variation according to the date of registration. You can filter the horizontal axis range using the commercial options in the sidebar.')
+    show_figure(date_figure(data, tuple(f_date)))
+
+    return None
+
+
+def price_dist_groups(data, f_zipcode):
+    """
+        Return the range index, groups and labels of the price histogram:
+        one group per selected zipcode having sales, or the whole dataset.
+    """
+    indexes = get_range_indexes(data)
+    codes = indexes['zipcodes'].get_indexer(f_zipcode)
+    codes = [code for code in codes if code >= 0 and indexes['price_zipcode'].bounds(code) is not None]
+
+    if codes:
+        index, groups, labels = indexes['price_zipcode'], codes, indexes['zipcodes'][codes].values
+    else:
+        index, groups, labels = indexes['price'], [0], np.array([None])
+
+    return (index, groups, labels)
+
+
+@cache_figure
+@count_runs
+def price_dist_figure(data, f_zipcode, f_price):
+    ## --- binned by binary search on sorted prices, only the bars and the box plot quartiles are sent to the browser
+    index, groups, labels = price_dist_groups(data, f_zipcode)
+    edges, counts, boxes = range_histogram(index, groups, f_price[0], f_price[1])
+
+    return figure_json(draw_histogram(edges, labels, counts, boxes, x_title='price', group_title='zipcode'))
+
+
+def price_bounds(data, f_zipcode):
+    index, groups, _ = price_dist_groups(data, f_zipcode)
+    bounds = [index.bounds(group) for group in groups]
+
+    return (int(np.floor(min(low for low, _ in bounds))), int(np.ceil(max(high for _, high in bounds))))
+
+
+def display_price_dist(data, cube):
+    ## --- Price distribution
+
+    f_zipcode = st.sidebar.multiselect('Select zip codes to display prices distribution',
+                                       options=cube.index.values)
+
+    min_price, max_price = price_bounds(data, f_zipcode)
+
+    f_price = st.sidebar.slider('Select price range', min_price, max_price, (min_price, max_price))
+
+    st.header('Prices Distribution')
+    st.markdown(
+        'An histogram showing how prices are distributed in the dataset. You can adjust the horizontal axis range using the commercial options in the sidebar.')
+    show_figure(price_dist_figure(data, tuple(f_zipcode), tuple(f_price)))
+
+    return None
+
+
+def display_phys_radio():
+    st.sidebar.title('Physical Attributes')
+
+    phys_opt = st.sidebar.radio('Select one of the following options to display attributes plots:',
+                                options=('1 - Houses per bedrooms',
+                                         '2 - Houses per bathrooms',
+                                         '3 - Houses per floors',
+                                         '4 - Houses per waterfront view',
+                                         '5 - Show all'),
+                                index=4)
+
+    phys_opt = int(phys_opt.split('-')[0].strip())
+
+    return phys_opt
+
+
+@cache_figure
+@count_runs
+def att_hist_figure(data, col, nbins=30):
+    return figure_json(histogram_figure(data[col], nbins=nbins, x_title=col))
+
+
+def display_att_hist(data, col, nbins=30):
+    show_figure(att_hist_figure(data, col, nbins))
+
+    return None
+
+
+@cache_figure
+@count_runs
+def sell_timing_figure(data):
+    ## --- price index of each zipcode and month, 1 being the zipcode average
+    timing = get_sell_timing(data)
+    timing_plot = go.Figure(go.Heatmap(z=timing['month'].index[:-1], x=MONTH_NAMES, y=timing['zipcodes'].astype(str),
+                                       colorscale='RdYlGn', colorbar={'title': 'Index'}))
+    timing_plot.update_layout(yaxis={'type': 'category', 'title': 'Zipcode'}, height=900)
+
+    return figure_json(timing_plot)
+
+
+def display_sell_timing(data):
+    st.header('When to Sell')
+    st.markdown('The heatmap below shows, for each zipcode, the average price per sqft of each month relative to the '
+                'zipcode average (1 is the average). Months with few sales lean toward the county index. '
+                'The table next to it gives the best month to sell each house and the price expected then.')
+    show_figure(sell_timing_figure(data))
+
+    return None
+
+
+def warm_figures(data, season_cube):
+    """
+        Build the figures of a first visit, every filter at its default, so
+        that they are read from the figure cache by the sessions.
+
+        Returns: int
+                 Number of figures built or found.
+    """
+    builds = [(dist_renv_figure, (data, [DIST_DEFAULT])),
+              (yrbuilt_figure, (data, yrbuilt_bounds(data))),
+              (date_figure, (data, date_bounds(data))),
+              (price_dist_figure, (data, (), price_bounds(data, ()))),
+              (isold_figure, (data,)),
+              (basement_figures, (data,)),
+              (waterfront_figure, (data,)),
+              (season_figure, (season_cube,)),
+              (sell_timing_figure, (data,))]
+    ## --- the physical attributes histograms, shown alone or all together
+    builds += [(att_hist_figure, (data, col, nbins)) for col in PHYSICAL_BINS for nbins in (30, PHYSICAL_BINS[col])]
+
+    for func, args in builds:
+        func(*args)
+
+    return len(builds)
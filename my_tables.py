@@ -0,0 +1,70 @@
+"""
+    Paginated tables of the dashboard: rows are sorted, filtered and paged on
+    the server by my_methods.py, and only the current page is sent.
+"""
+import streamlit as st
+import pandas    as pd
+
+from my_methods import PAGE_SIZE, column_bounds, table_page, table_rows
+
+
+def display_table(data, key, columns=None, page_size=PAGE_SIZE):
+    """
+        Show a table one page at a time. Sorting and filtering run on the
+        server over the columns of data, see table_rows, and only the rows
+        of the current page are copied and sent to the browser, so the
+        payload does not grow with the number of rows.
+
+        Inputs: data: pandas DataFrame
+
+                key: str
+                Prefix of the widget keys, unique per table.
+
+                columns: list, optional
+                Columns to show, by default all of them.
+
+                page_size: int, optional
+
+        Returns: DataFrame
+                 The page sent.
+    """
+    columns = list(data.columns) if columns is None else list(columns)
+    numerical = [col for col in columns if pd.api.types.is_numeric_dtype(data[col])]
+    label = lambda col: '-' if col is None else col
+
+    with st.expander('Sort and filter'):
+        c1, c2, c3 = st.columns((2, 1, 2))
+        sort_by = c1.selectbox('Sort by', options=[None] + columns, format_func=label, key=key + '_sort')
+        ascending = c2.radio('Order', options=(True, False), key=key + '_ascending',
+                             format_func=lambda x: 'ascending' if x else 'descending')
+        filter_col = c3.selectbox('Filter on', options=[None] + numerical, format_func=label, key=key + '_filter')
+
+        filters = ()
+        if filter_col is not None:
+            low, high, missing = column_bounds(data, filter_col)
+            if low is None:
+                c3.caption('No values of {} to filter on.'.format(filter_col))
+            else:
+                if low < high:
+                    low, high = c3.slider('Range of ' + filter_col, min_value=low, max_value=high, value=(low, high),
+                                          key=key + '_range_' + filter_col)
+                ## --- rows without a value are kept unless asked otherwise, so picking a column alone drops no row
+                keep_missing = missing > 0 and c3.checkbox('Keep the {} rows without {}'.format(missing, filter_col),
+                                                           value=True, key=key + '_missing_' + filter_col)
+                filters = ((filter_col, low, high, keep_missing),)
+
+    rows = table_rows(data, sort_by, ascending, filters)
+    n_pages = max(-(-len(rows) // page_size), 1)
+
+    ## --- filtering may leave fewer pages than the one shown
+    page_key = key + '_page'
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+    page = st.number_input('Page (of {})'.format(n_pages), min_value=1, max_value=n_pages, step=1, key=page_key)
+
+    to_show = table_page(data, columns, rows, page, page_size)
+    st.dataframe(to_show)
+    st.caption('Rows {} to {} of {}'.format(min((page - 1) * page_size + 1, len(rows)),
+                                            min(page * page_size, len(rows)), len(rows)))
+
+    return to_show
@@ -0,0 +1,147 @@
+import numpy as np
+
+
+class SortedIndex:
+    """
+        Sorted index with prefix sums over a key column, answering range
+        filters by binary search.
+
+        Rows are sorted by group and then by key, so the rows of a group with
+        keys in a range are one contiguous slice, found in O(log n). Prefix
+        sums of the values give the count, sum and mean of any such slice in
+        O(log n), and the mean value of each distinct key of the slice in
+        O(log n + distinct keys).
+
+        Inputs: keys: array-like
+                Sortable key of each row, e.g. dates, years or prices.
+
+                values: array-like, optional
+                Numerical value of each row, by default the keys.
+
+                groups: array-like of int, optional
+                Group code of each row in [0, n_groups), e.g. categorical
+                codes. All rows form group 0 if None.
+
+                n_groups: int, optional
+                Number of groups, by default the largest code plus one.
+    """
+
+    def __init__(self, keys, values=None, groups=None, n_groups=None):
+        keys = np.asarray(keys)
+        values = np.asarray(keys if values is None else values, dtype=np.float64)
+        groups = np.zeros(len(keys), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+        n_groups = int(groups.max()) + 1 if n_groups is None and len(groups) else (n_groups or 1)
+
+        self.order = np.lexsort((keys, groups))
+        self.keys = keys[self.order]
+        self.values = values[self.order]
+        self.prefix = np.concatenate([[0.], np.cumsum(self.values)])
+
+        groups = groups[self.order]
+        self.offsets = np.searchsorted(groups, np.arange(n_groups + 1))
+
+        ## --- first row of each run of equal keys within a group
+        new = np.ones(len(keys), dtype=bool)
+        new[1:] = (self.keys[1:] != self.keys[:-1]) | (groups[1:] != groups[:-1])
+        self.starts = np.flatnonzero(new)
+
+    def __len__(self):
+        return len(self.order)
+
+    def _search(self, keys, values, side):
+        """
+            np.searchsorted with the values cast to the dtype of the keys:
+            searching values of another dtype would convert all the keys.
+        """
+        values = np.asarray(values)
+        if self.keys.dtype.kind not in 'iu':
+            return np.searchsorted(keys, values.astype(self.keys.dtype), side=side)
+
+        ## --- integer keys: key >= low is key >= ceil(low), key <= high is key <= floor(high)
+        limits = np.iinfo(self.keys.dtype)
+        values = np.ceil(values) if side == 'left' else np.floor(values)
+        ## --- float(limits.max) may round up past the largest key (2 ** 63 for int64), compare to the next power of two
+        below, above = values < limits.min, values >= float(limits.max) + 1
+        found = np.searchsorted(keys, np.where(below | above, 0, values).astype(self.keys.dtype), side=side)
+
+        return np.where(below, 0, np.where(above, len(keys), found))
+
+    def span(self, low, high, group=0):
+        """
+            Return the (start, stop) positions in sorted order of the rows of
+            group with low <= key <= high.
+        """
+        first, last = self.offsets[group], self.offsets[group + 1]
+        keys = self.keys[first:last]
+
+        return (first + int(self._search(keys, low, 'left')), first + int(self._search(keys, high, 'right')))
+
+    def bounds(self, group=0):
+        """
+            Return the lowest and highest keys of group, None if it is empty.
+        """
+        first, last = self.offsets[group], self.offsets[group + 1]
+        if first == last:
+            return None
+
+        return (self.keys[first], self.keys[last - 1])
+
+    def count(self, low, high, group=0):
+        start, stop = self.span(low, high, group)
+        return stop - start
+
+    def sum(self, low, high, group=0):
+        start, stop = self.span(low, high, group)
+        return self.prefix[stop] - self.prefix[start]
+
+    def mean(self, low, high, group=0):
+        start, stop = self.span(low, high, group)
+        return (self.prefix[stop] - self.prefix[start]) / (stop - start) if stop > start else np.nan
+
+    def key_means(self, low, high, group=0):
+        """
+            Return the distinct keys of group between low and high and the
+            mean value of the rows of each key.
+        """
+        start, stop = self.span(low, high, group)
+        runs = self.starts[np.searchsorted(self.starts, start):np.searchsorted(self.starts, stop)]
+        edges = np.append(runs, stop)
+
+        return (self.keys[runs], (self.prefix[edges[1:]] - self.prefix[edges[:-1]]) / np.diff(edges))
+
+    def histogram(self, low, high, edges, group=0):
+        """
+            Count the keys of group between low and high in the bins given by
+            edges, the last bin being closed like in np.histogram.
+        """
+        start, stop = self.span(low, high, group)
+        keys = self.keys[start:stop]
+
+        positions = self._search(keys, edges, 'left')
+        positions[-1] = self._search(keys, edges[-1], 'right')
+
+        return np.diff(positions)
+
+    def box_stats(self, low, high, group=0):
+        """
+            Quartiles and Tukey fences (the farthest keys within 1.5 IQR of
+            the quartiles) of the keys of group between low and high, read
+            from sorted positions, and the mean value of these rows. None if
+            no key is in the range.
+        """
+        start, stop = self.span(low, high, group)
+        keys = self.keys[start:stop]
+        if len(keys) == 0:
+            return None
+
+        ## --- linear interpolation between closest ranks, like np.percentile
+        ranks = np.array([0.25, 0.5, 0.75]) * (len(keys) - 1)
+        below = np.floor(ranks).astype(np.int64)
+        above = np.minimum(below + 1, len(keys) - 1)
+        q1, median, q3 = keys[below] + (keys[above] - keys[below]) * (ranks - below)
+
+        lowerfence = keys[self._search(keys, q1 - 1.5 * (q3 - q1), 'left')]
+        upperfence = keys[self._search(keys, q3 + 1.5 * (q3 - q1), 'right') - 1]
+
+        return {'q1': q1, 'median': median, 'q3': q3, 'lowerfence': lowerfence, 'upperfence': upperfence,
+                'mean': (self.prefix[stop] - self.prefix[start]) / (stop - start)}
@@ -0,0 +1,189 @@
+"""
+    Run the flipping analysis of the dashboard without Streamlit, over one or
+    many sales csv files, and write for each of them:
+
+        opportunities.<format>  houses to buy, as in Business Opportunities
+        sell_timing.<format>    best month to sell each of them, and the
+                                price and profit expected then
+        repeat_sales.<format>   consecutive sales of the houses sold more
+                                than once, with holding period and
+                                appreciation
+        repeat_index.<format>   monthly repeat-sales price index by zipcode
+        zipcodes.<format>       averaged values by zipcode
+        comparisons.<format>    average prices for old/new houses, basement
+                                and waterfront view
+        summary.json            total profit, investment, expenditure and
+                                percent, and the row counts
+
+    under <output>/<name>/, where name is the path of the file without its
+    extension, relative to the folder holding all the inputs (e.g.
+    north/sales and south/sales), plus <output>/summary.json listing every
+    input. Files are processed in parallel by a pool of processes, or, with
+    --shard-workers, one after the other with the aggregates and scoring of
+    each file sharded by zipcode over a pool of processes (see sharding.py),
+    which suits a few very large files.
+
+    Usage: python report.py data/*.csv [--output reports] [--format parquet]
+                                       [--jobs 4 | --shard-workers 8] [--cache-dir .cache]
+                                       [--comps-k 0] [--markup 1.3] ...
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses        import asdict, fields
+
+FORMATS = ('parquet', 'csv', 'json')
+
+
+def write_table(data, path, fmt):
+    """
+        Write a DataFrame as parquet, csv or json records.
+    """
+    if fmt == 'parquet':
+        data.to_parquet(path)
+    elif fmt == 'csv':
+        data.to_csv(path)
+    else:
+        data.reset_index().to_json(path, orient='records', date_format='iso', indent=1)
+
+
+def report_names(inputs):
+    """
+        Name the output folder of each input after its path without the
+        extension, relative to the folder holding all of them, so files
+        sharing a name in different folders get different outputs.
+
+        Returns: dict
+                 Input path -> folder name.
+
+        Raises ValueError when two inputs would still share a folder, e.g.
+        sales.csv and sales.CSV.
+    """
+    paths = [os.path.abspath(path) for path in inputs]
+    common = os.path.commonpath([os.path.dirname(path) for path in paths])
+    names = {path: os.path.splitext(os.path.relpath(full, common))[0] for path, full in zip(inputs, paths)}
+
+    folders = {}
+    for path, name in names.items():
+        folders.setdefault(os.path.normcase(name), []).append(path)
+    clashes = [paths for paths in folders.values() if len(paths) > 1]
+    if clashes:
+        raise ValueError('inputs sharing an output folder: ' + '; '.join(', '.join(paths) for paths in clashes))
+
+    return names
+
+
+def run_report(path, output, fmt='parquet', cache_dir='.cache', config=None, shard_workers=0, name=None):
+    """
+        Run the analysis over one csv file and write its outputs to
+        <output>/<name>, by default the file name without extension (see
+        report_names). With shard_workers, the cubes and the opportunities
+        are computed by sharded_analysis over that many processes.
+
+        Returns: dict
+                 The summary of the file, with an error message instead of
+                 the results if the file could not be processed.
+    """
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    import my_methods as mm
+
+    config = config or mm.FlipConfig()
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    start = time.perf_counter()
+
+    try:
+        data, mute = mm.load_dataset(path, cache_dir)
+        if mute == 0:
+            raise ValueError('the file could not be read or cleaned')
+
+        if shard_workers:
+            from sharding import sharded_analysis
+            zip_cube, _, opportunities = sharded_analysis(data, config, shard_workers)
+        else:
+            zip_cube, _ = mm.get_cubes(data)
+            index = mm.get_spatial_index(data) if config.comps_k > 0 else None
+            opportunities = mm.display_houses_tobuy(data, zip_cube, config, index)
+        to_buy, tot_inv, tot_exp, perct, tot_prof = opportunities
+        zipcodes, _ = mm.display_data_averaged(zip_cube, [])
+        timed, tot_timed = mm.sell_timing_table(to_buy, mm.get_sell_timing(data))
+        history, _ = mm.load_sales(path, cache_dir)
+        pairs, repeat = mm.repeat_sales_table(history), mm.get_repeat_index(history)
+
+        folder = os.path.join(output, name)
+        os.makedirs(folder, exist_ok=True)
+        write_table(to_buy, os.path.join(folder, 'opportunities.' + fmt), fmt)
+        write_table(timed, os.path.join(folder, 'sell_timing.' + fmt), fmt)
+        write_table(pairs, os.path.join(folder, 'repeat_sales.' + fmt), fmt)
+        write_table(mm.repeat_index_table(repeat), os.path.join(folder, 'repeat_index.' + fmt), fmt)
+        write_table(zipcodes.set_index('Zipcode'), os.path.join(folder, 'zipcodes.' + fmt), fmt)
+        write_table(mm.price_comparisons(data), os.path.join(folder, 'comparisons.' + fmt), fmt)
+
+        summary = {'input': path, 'output': name, 'houses': len(data), 'opportunities': len(to_buy),
+                   'total_profit': float(tot_prof), 'total_investment': float(tot_inv),
+                   'total_expenditure': float(tot_exp), 'profit_pct': float(perct),
+                   'timed_profit': float(tot_timed), 'repeat_sales': len(pairs),
+                   'config': asdict(config), 'seconds': time.perf_counter() - start}
+        with open(os.path.join(folder, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+    except Exception as error:
+        summary = {'input': path, 'output': name, 'error': '{}: {}'.format(type(error).__name__, error),
+                   'traceback': traceback.format_exc(), 'seconds': time.perf_counter() - start}
+
+    return summary
+
+
+def main(argv=None):
+    from my_methods import FlipConfig
+
+    parser = argparse.ArgumentParser(description='Write the flipping analysis of sales csv files.')
+    parser.add_argument('inputs', nargs='+', help='sales csv files, formatted like kc_house_data.csv')
+    parser.add_argument('--output', default='reports', help='directory receiving one folder per input')
+    parser.add_argument('--format', choices=FORMATS, default='parquet', help='format of the tables')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--shard-workers', type=int, default=0,
+                        help='process the files one by one, each sharded by zipcode over this many processes')
+    parser.add_argument('--cache-dir', default='.cache', help='directory of the cleaned Feather files')
+    for field in fields(FlipConfig):
+        parser.add_argument('--' + field.name.replace('_', '-'), type=field.type, default=field.default,
+                            help='see FlipConfig (default: {})'.format(field.default))
+    args = parser.parse_args(argv)
+
+    config = FlipConfig(**{field.name: getattr(args, field.name) for field in fields(FlipConfig)})
+    inputs = sorted(set(args.inputs))
+    try:
+        names = report_names(inputs)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.shard_workers:
+        summaries = [run_report(path, args.output, args.format, args.cache_dir, config, args.shard_workers,
+                                names[path]) for path in inputs]
+    else:
+        with ProcessPoolExecutor(max_workers=max(min(args.jobs, len(inputs)), 1)) as pool:
+            summaries = list(pool.map(run_report, inputs, [args.output] * len(inputs), [args.format] * len(inputs),
+                                      [args.cache_dir] * len(inputs), [config] * len(inputs),
+                                      [0] * len(inputs), [names[path] for path in inputs]))
+
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, 'summary.json'), 'w') as f:
+        json.dump(summaries, f, indent=2)
+
+    for summary in summaries:
+        if 'error' in summary:
+            print('FAILED  {}  {}'.format(summary['input'], summary['error']))
+        else:
+            print('{:<40} {:>7} houses {:>6} to buy  profit {:>16,.2f} USD ({:.2f}%)'.format(
+                summary['output'], summary['houses'], summary['opportunities'], summary['total_profit'],
+                summary['profit_pct']))
+
+    return 1 if any('error' in summary for summary in summaries) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+"""
+    Every sale of every property, indexed by id, and the repeat-sales price
+    index per zipcode built from the properties sold more than once.
+"""
+import numpy  as np
+import pandas as pd
+
+
+def arrange_sales(data, feat='id'):
+    """
+        Order sales the way SaleHistory keeps them: the latest sale of each
+        id first, in file order (the rows hand_nonunique keeps), then the
+        earlier sales sorted by id and date.
+
+        Returns: (DataFrame, int)
+                 The arranged sales with a fresh RangeIndex, and the number
+                 of ids.
+    """
+    latest = ~data.duplicated(subset=feat, keep='last').values
+    earlier = data[~latest].sort_values([feat, 'date'], kind='mergesort')
+
+    return (pd.concat([data[latest], earlier]).reset_index(drop=True), int(latest.sum()))
+
+
+def concat_sales(data, batch):
+    """
+        Append batch to data, extending the categories of their categorical
+        columns so that these stay categorical.
+    """
+    batch = batch.copy()
+    data = data.copy(deep=False)
+    for col in data.select_dtypes(include='category').columns:
+        categories = data[col].cat.categories.union(pd.Index(batch[col].unique()))
+        data[col] = data[col].cat.set_categories(categories)
+        batch[col] = pd.Categorical(batch[col], categories=categories)
+
+    return pd.concat([data, batch], ignore_index=True)
+
+
+class SaleHistory:
+    """
+        Sale history store in CSR form. The sales are kept once, arranged by
+        arrange_sales, so the latest sale of each property is a slice of the
+        first rows and the dashboard view costs no copy. The index is built
+        on first use:
+
+            ids      sorted ids of the properties
+            rows     rows of the sales, property after property, each
+                     property's sales from the oldest to the latest
+            offsets  sales of the property ids[k] are rows[offsets[k]:offsets[k + 1]]
+
+        Besides the sales, it holds 4 bytes per sale and 16 per property.
+
+        Inputs: sales: pandas DataFrame
+                Sales arranged by arrange_sales.
+
+                n_latest: int
+                Number of properties, i.e. of latest sales at the top of sales.
+    """
+
+    def __init__(self, sales, n_latest):
+        self.sales, self.n_latest = sales, n_latest
+        self._index = None
+
+    def __len__(self):
+        return self.n_latest
+
+    def appended(self, batch):
+        """
+            Return a new SaleHistory holding these sales and a batch of
+            later ones, with every sale of the batch kept: the sales the
+            batch replaces as the latest of an id move to the earlier
+            sales. The store itself is left unchanged, as it may be shared.
+
+            Inputs: batch: pandas DataFrame
+                    Cleaned sales (clean_data with keep_history) with the
+                    columns of the stored sales, in file order.
+        """
+        ## --- back in an order where the last sale of each id comes last, for arrange_sales
+        order = np.r_[self.n_latest:len(self.sales), :self.n_latest]
+
+        return SaleHistory(*arrange_sales(concat_sales(self.sales.iloc[order], batch[list(self.sales.columns)])))
+
+    def latest(self):
+        """
+            Return the latest sale of each property, a view of the first rows.
+        """
+        return self.sales.iloc[:self.n_latest]
+
+    def index(self):
+        """
+            Return (ids, rows, offsets), built on the first call.
+        """
+        if self._index is None:
+            ids = np.asarray(self.sales['id'], dtype=np.int64)
+            order = np.argsort(ids[:self.n_latest], kind='stable')
+            sorted_ids = ids[:self.n_latest][order]
+
+            ## --- earlier sales are sorted by id already: each one moves down by the latest sales of the ids before it
+            ranks = np.searchsorted(sorted_ids, ids[self.n_latest:])
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(ranks, minlength=self.n_latest) + 1)])
+
+            rows = np.empty(len(ids), dtype=np.int32 if len(ids) < 2 ** 31 else np.int64)
+            rows[np.arange(len(ranks)) + ranks] = np.arange(self.n_latest, len(ids))
+            rows[offsets[1:] - 1] = order
+
+            self._index = (sorted_ids, rows, offsets)
+
+        return self._index
+
+    def positions(self, ids):
+        """
+            Return the position of each id in the sorted ids, -1 if unknown.
+        """
+        sorted_ids, _, _ = self.index()
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+
+        return np.where(sorted_ids[positions] == ids, positions, -1)
+
+    def history(self, house_id, columns=None):
+        """
+            Return every sale of a property, oldest first, with the given
+            (by default all) columns. Empty if the id is unknown.
+        """
+        _, rows, offsets = self.index()
+        sales = self.sales if columns is None else self.sales[columns]
+        position = int(self.positions([house_id])[0])
+        if position < 0:
+            return sales.iloc[:0]
+
+        return sales.iloc[rows[offsets[position]:offsets[position + 1]]]
+
+    def counts(self):
+        """
+            Return the number of sales of each property, in sorted id order.
+        """
+        return np.diff(self.index()[2])
+
+    def holdings(self):
+        """
+            Holding period and price appreciation of each property, from its
+            first to its latest sale. Both are NaN for properties sold once.
+
+            Returns: DataFrame
+                     Indexed by id: sales, first_date, last_date,
+                     holding_days and appreciation (latest price over the
+                     first one, minus 1).
+        """
+        sorted_ids, rows, offsets = self.index()
+        first, last = rows[offsets[:-1]], rows[offsets[1:] - 1]
+        dates = np.asarray(self.sales['date'], dtype='datetime64[ns]')
+        price = np.asarray(self.sales['price'], dtype=np.float64)
+        sales = np.diff(offsets)
+
+        repeated = sales > 1
+        days = (dates[last] - dates[first]) / np.timedelta64(1, 'D')
+
+        return pd.DataFrame({'sales': sales, 'first_date': dates[first], 'last_date': dates[last],
+                             'holding_days': np.where(repeated, days, np.nan),
+                             'appreciation': np.where(repeated, price[last] / price[first] - 1., np.nan)},
+                            index=pd.Index(sorted_ids, name='id'))
+
+    def repeat_sales(self):
+        """
+            Every pair of consecutive sales of a property.
+
+            Returns: DataFrame
+                     id, zipcode, buy_date, sell_date, buy_price, sell_price,
+                     holding_days and appreciation.
+        """
+        _, rows, offsets = self.index()
+
+        ## --- every sale but the first of each property closes a pair
+        sells = np.ones(len(rows), dtype=bool)
+        sells[offsets[:-1]] = False
+        sell, buy = rows[sells], rows[np.flatnonzero(sells) - 1]
+
+        dates = np.asarray(self.sales['date'], dtype='datetime64[ns]')
+        price = np.asarray(self.sales['price'], dtype=np.float64)
+
+        return pd.DataFrame({'id': np.asarray(self.sales['id'])[sell],
+                             'zipcode': np.asarray(self.sales['zipcode'])[sell],
+                             'buy_date': dates[buy], 'sell_date': dates[sell],
+                             'buy_price': price[buy], 'sell_price': price[sell],
+                             'holding_days': (dates[sell] - dates[buy]) / np.timedelta64(1, 'D'),
+                             'appreciation': price[sell] / price[buy] - 1.})
+
+
+class RepeatSalesIndex:
+    """
+        Repeat-sales price index of each group (e.g. zipcode) and period
+        (Bailey, Muth and Nourse, 1963). The log price ratio of each pair of
+        sales of a property is the index change between its periods:
+
+            log(sell price / buy price) = beta[sell period] - beta[buy period]
+
+        with beta = 0 in the first period, solved by least squares. Pairs are
+        few per group, so the betas of a group are shrunk toward the county
+        ones, as in TimingIndex, by a penalty of
+        prior * (beta - county beta) ** 2 for each period. An extra last row
+        holds the county index, used for unknown groups (code -1).
+
+        Inputs: groups: array-like of int
+                Group code of each pair in [0, n_groups).
+
+                buy_periods, sell_periods: array-like of int
+                Period codes of the two sales in [0, n_periods).
+
+                ratios: array-like
+                Sell price over buy price.
+
+                n_groups, n_periods: int, optional
+                By default the largest codes plus one.
+
+                prior: float, optional
+                Weight of the county index, in pairs, 5 by default.
+    """
+
+    def __init__(self, groups, buy_periods, sell_periods, ratios, n_groups=None, n_periods=None, prior=5.):
+        groups = np.asarray(groups, dtype=np.int64)
+        buy, sell = np.asarray(buy_periods, dtype=np.int64), np.asarray(sell_periods, dtype=np.int64)
+        logs = np.log(np.asarray(ratios, dtype=np.float64))
+        n_groups = int(groups.max()) + 1 if n_groups is None else n_groups
+        n_periods = int(max(buy.max(), sell.max())) + 1 if n_periods is None else n_periods
+
+        ## --- normal equations of every group: each pair adds x x' and x y, with x = +1 at sell and -1 at buy
+        gram = np.zeros((n_groups, n_periods, n_periods))
+        moment = np.zeros((n_groups, n_periods))
+        for i, j, sign in ((sell, sell, 1.), (buy, buy, 1.), (sell, buy, -1.), (buy, sell, -1.)):
+            np.add.at(gram, (groups, i, j), sign)
+        np.add.at(moment, (groups, sell), logs)
+        np.add.at(moment, (groups, buy), -logs)
+
+        ## --- the first period is the base, periods without pairs are pulled to no change by a tiny penalty
+        eye = np.eye(n_periods - 1)
+        county = np.zeros(n_periods)
+        county[1:] = np.linalg.solve(gram.sum(axis=0)[1:, 1:] + 1e-6 * eye, moment.sum(axis=0)[1:])
+
+        betas = np.zeros((n_groups, n_periods))
+        betas[:, 1:] = np.linalg.solve(gram[:, 1:, 1:] + prior * eye, (moment[:, 1:] + prior * county[1:])[..., None])[..., 0]
+
+        self.prior = prior
+        self.counts = np.append(np.bincount(groups, minlength=n_groups), len(groups))
+        self.index = np.exp(np.vstack([betas, county]))
+
+    def __len__(self):
+        return len(self.index) - 1
+
+    def rows(self, groups):
+        groups = np.asarray(groups, dtype=np.int64)
+        return np.where(groups < 0, len(self), groups)
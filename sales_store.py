@@ -0,0 +1,147 @@
+import hashlib
+import uuid
+
+import numpy  as np
+import pandas as pd
+
+from caching    import register_fingerprint, registered_fingerprint
+from my_methods import (FlipConfig, CACHE_SCHEMA, apply_schema, build_cube, clean_data, flip_inputs,
+                        flip_selection, hand_nonunique, opportunities_table)
+from sale_history import SaleHistory, concat_sales
+
+ZIP_KEYS = ('zipcode',)
+SEASON_KEYS = ('zipcode', 'year', 'season')
+
+
+def replace_groups(cube, partial, zipcodes):
+    """
+        Replace the groups of the given zipcodes of a cube by the groups of
+        partial, a cube built over the current rows of these zipcodes only.
+    """
+    kept = cube[~cube.index.get_level_values('zipcode').isin(zipcodes)]
+
+    return pd.concat([kept, partial]).sort_index()
+
+
+def batch_digest(batch, previous=''):
+    """
+        Chain the digest of the versions before a batch with the content of
+        the batch, so that stores fed the same batches in the same order get
+        the same digest.
+    """
+    digest = hashlib.sha256(previous.encode())
+    digest.update(repr(list(batch.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(batch, index=False).values.tobytes())
+
+    return digest.hexdigest()[:16]
+
+
+class SalesStore:
+    """
+        Cleaned sales together with their zipcode cubes and the flags of the
+        houses to buy, kept up to date as batches of new sales arrive.
+
+        append upserts a batch by id with the keep-latest semantics of
+        hand_nonunique, then rebuilds the cube groups and re-scores the
+        houses of the affected zipcodes only, i.e. the zipcodes of the new
+        sales and of the sales they replace. The results are the same as
+        running the whole pipeline over the raw file with the batch appended.
+
+        Every sale is also kept in history, a SaleHistory: the sales a batch
+        replaces become earlier sales of their id, so repeat sales arriving
+        through append are not lost.
+
+        Every append bumps version and registers the new frames under a
+        fingerprint carrying the digest of every batch appended so far (see
+        batch_digest), so the caches of the functions they are passed to,
+        shared across stores and processes, miss exactly for new content.
+        A dataset without a registered fingerprint gets a random one.
+
+        Inputs: data: pandas DataFrame or SaleHistory
+                The cleaned dataset, e.g. from load_dataset, or every sale,
+                e.g. from load_sales. A dataset is taken as a history of one
+                sale per id.
+
+                config: FlipConfig, optional
+                Strategy of the houses to buy, only the zipcode average rule
+                is available (comps_k must be 0).
+    """
+
+    def __init__(self, data, config=FlipConfig()):
+        if config.comps_k > 0:
+            raise ValueError('Nearest comparable sales cross zipcodes, use display_houses_tobuy instead.')
+
+        if isinstance(data, SaleHistory):
+            self.history = data
+            data = data.latest()
+        else:
+            self.history = SaleHistory(data.reset_index(drop=True), len(data))
+
+        self.config = config
+        self.base = registered_fingerprint(data) or ('dataset', 'memory-{}'.format(uuid.uuid4().hex))
+        self.version, self.batches = 0, ''
+
+        self.data = data.reset_index(drop=True)
+        self.zip_cube = build_cube(self.data, ZIP_KEYS)
+        self.season_cube = build_cube(self.data, SEASON_KEYS)
+        self.selected = flip_selection(*flip_inputs(self.data, self.zip_cube, config), config)
+
+        self._register()
+
+    def __len__(self):
+        return len(self.data)
+
+    def _register(self):
+        fingerprint = self.base + ('version', self.version, self.batches)
+        register_fingerprint(self.data, fingerprint)
+        register_fingerprint(self.zip_cube, fingerprint + ('zip_cube',))
+        register_fingerprint(self.season_cube, fingerprint + ('season_cube',))
+        register_fingerprint(self.history, fingerprint + ('sales',))
+        register_fingerprint(self.history.sales, fingerprint + ('sales', 'frame'))
+
+    def append(self, batch):
+        """
+            Upsert a batch of raw sales, formatted like the csv file.
+
+            Returns: dict
+                     Numbers of inserted and updated sales, the affected
+                     zipcodes, the number of sales now kept in history
+                     and the new version.
+        """
+        digest = batch_digest(batch, self.batches)
+        sales, mute = clean_data(batch, keep_history=True)
+        if mute == 0:
+            raise ValueError('The batch could not be cleaned.')
+        sales = apply_schema(sales, {col: dtype for col, dtype in CACHE_SCHEMA.items() if dtype != 'category'})
+        batch = hand_nonunique(sales, 'id')
+
+        ## --- the latest sale of an id wins, and the batch is the latest
+        replaced = np.isin(np.asarray(self.data['id']), np.asarray(batch['id']))
+        zipcodes = np.union1d(np.asarray(self.data['zipcode'])[replaced], np.asarray(batch['zipcode']))
+
+        data = concat_sales(self.data[~replaced], batch)
+        selected = np.concatenate([self.selected[~replaced], np.zeros(len(batch), dtype=bool)])
+
+        affected = np.asarray(data['zipcode'].isin(zipcodes))
+        rows = data[affected]
+        self.zip_cube = replace_groups(self.zip_cube, build_cube(rows, ZIP_KEYS), zipcodes)
+        self.season_cube = replace_groups(self.season_cube, build_cube(rows, SEASON_KEYS), zipcodes)
+        selected[affected] = flip_selection(*flip_inputs(rows, self.zip_cube, self.config), self.config)
+
+        self.data, self.selected = data, selected
+        self.history = self.history.appended(sales)
+        self.version += 1
+        self.batches = digest
+        self._register()
+
+        return {'inserted': len(batch) - int(replaced.sum()), 'updated': int(replaced.sum()),
+                'zipcodes': zipcodes.tolist(), 'sales': len(self.history.sales), 'version': self.version}
+
+    def opportunities(self):
+        """
+            Return the display_houses_tobuy output of the current version.
+        """
+        price = np.asarray(self.data['price'], dtype=np.float64)
+        condition, waterfront = np.asarray(self.data['condition']), np.asarray(self.data['waterfront']) > 0
+
+        return opportunities_table(self.data, price, condition, waterfront, self.selected, self.config)
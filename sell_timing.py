@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class TimingIndex:
+    """
+        Price index of each group (e.g. zipcode) and period of the year
+        (month or season), answering when to sell a house and at what price.
+
+        Each sale is compared with the mean value of its group, which takes
+        out the price level of the group. The index of a group and period is
+        the mean of these ratios over its sales, shrunk toward the county
+        index of the period:
+
+            index = (sum of ratios + prior * county index) / (sales + prior)
+
+        so a group with few sales in a period follows the county, and one
+        with many sales follows its own. An extra last row holds the county
+        index, used for unknown groups (code -1).
+
+        Inputs: groups: array-like of int
+                Group code of each sale in [0, n_groups).
+
+                periods: array-like of int
+                Period code of each sale in [0, n_periods), e.g. month - 1.
+
+                values: array-like
+                Price of each sale, better per square foot so that house
+                sizes do not weigh in.
+
+                n_groups: int, optional
+                Number of groups, by default the largest code plus one.
+
+                n_periods: int, optional
+                Number of periods, 12 by default.
+
+                prior: float, optional
+                Weight of the county index, in sales, 20 by default.
+    """
+
+    def __init__(self, groups, periods, values, n_groups=None, n_periods=12, prior=20.):
+        groups = np.asarray(groups, dtype=np.int64)
+        periods = np.asarray(periods, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        n_groups = int(groups.max()) + 1 if n_groups is None else n_groups
+
+        ## --- ratio of each sale to the mean value of its group
+        group_sales = np.bincount(groups, minlength=n_groups)
+        group_means = np.bincount(groups, weights=values, minlength=n_groups) / np.maximum(group_sales, 1)
+        ratios = values / group_means[groups]
+
+        cells = groups * n_periods + periods
+        counts = np.bincount(cells, minlength=n_groups * n_periods).reshape(n_groups, n_periods)
+        sums = np.bincount(cells, weights=ratios, minlength=n_groups * n_periods).reshape(n_groups, n_periods)
+
+        county_counts = counts.sum(axis=0)
+        county = np.where(county_counts > 0, sums.sum(axis=0) / np.maximum(county_counts, 1), 1.)
+
+        self.prior = prior
+        self.counts = np.vstack([counts, county_counts])
+        self.index = np.vstack([(sums + prior * county) / (counts + prior), county])
+
+        ## --- the best period depends on the group only
+        self.best_periods = self.index.argmax(axis=1)
+        self.best_index = self.index[np.arange(len(self.index)), self.best_periods]
+
+    def __len__(self):
+        return len(self.index) - 1
+
+    def rows(self, groups):
+        groups = np.asarray(groups, dtype=np.int64)
+        return np.where(groups < 0, len(self), groups)
+
+    def best(self, groups, periods, prices):
+        """
+            Best period to sell houses bought in the given periods for the
+            given prices, and their expected price then: the price scaled by
+            the index of the best period over the index of the purchase one.
+
+            Returns: (numpy array, numpy array)
+                     Best period codes and expected prices.
+        """
+        rows = self.rows(groups)
+        periods = np.asarray(periods, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+
+        return (self.best_periods[rows], prices * self.best_index[rows] / self.index[rows, periods])
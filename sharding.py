@@ -0,0 +1,192 @@
+"""
+    Zipcode-sharded execution of the aggregates and of the opportunity
+    scoring over a pool of processes.
+
+    Every statistic of the cubes and the zipcode reference price of each
+    house depend only on the rows of its zipcode. The rows are therefore
+    sorted by zipcode once, written to shared memory, and cut into shards of
+    whole zipcodes with about the same number of rows. Each worker reads its
+    shard in place (nothing is pickled but shard bounds and the small
+    partial cubes), builds the partial cubes, and writes the selection flags
+    of its houses to a shared output buffer. Partial cubes cover disjoint
+    zipcodes and keep the rows of each zipcode in their original order, so
+    merging them gives exactly the cubes of the serial path.
+
+    Needs Python 3.8 or later (multiprocessing.shared_memory).
+"""
+import os
+
+from concurrent.futures      import ProcessPoolExecutor
+from multiprocessing         import shared_memory
+
+import numpy  as np
+import pandas as pd
+
+from my_methods import FlipConfig, CUBE_METRICS, build_cube, flip_inputs, flip_selection, opportunities_table
+
+## --- columns read by the workers, besides the zipcode, year and season codes
+SHARD_COLUMNS = CUBE_METRICS + ['condition', 'waterfront']
+
+
+def allocate_arrays(dtypes, length):
+    """
+        Allocate one array of the given length in a new shared memory block
+        for each name of dtypes.
+
+        Returns: (dict, dict, dict)
+                 The blocks, to be closed and unlinked by the caller, the
+                 (block name, dtype, length) of each array and the arrays,
+                 by name.
+    """
+    blocks, specs, arrays = {}, {}, {}
+    for name, dtype in dtypes.items():
+        dtype = np.dtype(dtype)
+        blocks[name] = shared_memory.SharedMemory(create=True, size=max(length * dtype.itemsize, 1))
+        specs[name] = (blocks[name].name, dtype.str, length)
+        arrays[name] = np.ndarray((length,), dtype=dtype, buffer=blocks[name].buf)
+
+    return (blocks, specs, arrays)
+
+
+def attach_arrays(specs):
+    """
+        Map the shared arrays described by specs, see allocate_arrays.
+
+        Returns: (list, dict)
+                 The attached blocks, to be closed once the arrays are no
+                 longer used, and the arrays by name.
+    """
+    blocks, arrays = [], {}
+    for name, (block_name, dtype, length) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)
+
+    return (blocks, arrays)
+
+
+def shard_bounds(codes_sorted, n_shards):
+    """
+        Cut rows sorted by zipcode code into at most n_shards contiguous
+        slices of whole zipcodes with about the same number of rows.
+
+        Returns: list of (start, stop)
+    """
+    starts = np.flatnonzero(np.r_[True, codes_sorted[1:] != codes_sorted[:-1]])
+    targets = np.linspace(0, len(codes_sorted), n_shards + 1)[1:-1]
+    cuts = np.unique(starts[np.clip(np.searchsorted(starts, targets), 0, len(starts) - 1)])
+    edges = np.r_[0, cuts[cuts > 0], len(codes_sorted)]
+
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+
+def relabel(cube, labels):
+    """
+        Replace the codes of the index levels of a cube named in labels by
+        the labels they stand for.
+    """
+    index = cube.index
+    if isinstance(index, pd.MultiIndex):
+        cube.index = index.set_levels([labels[name][level.values] if name in labels else level
+                                       for name, level in zip(index.names, index.levels)])
+    else:
+        cube.index = pd.Index(labels[index.name][index.values], name=index.name)
+
+    return cube
+
+
+def shard_worker(specs, start, stop, zipcodes, seasons, config):
+    """
+        Aggregate the rows [start, stop) of the shared zipcode-sorted columns
+        and flag the houses to buy among them.
+
+        Returns: (DataFrame, DataFrame)
+                 The partial zipcode and zipcode x year x season cubes.
+    """
+    blocks, arrays = attach_arrays(specs)
+    shard = {}
+    try:
+        ## --- grouping on integer codes is faster than on labels, the cubes are relabelled after
+        shard = {name: arrays[name][start:stop] for name in SHARD_COLUMNS + ['year', 'zipcode', 'season']}
+
+        zip_cube = build_cube(shard, ('zipcode',))
+        season_cube = build_cube(shard, ('zipcode', 'year', 'season'))
+
+        price, condition, waterfront, reference = flip_inputs(shard, zip_cube, config)
+        arrays['selected'][start:stop] = flip_selection(price, condition, waterfront, reference, config)
+
+        labels = {'zipcode': zipcodes, 'season': seasons}
+        return (relabel(zip_cube, labels), relabel(season_cube, labels))
+    finally:
+        ## --- views on the blocks must be gone before closing them
+        shard.clear()
+        arrays.clear()
+        for block in blocks:
+            block.close()
+
+
+def sharded_analysis(data, config=FlipConfig(), workers=None, shards_per_worker=2):
+    """
+        Compute get_cubes(data) and display_houses_tobuy(data, zip_cube,
+        config) with a pool of processes, one zipcode shard at a time. The
+        results are identical to the serial path.
+
+        Inputs: data: pandas DataFrame
+                The cleaned dataset.
+
+                config: FlipConfig, optional
+                Only the zipcode average rule is available, comps_k must be 0.
+
+                workers: int, optional
+                Number of processes, by default the number of CPUs.
+
+                shards_per_worker: int, optional
+                Shards per process, more shards balance the load better.
+
+        Returns: (DataFrame, DataFrame, tuple)
+                 The zipcode cube, the zipcode x year x season cube and the
+                 display_houses_tobuy output.
+    """
+    if config.comps_k > 0:
+        raise ValueError('Nearest comparable sales cross zipcodes, use display_houses_tobuy instead.')
+
+    workers = workers or os.cpu_count()
+    zipcode = pd.Categorical(data['zipcode'])
+    season = pd.Categorical(data['season'])
+
+    ## --- a stable sort keeps the rows of each zipcode in their original order
+    codes = zipcode.codes.astype(np.int16 if len(zipcode.categories) < 1 << 15 else np.int64)
+    order = np.argsort(codes, kind='stable')
+
+    sources = {name: np.asarray(data[name]) for name in SHARD_COLUMNS + ['year']}
+    sources.update({'zipcode': codes, 'season': season.codes})
+
+    blocks, specs, arrays = allocate_arrays(dict({name: source.dtype for name, source in sources.items()},
+                                                 selected=bool), len(data))
+    try:
+        ## --- rows are gathered in zipcode order straight into the shared blocks
+        for name, source in sources.items():
+            np.take(source, order, out=arrays[name])
+        bounds = shard_bounds(arrays['zipcode'], workers * shards_per_worker)
+        zipcodes, seasons = np.asarray(zipcode.categories), np.asarray(season.categories)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(shard_worker, *zip(*[(specs, start, stop, zipcodes, seasons, config)
+                                                          for start, stop in bounds])))
+
+        selected = np.empty(len(data), dtype=bool)
+        selected[order] = arrays['selected']
+    finally:
+        arrays.clear()
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+    zip_cube = pd.concat([partial[0] for partial in partials]).sort_index()
+    season_cube = pd.concat([partial[1] for partial in partials]).sort_index()
+
+    price = np.asarray(data['price'], dtype=np.float64)
+    condition, waterfront = np.asarray(data['condition']), np.asarray(data['waterfront']) > 0
+    to_buy = opportunities_table(data, price, condition, waterfront, selected, config)
+
+    return (zip_cube, season_cube, to_buy)
@@ -0,0 +1,262 @@
+"""
+    Mergeable summaries of numerical columns: count, mean, variance, min and
+    max (MomentSketch) and approximate quantiles (KLLSketch). Sketches built
+    over separate chunks or shards of a dataset merge into the sketch of the
+    whole, and they are small enough to be stored as JSON next to the cached
+    dataset.
+"""
+import json
+
+import numpy  as np
+import pandas as pd
+
+
+class MomentSketch:
+    """
+        Count, mean, sum of squared deviations (M2), min and max of a stream
+        of values, updated a batch at a time and merged with the pairwise
+        formulas of Welford/Chan. NaNs are left out.
+    """
+
+    def __init__(self):
+        self.count, self.mean, self.m2 = 0, 0., 0.
+        self.min, self.max = np.inf, -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        batch = MomentSketch()
+        batch.count, batch.mean = len(values), values.mean()
+        batch.m2 = np.square(values - batch.mean).sum()
+        batch.min, batch.max = values.min(), values.max()
+
+        return self.merge(batch)
+
+    def merge(self, other):
+        """
+            Fold the values summarized by other into this sketch.
+        """
+        count = self.count + other.count
+        if other.count == 0:
+            return self
+
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+
+        return self
+
+    def std(self):
+        """
+            Sample standard deviation, as in pandas.
+        """
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls()
+        sketch.count, sketch.mean, sketch.m2 = state['count'], state['mean'], state['m2']
+        sketch.min, sketch.max = state['min'], state['max']
+        return sketch
+
+
+class KLLSketch:
+    """
+        KLL quantile sketch (Karnin, Lang and Liberty, 2016).
+
+        Values are kept in compactors of increasing weight: an item of level
+        h stands for 2 ** h values. A compactor over its capacity is sorted
+        and every other item, starting at a random offset, moves one level
+        up. Capacities shrink geometrically from the top level down, so the
+        sketch never holds much more than 3 k items, their sum, whatever the
+        number of values. A single large batch cascades up to the top level
+        and leaves fewer than k items (173 for the 21,613 prices with k =
+        200), many small batches or merges fill the lower levels too (about
+        300). The rank error of a quantile is about 1% of the count with k =
+        200, and shrinks as 1 / k.
+
+        Inputs: k: int, optional
+                Capacity of the top compactor, by default 200.
+
+                seed: int, optional
+                Seed of the compaction offsets, so sketches are reproducible.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k, self.count = k, 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+        self._cdf = None
+
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2. / 3.) ** depth)), 2)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+        return self
+
+    def merge(self, other):
+        """
+            Fold the values summarized by other into this sketch.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+
+        self.count += other.count
+        self._compress()
+
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+
+                items = np.sort(self.levels[level])
+                ## --- with an odd number of items, the largest one stays
+                stay = items[len(items) - len(items) % 2:]
+                promoted = items[self._rng.integers(2):len(items) - len(items) % 2:2]
+
+                self.levels[level] = stay
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+        self._cdf = None
+
+    def cdf(self):
+        """
+            Return the sorted items and their cumulative weights.
+        """
+        if self._cdf is None:
+            items = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(items), 2. ** level) for level, items in enumerate(self.levels)])
+            order = np.argsort(items, kind='stable')
+            self._cdf = (items[order], np.cumsum(weights[order]))
+
+        return self._cdf
+
+    def quantile(self, q):
+        """
+            Approximate q-quantile(s) of the values, NaN if there are none.
+        """
+        items, cumulative = self.cdf()
+        if len(items) == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+
+        positions = np.searchsorted(cumulative, np.asarray(q) * cumulative[-1], side='left')
+        return items[np.minimum(positions, len(items) - 1)]
+
+    def to_dict(self):
+        return {'k': self.k, 'count': self.count, 'levels': [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state['k'])
+        sketch.count = state['count']
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in state['levels']]
+        return sketch
+
+
+class ColumnSketch:
+    """
+        Moments and quantile sketch of one numerical column.
+    """
+
+    def __init__(self, k=200):
+        self.moments = MomentSketch()
+        self.quantiles = KLLSketch(k)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.moments.update(values)
+        self.quantiles.update(values)
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+        return self
+
+    def to_dict(self):
+        return {'moments': self.moments.to_dict(), 'quantiles': self.quantiles.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state['quantiles']['k'])
+        sketch.moments = MomentSketch.from_dict(state['moments'])
+        sketch.quantiles = KLLSketch.from_dict(state['quantiles'])
+        return sketch
+
+
+def build_sketches(data, columns=None, k=200):
+    """
+        Sketch the given (by default all numerical) columns of data.
+
+        Returns: dict
+                 ColumnSketch by column label.
+    """
+    columns = data.select_dtypes(include='number').columns if columns is None else columns
+    return {col: ColumnSketch(k).update(data[col]) for col in columns}
+
+
+def merge_sketches(sketches, others):
+    """
+        Merge two dicts of column sketches, e.g. of two chunks or shards,
+        into the first one.
+    """
+    for col, sketch in others.items():
+        if col in sketches:
+            sketches[col].merge(sketch)
+        else:
+            sketches[col] = sketch
+
+    return sketches
+
+
+def describe_sketches(sketches, percentiles=(0.25, 0.5, 0.75)):
+    """
+        Return the statistics of DataFrame.describe read from sketches:
+        count, mean, std, min, the percentiles (the median always among
+        them) and max.
+    """
+    percentiles = sorted(set(percentiles) | {0.5})
+    labels = ['{:g}%'.format(100. * p) for p in percentiles]
+
+    rows = {}
+    for col, sketch in sketches.items():
+        moments = sketch.moments
+        quantiles = sketch.quantiles.quantile(np.array(percentiles))
+        rows[col] = [moments.count, moments.mean if moments.count else np.nan, moments.std(),
+                     moments.min if moments.count else np.nan] + list(quantiles) + \
+                    [moments.max if moments.count else np.nan]
+
+    return pd.DataFrame(rows, index=['count', 'mean', 'std', 'min'] + labels + ['max'])
+
+
+def save_sketches(sketches, path):
+    with open(path, 'w') as f:
+        json.dump({col: sketch.to_dict() for col, sketch in sketches.items()}, f)
+
+
+def load_sketches(path):
+    with open(path) as f:
+        return {col: ColumnSketch.from_dict(state) for col, state in json.load(f).items()}
@@ -0,0 +1,179 @@
+import numpy as np
+
+## --- mean Earth radius and length of one degree of latitude, in km
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * np.pi / 180.
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+        Great-circle distance in km between points given in degrees.
+        Inputs are broadcast against each other like numpy arrays.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2.) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.) ** 2
+
+    return 2. * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class SpatialIndex:
+    """
+        Grid index over latitude/longitude points.
+
+        Points are bucketed in cells at least cell_km wide and tall, and
+        sorted by cell, so that the points of consecutive cells of a grid
+        row are one contiguous slice. Queries gather the slices of the cells
+        overlapping the search area and then filter by exact haversine
+        distance. All returned indices are positions in the arrays the
+        index was built from.
+
+        Inputs: lat, long: array-like
+                Coordinates of the points, in degrees.
+
+                cell_km: float, optional
+                Size of a grid cell, by default 1 km.
+    """
+
+    def __init__(self, lat, long, cell_km=1.0):
+        lat = np.asarray(lat, dtype=np.float64)
+        long = np.asarray(long, dtype=np.float64)
+
+        self.cell_km = cell_km
+        self.lat0, self.long0 = lat.min(), long.min()
+        self.dlat = cell_km / KM_PER_DEGREE
+        ## --- cells are narrowest (in km) at the highest latitude, size them there
+        self.dlong = cell_km / (KM_PER_DEGREE * np.cos(np.radians(np.abs(lat).max())))
+
+        rows, cols = self._cell(lat, long)
+        self.n_rows, self.n_cols = int(rows.max()) + 1, int(cols.max()) + 1
+        cells = rows * self.n_cols + cols
+
+        self.order = np.argsort(cells, kind='stable')
+        self.offsets = np.searchsorted(cells[self.order], np.arange(self.n_rows * self.n_cols + 1))
+        self.lat = lat[self.order]
+        self.long = long[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def _cell(self, lat, long):
+        rows = np.floor((np.asarray(lat) - self.lat0) / self.dlat).astype(np.int64)
+        cols = np.floor((np.asarray(long) - self.long0) / self.dlong).astype(np.int64)
+
+        return (rows, cols)
+
+    def _gather(self, row_min, row_max, col_min, col_max):
+        """
+            Sorted positions of the points in a block of cells, clipped to the grid.
+        """
+        row_min, row_max = max(row_min, 0), min(row_max, self.n_rows - 1)
+        col_min, col_max = max(col_min, 0), min(col_max, self.n_cols - 1)
+        if row_min > row_max or col_min > col_max:
+            return np.empty(0, dtype=np.int64)
+
+        first = np.arange(row_min, row_max + 1) * self.n_cols
+        starts = self.offsets[first + col_min]
+        ends = self.offsets[first + col_max + 1]
+
+        return np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+
+    def _covers(self, row, col, reach):
+        """
+            Whether the block of cells within reach of (row, col) holds the whole grid.
+        """
+        return (row - reach <= 0 and row + reach >= self.n_rows - 1 and
+                col - reach <= 0 and col + reach >= self.n_cols - 1)
+
+    def bbox(self, lat_min, lat_max, long_min, long_max):
+        """
+            Return the positions of the points inside a bounding box.
+        """
+        (row_min, row_max), (col_min, col_max) = self._cell([lat_min, lat_max], [long_min, long_max])
+        found = self._gather(row_min, row_max, col_min, col_max)
+
+        inside = ((self.lat[found] >= lat_min) & (self.lat[found] <= lat_max) &
+                  (self.long[found] >= long_min) & (self.long[found] <= long_max))
+
+        return self.order[found[inside]]
+
+    def within(self, lat, long, radius_km):
+        """
+            Return the positions of the points within radius_km of
+            (lat, long) and their distances, sorted by distance.
+        """
+        reach = int(np.ceil(radius_km / self.cell_km))
+        row, col = self._cell(lat, long)
+        found = self._gather(row - reach, row + reach, col - reach, col + reach)
+
+        dist = haversine_km(lat, long, self.lat[found], self.long[found])
+        near = np.flatnonzero(dist <= radius_km)
+        near = near[np.argsort(dist[near], kind='stable')]
+
+        return (self.order[found[near]], dist[near])
+
+    def nearest(self, lat, long, k, exclude=None):
+        """
+            Return the positions of the k points nearest to (lat, long) and
+            their distances, sorted by distance. The point at position
+            exclude, if given, is left out (e.g. the query house itself).
+        """
+        k = min(k, len(self) - (exclude is not None))
+        if k <= 0:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        row, col = self._cell(lat, long)
+
+        reach = 1
+        while True:
+            found = self._gather(row - reach, row + reach, col - reach, col + reach)
+            if exclude is not None:
+                found = found[self.order[found] != exclude]
+
+            if len(found) >= k:
+                dist = haversine_km(lat, long, self.lat[found], self.long[found])
+                nearest = np.argpartition(dist, k - 1)[:k]
+
+                ## --- any point outside the block is farther than reach cells
+                if dist[nearest].max() <= reach * self.cell_km or self._covers(row, col, reach):
+                    nearest = nearest[np.argsort(dist[nearest], kind='stable')]
+                    return (self.order[found[nearest]], dist[nearest])
+
+            reach += 1
+
+    def neighbours(self, k):
+        """
+            Return the k nearest neighbours of every indexed point, itself
+            excluded, as two (n_points, k) arrays of positions and distances.
+            Points are processed one grid cell at a time. With k or more
+            points, k is lowered to the number of other points.
+        """
+        k = max(min(k, len(self) - 1), 0)
+        positions = np.empty((len(self), k), dtype=np.int64)
+        distances = np.empty((len(self), k), dtype=np.float64)
+        if k == 0:
+            return (positions, distances)
+
+        for cell in np.flatnonzero(np.diff(self.offsets)):
+            members = np.arange(self.offsets[cell], self.offsets[cell + 1])
+            row, col = divmod(cell, self.n_cols)
+
+            reach = 1
+            while True:
+                found = self._gather(row - reach, row + reach, col - reach, col + reach)
+                dist = haversine_km(self.lat[members, None], self.long[members, None],
+                                    self.lat[found], self.long[found])
+                ## --- a point is not its own neighbour
+                dist[found[None, :] == members[:, None]] = np.inf
+
+                ## --- once the block holds the whole grid, it holds every point and len(found) > k
+                if len(found) > k:
+                    nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+                    near_dist = np.take_along_axis(dist, nearest, axis=1)
+                    if near_dist.max() <= reach * self.cell_km or self._covers(row, col, reach):
+                        break
+                reach += 1
+
+            sort = np.argsort(near_dist, axis=1, kind='stable')
+            positions[self.order[members]] = self.order[found[np.take_along_axis(nearest, sort, axis=1)]]
+            distances[self.order[members]] = np.take_along_axis(near_dist, sort, axis=1)
+
+        return (positions, distances)
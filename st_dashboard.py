@@ -1,20 +1,18 @@
 ## ====================
 ## 		Imports
 ## ====================
-import geopandas
 import streamlit as st
-import pandas    as pd
-import numpy     as np
-import plotly.express as px
-import folium
 import sys
 
-from datetime import date
-from streamlit_folium import folium_static
-from folium.plugins   import MarkerCluster
+from functools import partial
+from concurrent.futures import as_completed
 
-## pre-defined functions
+## pre-defined functions: data and tables here, plots after the first content, maps in their worker thread
 from my_methods import *
+from my_tables  import display_table
+from instrumentation import Recorder
+from caching         import cache_stats
+from background      import lazy_function
 
 ## ====================
 ## 	Streamlit Settings
@@ -26,32 +24,19 @@ st.set_page_config( layout='wide' )
 ## ====================
 if __name__ == "__main__":
 
-	## --- data extraction
-	df, mute = get_data( 'kc_house_data.csv' )
-	df = df.head(8000) ## limiting to run faster; comment this line to see restults for the dataset as whole
-	if mute == 0:
-		sys.exit()
-		
-	geofile = get_geofile( 'https://opendata.arcgis.com/datasets/83fc2e72903343aabff6de8cb445b81c_2.geojson' )
-	## --- data tranformation and feature engineering
-	df = hand_nonunique( df, 'id' )
-	
-	df, mute = check_integers( df, ['bedrooms', 'bathrooms', 'floors', 'yr_built', 'yr_renovated', 'zipcode' ] )
+	## --- render timings of this rerun, shown in the sidebar (see the Diagnostics options)
+	rec = Recorder( enabled=st.session_state.get( 'show_timings', False ),
+					profile=st.session_state.get( 'profile_rerun', False ) )
+
+	## --- data extraction, tranformation and feature engineering (cached on disk after the first run)
+	rec.section( 'load' )
+	df, mute = rec.call( load_dataset, 'kc_house_data.csv' )
 	if mute == 0:
 		sys.exit()
 
-	df['date'] = pd.to_datetime(df['date']).apply(lambda x: x.date())
-	df ['month'] = df['date'].apply( lambda x: x.month ).astype(np.int)
-	df['year'] = df['date'].apply( lambda x: x.year )
-	df['season'] = df['date'].apply( get_season ).astype(str)
-
-
-	df['price_sqft'] = df['price']/df['sqft_living']
-
-	df['old'] = df['yr_built'].apply(lambda x: 1 if x < 1960 else 0).astype(np.int64)
 
-	df['to_renovate'] = df[['yr_built','yr_renovated']].apply( lambda x: x['yr_renovated'] - x['yr_built'] if x['yr_renovated'] != 0
-														   else np.NaN, axis=1)
+	## --- zipcode and zipcode x year x season aggregates shared by the sections below
+	zip_cube, season_cube = rec.call( get_cubes, df )
 
 
 	## --- data loading
@@ -72,13 +57,27 @@ if __name__ == "__main__":
 
 
 	## --- data overview
+	rec.section( 'overview' )
 	st.header('Data Overview')
 	st.sidebar.title('Data Overview Options')
 	f_attributes = st.sidebar.multiselect('Select attributes', options=df.columns.drop('id'))
-	st.dataframe( display_data_overview( df, f_attributes ) )
+	rec.call( display_table, df, 'overview', display_data_overview( df, f_attributes ) )
+	rec.mark( 'first_content' )
+
+	## --- independent sections are computed in worker threads while the rest of the page renders, and waited for where they are shown
+	f_comps = st.session_state.get( 'compare_comps', False )
+	config = FlipConfig( comps_k=10 if f_comps else 0 )
+	jobs = { 'markers': rec.submit( lazy_function( 'my_maps', 'markers_map_html' ), df ),
+			 'density': rec.submit( lazy_function( 'my_maps', 'density_map_html' ), df, zip_cube ),
+			 'indexes': rec.submit( get_range_indexes, df ),
+			 'to_buy': rec.submit( find_opportunities, df, zip_cube, config ) }
+
+	## --- plotting stack, imported once the first content is sent and the jobs are started
+	from my_plots import *
 
 
 	## --- statistics
+	rec.section( 'statistics' )
 	st.title( 'Statistics' )
 	st.markdown( 'The most important metrics and statistics are shown in this section. '
 				 'The main goal here is presenting a quantitative analysis of the data in a simple way. ' )
@@ -89,8 +88,8 @@ if __name__ == "__main__":
 	c1.header('Averaged Values by Zipcode')
 	c1.markdown(
 		'In the table below you can see averaged values for price, sqft_living, and price/sqft on each region (labelled by zipcode). Use sidebar options to filter.')
-	f_zipcode = st.sidebar.multiselect('Select zipcodes to display', options=df['zipcode'].unique())
-	to_disp, hei = display_data_averaged( df,f_zipcode )
+	f_zipcode = st.sidebar.multiselect('Select zipcodes to display', options=zip_cube.index.values)
+	to_disp, hei = rec.call( display_data_averaged, zip_cube, f_zipcode )
 	c1.dataframe( to_disp, height=hei  )
 
 	st.sidebar.title( 'Descriptive Statistics Options' )
@@ -98,46 +97,52 @@ if __name__ == "__main__":
 	c2.markdown( 'This table shows descriptive statistics for several attributes. You can control which attribute and metric are shown by using the options in the sidebar.' )
 	c2.markdown( '\n' )
 	f_att = st.sidebar.multiselect('Select attributes to describe',
-								   options=df.select_dtypes( include=['int64', 'float64'] ).drop(['id', 'lat', 'long', 'zipcode', 'yr_renovated', 'waterfront', 'view'], axis=1))
+								   options=descriptive_attributes( df ))
 	f_percentiles = st.sidebar.radio('Pick a percentile to show', options=(0.25, 0.5, 0.75),
 									 format_func=lambda x: str(int(x * 100)) + '%',
 									 help='The 50th percentile is the same as the median')
-	to_disp, hei = display_descriptive(df, f_att, f_percentiles)
+	f_exact = st.sidebar.checkbox( 'Exact statistics', help='Sort every attribute instead of reading the percentiles from sketches' )
+	to_disp, hei = rec.call( display_descriptive, df, f_att, f_percentiles, f_exact )
 	c2.dataframe( to_disp, height=hei )
 
 	f_att = st.sidebar.multiselect('Select attributes to plot distribution',
-								   options=df.select_dtypes( include=['int64', 'float64'] ).drop(['id', 'lat', 'long', 'zipcode', 'yr_renovated', 'waterfront', 'view'], axis=1).columns,
-								   default='to_renovate')
+								   options=descriptive_attributes( df ),
+								   default=DIST_DEFAULT)
 	st.header( 'Distribution of a selected feature' )
 	st.markdown( 'Use the sidebar to select features to show their distribution. Default is `to_renovate`' )
-	st.plotly_chart( display_dist_renv( df, f_att ), use_container_width=True )
+	rec.call( display_dist_renv, df, f_att )
 
 
 	## --- maps (centificate expired)
+	rec.section( 'maps' )
 	st.title( 'Maps' )
 	st.markdown( 'This section is intended to display geographical data. Regions are separated by zip code. The first run may took a while.' )
 	st.markdown( '---' )
 	c1, c2 = st.columns( (1,1) )
 	
+	## --- the maps are drawn at the end of the script, as soon as each of them is built
 	with c1:
 		c1.header('House Markers Map')
 		c1.markdown('You can see the portfolio density on the map below. Adjust the zoom by scrolling up or down.')
-		folium_static( display_map_markers( df ) )
+		markers_slot, markers_caption = c1.empty(), c1.empty()
+		markers_slot.info( 'Building the map...' )
 		
 	with c2:
 		c2.header('Prices Density Map')
 		c2.markdown('The map below shows the density of prices. More expensive regions are shown in red while cheaper regions appear as light-yellow.')
-		folium_static( display_map_density( df, geofile ) )
+		density_slot = c2.empty()
+		density_slot.info( 'Building the map...' )
 
 
 	## --- commercial
+	rec.section( 'prices' )
 	st.title( 'Prices' )
 	st.markdown( 'In this section, you can see figures related to commercial attributes like time evolution of prices, '
 				 'average prices, how prices are distributed in the dataset, etc. Use the commercial options in the sidebar to filter these data.' )
 	st.markdown( '---' )	
 	switcher = {1: [display_price_yrbuilt, display_price_isold],
 				2: display_price_date,
-				3: [display_price_dist, display_price_basement] }
+				3: [partial( display_price_dist, cube=zip_cube ), display_price_basement] }
 
 	st.sidebar.title('Commercial Options')
 
@@ -149,25 +154,27 @@ if __name__ == "__main__":
 							   index=3)
 
 	com_opt = int(com_opt.split('-')[0].strip())
+	rec.wait( jobs['indexes'] )
 	
 	if com_opt in switcher.keys():
 		try:
 			for call in switcher[com_opt]:
-				call(df)
+				rec.call( call, df )
 		except:
-			switcher[com_opt](df)
+			rec.call( switcher[com_opt], df )
 	else:
-		switcher[3][0]( df )
+		rec.call( switcher[3][0], df )
 		c1, c2 = st.columns( (1,1) )
 		with c1:
-			switcher[1][0]( df )
+			rec.call( switcher[1][0], df )
 		with c2:
-			switcher[2]( df )
-		display_price_waterfront( df )
-		display_price_season( df )
+			rec.call( switcher[2], df )
+		rec.call( display_price_waterfront, df )
+		rec.call( display_price_season, season_cube )
 
 
 	## --- physical
+	rec.section( 'physical' )
 	st.title( 'Physical Attributes' )
 	st.markdown( 'Below you can see histograms showing the distribution of the houses according to the selected attributes. '
 				 'Use the sidebar to choose for displaying either one histogram or all available histograms.' )
@@ -181,41 +188,87 @@ if __name__ == "__main__":
 	
 	if phys_opt in switcher.keys():
 		st.header( 'Houses Distribution per Number of '+switcher[phys_opt].capitalize() )
-		display_att_hist(df, switcher[phys_opt])
+		rec.call( display_att_hist, df, switcher[phys_opt] )
 	else:
 		c1, c2 = st.columns( (1,1) )
 		with c1:
 			c1.header( 'Houses per Number of '+switcher[1].capitalize() )
-			display_att_hist(df, switcher[1], 17)
+			rec.call( display_att_hist, df, switcher[1], PHYSICAL_BINS[switcher[1]] )
 			c1.header( 'Houses per Number of '+switcher[3].capitalize() )
-			display_att_hist(df, switcher[3], 10)
+			rec.call( display_att_hist, df, switcher[3], PHYSICAL_BINS[switcher[3]] )
 		with c2:
 			c2.header( 'Houses per Number of '+switcher[2].capitalize() )
-			display_att_hist(df, switcher[2], 10)
+			rec.call( display_att_hist, df, switcher[2], PHYSICAL_BINS[switcher[2]] )
 			c2.header( 'Houses per Number of '+switcher[4].capitalize() )
-			display_att_hist(df, switcher[4], 5)
+			rec.call( display_att_hist, df, switcher[4], PHYSICAL_BINS[switcher[4]] )
 
 
 	## --- final dataframe
+	rec.section( 'business' )
 	st.header('Business Opportunities')
 	st.markdown('---')
 	st.markdown(' Below we can see a table indicating houses met as potential business according to the pre-defined assumptions.')
 
-	to_buy, tot_inv, tot_exp, perct, tot_prof = display_houses_tobuy( df )
+	st.sidebar.title( 'Business Options' )
+	st.sidebar.checkbox( 'Compare houses with their 10 nearest sales', key='compare_comps',
+						 help='By default houses are compared with the average price of their zipcode' )
+	to_buy, tot_inv, tot_exp, perct, tot_prof = rec.wait( jobs['to_buy'] )
 
-	st.dataframe(to_buy)
+	rec.call( display_table, to_buy, 'to_buy' )
 	st.markdown( 'Total profit: {} USD, which represents {}% of the initial investment.'.format(tot_prof,perct) )
 	st.markdown( 'Investiments: {} USD'.format(tot_inv,2) )
 	st.markdown( 'Expenditures: {} USD'.format(tot_exp,2) )
 
+	## --- when to sell: best month of each zipcode, from the zipcode x month price index
+	timing = rec.call( get_sell_timing, df )
+	rec.call( display_sell_timing, df )
+	timed, tot_timed = rec.call( sell_timing_table, to_buy, timing )
+	rec.call( display_table, timed, 'sell_timing' )
+	st.markdown( 'Selling each house in the best month of its zipcode, the total expected profit is {} USD.'.format(tot_timed) )
+
+	## --- repeat sales: houses bought and resold within the dataset, read from the sale history store
+	history, _ = rec.call( load_sales, 'kc_house_data.csv' )
+	pairs = rec.call( repeat_sales_table, history )
+	st.header( 'Repeat Sales' )
+	st.markdown( 'The table below lists the {} resales of houses sold more than once in the dataset, the real buy and resell spreads. '
+				 'The median appreciation is {:.1f}% over a median holding period of {:.0f} days.'.format( len(pairs), 100. * pairs['appreciation'].median(),
+																										  pairs['holding_days'].median() ) )
+	rec.call( display_table, pairs, 'repeat_sales' )
+
 	st.sidebar.title( 'About' )
 	st.sidebar.markdown( '<div style="background-color:rgba(0, 166, 207, 0.36);">This application was developed by '
 						 '<a href="https://br.linkedin.com/in/pedro-henrique-grosman-alves-377a33122"> Pedro Grosman </a> '
 						 'for presentation purposes only. Feel free to message me in case you have any questions or requests.</div>',
 						 unsafe_allow_html=True )
-		
-
-	
-
-		
 
+	## --- maps, in the order they are ready, sent as pages rendered once and cached like the figures
+	rec.section( 'maps' )
+	from my_maps import show_map
+	maps = { jobs['markers']: 'markers', jobs['density']: 'density' }
+	for job in as_completed( maps ):
+		if maps[job] == 'markers':
+			markers_page, stats = rec.wait( job )
+			show_map( markers_page, markers_slot )
+			rec.sent( 'map', markers_page )
+			markers_caption.caption( '{} houses in {} clusters ({:.0f} KB), built in {:.2f} s'.format( stats['houses'], stats['markers'],
+																									   stats['payload_kb'], stats['build_seconds'] ) )
+		else:
+			density_page = rec.wait( job )
+			if density_page is None:
+				density_slot.empty()
+			else:
+				show_map( density_page, density_slot )
+				rec.sent( 'map', density_page )
+
+	## --- diagnostics: render timings of this rerun, also logged as JSON lines on 'kc_dashboard.timing', and cache hit rates
+	st.sidebar.title( 'Diagnostics' )
+	st.sidebar.checkbox( 'Show render timings', key='show_timings',
+									 help='Wall time, cache hits and payload sizes per section, from the next rerun on' )
+	st.sidebar.checkbox( 'Profile the next rerun', key='profile_rerun' )
+	timings = rec.finish()
+
+	if timings is not None:
+		st.sidebar.dataframe( timings.drop( columns='kind' ) )
+		st.sidebar.dataframe( cache_stats() )
+		if rec.profiler is not None:
+			st.sidebar.download_button( 'Download profile', rec.profile_text(), file_name='rerun_profile.txt' )
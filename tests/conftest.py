@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATA_PATH = os.path.join(ROOT, 'kc_house_data.csv')
+
+
+@pytest.fixture(scope='session')
+def raw_data():
+    import pandas as pd
+    return pd.read_csv(DATA_PATH)
+
+
+@pytest.fixture(scope='session')
+def dataset(tmp_path_factory):
+    import my_methods as mm
+    data, _ = mm.load_dataset.__wrapped__(DATA_PATH, str(tmp_path_factory.mktemp('cache')))
+    return data
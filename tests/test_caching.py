@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pytest
+
+import caching
+from spatial_index import SpatialIndex
+
+
+def test_objects_are_measured_through_their_attributes():
+    lat = np.linspace(47.2, 47.8, 100000)
+    index = SpatialIndex(lat, -122. - lat / 10.)
+
+    assert caching.value_nbytes(index) >= index.order.nbytes + index.lat.nbytes + index.long.nbytes
+    assert caching.RESOURCE_CACHE.max_bytes is not None
+
+
+def test_resources_are_evicted_beyond_max_bytes():
+    indexes = [SpatialIndex(np.full(25000, 47.5) + key, np.full(25000, -122.)) for key in range(4)]
+    cache = caching.BoundedCache('test', max_entries=32, max_bytes=int(2.5 * caching.value_nbytes(indexes[0])))
+    for key, index in enumerate(indexes):
+        cache.put(key, index)
+
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.get(0) == (False, None) and cache.get(3)[0]
+
+
+@pytest.fixture
+def figure_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(caching, 'FIGURE_DIR', str(tmp_path))
+    caching.FIGURE_CACHE.clear()
+    yield tmp_path
+    caching.FIGURE_CACHE.clear()
+
+
+def counted_figure():
+    calls = []
+
+    def figure(n):
+        calls.append(n)
+        return 'figure {}'.format(n)
+
+    return caching.cache_figure(figure), calls
+
+
+def test_cache_figure_hit_and_miss(figure_dir):
+    figure, calls = counted_figure()
+
+    assert figure(1) == 'figure 1' and figure(1) == 'figure 1'
+    assert figure(2) == 'figure 2'
+    assert calls == [1, 2]
+    assert len(os.listdir(figure_dir)) == 2
+
+    ## --- another process has an empty FIGURE_CACHE and reads the stored figure
+    caching.FIGURE_CACHE.clear()
+    again, again_calls = counted_figure()
+    assert again(1) == 'figure 1' and again_calls == []
+
+
+def test_cache_figure_invalidated_by_version(figure_dir, monkeypatch):
+    figure, calls = counted_figure()
+    figure(1)
+
+    caching.FIGURE_CACHE.clear()
+    monkeypatch.setattr(caching, 'FIGURE_VERSION', caching.FIGURE_VERSION + 1)
+    bumped, bumped_calls = counted_figure()
+
+    assert bumped(1) == 'figure 1' and bumped_calls == [1]
+    assert len(os.listdir(figure_dir)) == 2
+
+
+def test_code_version_covers_every_project_module(tmp_path):
+    for name in ('my_plots.py', 'my_methods.py'):
+        (tmp_path / name).write_text('x = 1\n')
+    before = caching.source_version(str(tmp_path))
+
+    ## --- a change to a module the figures depend on, not the one building them
+    (tmp_path / 'my_methods.py').write_text('x = 2\n')
+    caching.source_version.cache_clear()
+
+    assert caching.source_version(str(tmp_path)) != before
+    assert caching.code_version(caching.cache_figure).endswith(caching.source_version(os.path.dirname(caching.__file__)))
+
+
+def test_trim_figures_caps_the_folder(tmp_path):
+    for age in range(10):
+        path = tmp_path / '{}.json'.format(age)
+        path.write_text('x' * 1000)
+        os.utime(path, (1e9 - age, 1e9 - age))
+
+    assert caching.trim_figures(str(tmp_path), max_bytes=20000) == 0
+    assert caching.trim_figures(str(tmp_path), max_bytes=5000) == 6
+
+    ## --- the most recently used files are kept, under 90% of the budget
+    assert sorted(os.listdir(tmp_path)) == ['0.json', '1.json', '2.json', '3.json']
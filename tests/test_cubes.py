@@ -0,0 +1,28 @@
+import numpy  as np
+import pandas as pd
+
+import my_methods as mm
+
+
+def test_update_cube_equals_full_rebuild(dataset):
+    head, tail = dataset.iloc[:15000], dataset.iloc[15000:]
+
+    updated = mm.update_cube(mm.build_cube(head, ('zipcode', 'year', 'season')), tail, ('zipcode', 'year', 'season'))
+    rebuilt = mm.build_cube(dataset, ('zipcode', 'year', 'season'))
+
+    pd.testing.assert_frame_equal(updated, rebuilt, check_dtype=False)
+
+
+def test_cube_means_equal_groupby_means(dataset):
+    means = mm.cube_means(mm.build_cube(dataset))
+    expected = pd.DataFrame({'zipcode': np.asarray(dataset['zipcode']),
+                             'price': np.asarray(dataset['price'], dtype=np.float64)}).groupby('zipcode')['price'].mean()
+
+    np.testing.assert_allclose(means['price'].values, expected.values)
+
+
+def test_rollup_cube_equals_cube_of_coarser_keys(dataset):
+    rolled = mm.rollup_cube(mm.build_cube(dataset, ('zipcode', 'year', 'season')), ['year', 'season'])
+    direct = mm.build_cube(dataset, ('year', 'season'))
+
+    pd.testing.assert_frame_equal(rolled, direct, check_dtype=False)
@@ -0,0 +1,46 @@
+import numpy  as np
+import pandas as pd
+
+import my_methods as mm
+
+
+def baseline_features(data):
+    ## --- feature engineering of the first dashboard version, one lambda per row
+    data = data.copy()
+    data['date'] = pd.to_datetime(data['date']).apply(lambda x: x.date())
+    data['month'] = data['date'].apply(lambda x: x.month).astype(int)
+    data['year'] = data['date'].apply(lambda x: x.year)
+    data['season'] = data['date'].apply(mm.get_season).astype(str)
+    data['price_sqft'] = data['price'] / data['sqft_living']
+    data['old'] = data['yr_built'].apply(lambda x: 1 if x < 1960 else 0).astype(np.int64)
+    data['to_renovate'] = data[['yr_built', 'yr_renovated']].apply(
+        lambda x: x['yr_renovated'] - x['yr_built'] if x['yr_renovated'] != 0 else np.NaN, axis=1)
+
+    return data
+
+
+def test_build_features_matches_baseline(raw_data):
+    data = mm.hand_nonunique(raw_data, 'id')
+    data, _ = mm.check_integers(data, ['bedrooms', 'bathrooms', 'floors', 'yr_built', 'yr_renovated', 'zipcode'])
+
+    expected = baseline_features(data)
+    result = mm.build_features(data)
+
+    assert list(result.columns) == list(expected.columns)
+    assert (result['date'].dt.date.values == expected['date'].values).all()
+    for col in ['month', 'year', 'old']:
+        np.testing.assert_array_equal(result[col].values, expected[col].values.astype(np.int64))
+    np.testing.assert_array_equal(result['season'].astype(str).values, expected['season'].values)
+    np.testing.assert_allclose(result['price_sqft'].values, expected['price_sqft'].values)
+    np.testing.assert_array_equal(result['to_renovate'].values, expected['to_renovate'].values.astype(np.float64))
+    ## --- raw columns pass through untouched
+    raw = [col for col in data.columns if col != 'date']
+    pd.testing.assert_frame_equal(result[raw], data[raw])
+
+
+def test_build_features_leaves_input_unchanged(raw_data):
+    data = raw_data.head(100)
+    before = data.copy()
+    mm.build_features(data)
+
+    pd.testing.assert_frame_equal(data, before)
@@ -0,0 +1,24 @@
+import benchmark
+
+
+def test_my_methods_import_budget():
+    imports = benchmark.measure_import('my_methods')
+
+    assert imports['heavy'] == [], 'my_methods loads ' + ', '.join(imports['heavy'])
+    assert imports['seconds'] <= benchmark.IMPORT_BUDGET, \
+        'import my_methods took {:.3f} s, budget {:.3f} s'.format(imports['seconds'], benchmark.IMPORT_BUDGET)
+
+
+def test_heavy_packages_are_detected():
+    ## --- the rendering modules do load them, so an empty list above is not an artefact of the measure
+    imports = benchmark.measure_import('my_plots', repeat=1)
+
+    assert 'plotly' in imports['heavy']
+
+
+def test_missing_baseline_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(benchmark, 'check_import', lambda budget: ({}, True))
+
+    assert benchmark.main(['--baseline', str(tmp_path / 'baseline.json'), '--output', str(tmp_path / 'results.json'),
+                           '--scales', '1000', '--skip-page']) == 2
+    assert not (tmp_path / 'results.json').exists()
@@ -0,0 +1,32 @@
+import numpy  as np
+import pandas as pd
+
+import my_methods as mm
+
+from conftest import DATA_PATH
+
+
+def test_last_sales_keeps_one_row_per_distinct_id(raw_data):
+    ids, rows, n_rows = mm.last_sales(DATA_PATH, chunksize=1000)
+    expected = raw_data.reset_index().drop_duplicates('id', keep='last')
+
+    ## --- the dedup state is O(distinct ids), not O(rows)
+    assert n_rows == len(raw_data)
+    assert len(ids) == len(rows) == raw_data['id'].nunique()
+    np.testing.assert_array_equal(rows, expected.sort_values('id')['index'].values)
+
+
+def test_ingest_chunked_equals_in_memory_path(dataset):
+    zip_cube, season_cube, (to_buy, *totals), stats = mm.ingest_chunked(DATA_PATH, chunksize=1000)
+
+    plain = lambda func: getattr(func, '__wrapped__', func)
+    memory_zip, memory_season = plain(mm.get_cubes)(dataset)
+    memory_buy, *memory_totals = plain(mm.display_houses_tobuy)(dataset, memory_zip)
+
+    assert stats['chunks'] == 22 and stats['rows_kept'] == len(dataset)
+    pd.testing.assert_frame_equal(zip_cube, memory_zip, check_dtype=False, check_index_type=False)
+    pd.testing.assert_frame_equal(season_cube, memory_season, check_dtype=False, check_index_type=False,
+                                  check_categorical=False)
+    pd.testing.assert_frame_equal(to_buy.reset_index(drop=True), memory_buy.reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False)
+    assert totals == memory_totals
@@ -0,0 +1,21 @@
+import numpy as np
+
+import my_maps    as mg
+import my_methods as mm
+
+
+def test_bounds_zoom_fits_the_extent():
+    lat, long = np.array([47.15, 47.78]), np.array([-122.52, -121.31])
+    zoom = mg.bounds_zoom(lat, long)
+
+    ## --- the extent fits at zoom but not at zoom + 1 (1.21 degrees wide, 700 pixels)
+    assert 256. * 2 ** zoom * 1.21 / 360. <= mg.MAP_WIDTH < 256. * 2 ** (zoom + 1) * 1.21 / 360.
+    assert mg.bounds_zoom([47.5], [-122.2]) == 18
+
+
+def test_density_map_is_fitted_to_the_sales(dataset):
+    b_map = mg.display_map_density(dataset, mm.build_cube(dataset), boundaries='approximate')
+    html = mg.map_html(b_map)
+
+    assert 'fitBounds' in html
+    assert str(float(dataset['lat'].min())) in html and str(float(dataset['long'].max())) in html
@@ -0,0 +1,40 @@
+import numpy  as np
+import pandas as pd
+
+import my_methods as mm
+
+CONFIGS = [mm.FlipConfig(), mm.FlipConfig(below_average=0.8), mm.FlipConfig(markup=1.2, reno_other=0.2),
+           mm.FlipConfig(good_condition=3, markup_waterfront=1.4), mm.FlipConfig(below_average=1.1, reno_good=0.)]
+
+
+def naive_profit(data, config):
+    """
+        Profit of each house under config, zero where it is not bought,
+        computed row by row from a plain groupby average.
+    """
+    frame = pd.DataFrame({'zipcode': np.asarray(data['zipcode']), 'price': np.asarray(data['price'], dtype=float),
+                          'condition': np.asarray(data['condition']), 'waterfront': np.asarray(data['waterfront']) == 1})
+    average = frame.groupby('zipcode')['price'].transform('mean')
+    good = frame['condition'] >= config.good_condition
+
+    bought = (frame['price'] < config.below_average * average) & (good != frame['waterfront'])
+    markup = np.where(frame['waterfront'], config.markup_waterfront, config.markup)
+    reno = np.where(good, config.reno_good, config.reno_other)
+
+    return np.where(bought, frame['price'] * (markup - reno - 1.), 0.)
+
+
+def test_flip_profit_matrix_equals_per_config_runs(dataset):
+    cube = mm.build_cube(dataset)
+    inputs = mm.flip_inputs(dataset, cube)
+
+    ## --- a small block size splits the scenarios into several blocks
+    profit, selected = mm.flip_profit_matrix(*inputs, CONFIGS, block_size=2 * len(dataset))
+
+    for row, config in enumerate(CONFIGS):
+        to_buy, tot_inv, tot_exp, perct, tot_prof = mm.display_houses_tobuy.__wrapped__(dataset, cube, config)
+
+        assert selected[row].sum() == len(to_buy)
+        np.testing.assert_allclose(np.sort(profit[row][selected[row]]), np.sort(to_buy['profit'].values))
+        np.testing.assert_allclose(profit[row], naive_profit(dataset, config), rtol=1e-9)
+        assert np.round(profit[row].sum(), 2) == tot_prof
@@ -0,0 +1,57 @@
+import json
+
+import plotly.graph_objects as go
+import pytest
+
+import my_plots as mp
+
+
+class Container:
+    """
+        Stand-in for a Streamlit container recording the figures it is given.
+    """
+
+    def __init__(self, enqueue=False, enqueue_error=None):
+        self.charts, self.enqueued = [], []
+        if enqueue or enqueue_error is not None:
+            def _enqueue(kind, proto):
+                if enqueue_error is not None:
+                    raise enqueue_error
+                self.enqueued.append((kind, proto))
+            self._enqueue = _enqueue
+
+    def plotly_chart(self, figure, use_container_width=False):
+        self.charts.append((figure, use_container_width))
+
+
+@pytest.fixture
+def spec():
+    return mp.figure_json(go.Figure(go.Bar(x=[1, 2], y=[3, 4])))
+
+
+def test_show_figure_falls_back_without_the_message(spec, monkeypatch):
+    monkeypatch.setattr(mp, 'PlotlyChartProto', None)
+    container = Container()
+
+    mp.show_figure(spec, container)
+
+    assert container.charts == [(json.loads(spec), True)]
+
+
+def test_show_figure_falls_back_when_enqueue_fails(spec):
+    container = Container(enqueue_error=TypeError('unexpected arguments'))
+
+    mp.show_figure(spec, container, use_container_width=False)
+
+    assert container.charts == [(json.loads(spec), False)]
+
+
+@pytest.mark.skipif(mp.PlotlyChartProto is None, reason='this Streamlit version has no PlotlyChart message')
+def test_show_figure_sends_the_serialized_spec(spec):
+    container = Container(enqueue=True)
+
+    mp.show_figure(spec, container)
+
+    assert container.charts == [] and len(container.enqueued) == 1
+    kind, proto = container.enqueued[0]
+    assert kind == 'plotly_chart' and proto.figure.spec == spec
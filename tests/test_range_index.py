@@ -0,0 +1,62 @@
+import numpy  as np
+import pandas as pd
+
+import my_methods as mm
+from range_index import SortedIndex
+
+
+def test_range_aggregates_equal_filter_masks(dataset):
+    indexes = mm.get_range_indexes.__wrapped__(dataset)
+    years, price = np.asarray(dataset['yr_built']), np.asarray(dataset['price'], dtype=np.float64)
+
+    for low, high in [(1900, 2015), (1950.5, 1960.2), (1990, 1989), (1800, 1899), (2014, 3000)]:
+        mask = (years >= low) & (years <= high)
+        index = indexes['yr_built']
+
+        assert index.count(low, high) == mask.sum()
+        np.testing.assert_allclose(index.sum(low, high), price[mask].sum())
+        np.testing.assert_allclose(index.mean(low, high), price[mask].mean() if mask.any() else np.nan)
+
+        keys, means = index.key_means(low, high)
+        expected = pd.Series(price[mask]).groupby(years[mask]).mean()
+        np.testing.assert_array_equal(keys, expected.index.values)
+        np.testing.assert_allclose(means, expected.values)
+
+
+def test_date_ranges_equal_filter_masks(dataset):
+    index = mm.get_range_indexes.__wrapped__(dataset)['date']
+    dates = np.asarray(dataset['date'], dtype='datetime64[ns]')
+    low, high = np.datetime64('2014-07-01'), np.datetime64('2014-12-31')
+
+    assert index.count(low, high) == ((dates >= low) & (dates <= high)).sum()
+
+
+def test_range_histograms_equal_np_histogram(dataset):
+    indexes = mm.get_range_indexes.__wrapped__(dataset)
+    zipcode, price = np.asarray(dataset['zipcode']), np.asarray(dataset['price'], dtype=np.float64)
+    groups = [0, 5, 17]
+    low, high = 200000, 900000
+
+    edges, counts, boxes = mm.range_histogram(indexes['price_zipcode'], groups, low, high)
+
+    for group, row, box in zip(groups, counts, boxes):
+        values = price[(zipcode == indexes['zipcodes'][group]) & (price >= low) & (price <= high)]
+        np.testing.assert_array_equal(row, np.histogram(values, edges)[0])
+        np.testing.assert_allclose([box['q1'], box['median'], box['q3']], np.percentile(values, [25, 50, 75]))
+        np.testing.assert_allclose(box['mean'], values.mean())
+
+
+def test_groups_and_integer_keys_with_float_limits():
+    keys, groups = np.array([3, 1, 2, 2, 5, 1]), np.array([1, 0, 0, 1, 1, 0])
+    index = SortedIndex(keys, np.arange(6.), groups)
+
+    assert index.count(1.5, 2.5, group=0) == 1 and index.count(1.5, 2.5, group=1) == 1
+    assert index.sum(-1e30, 1e30, group=1) == 0. + 3. + 4.
+    assert index.bounds(1) == (2, 5) and SortedIndex(keys, groups=groups, n_groups=3).bounds(2) is None
+
+
+def test_limits_beyond_the_integer_keys():
+    index = SortedIndex(np.array([-5, 0, 7], dtype=np.int64))
+
+    assert index.count(-2. ** 63, 2. ** 63) == 3 and index.count(1e30, 2e30) == 0
+    assert index.count(-1e30, -6) == 0 and index.count(-6.5, 0.5) == 2
@@ -0,0 +1,111 @@
+import numpy  as np
+import pandas as pd
+import pytest
+
+import my_methods as mm
+from sale_history import RepeatSalesIndex, SaleHistory, arrange_sales
+
+
+@pytest.fixture(scope='module')
+def sales(raw_data):
+    """
+        The SaleHistory of every sale and the cleaned sales in file order.
+    """
+    cleaned = mm.clean_data(raw_data, keep_history=True)[0]
+    return SaleHistory(*arrange_sales(cleaned)), cleaned
+
+
+def naive_history(cleaned, house_id):
+    """
+        Sales of an id from a plain filter: earlier sales by date, the last
+        sale of the file last, as hand_nonunique keeps it.
+    """
+    rows = cleaned[cleaned['id'] == house_id]
+    return pd.concat([rows.iloc[:-1].sort_values('date', kind='mergesort'), rows.iloc[-1:]])
+
+
+def test_latest_and_counts_equal_per_id_groupby(sales, raw_data):
+    history, cleaned = sales
+
+    latest = mm.hand_nonunique(raw_data, 'id')
+    np.testing.assert_array_equal(history.latest()['id'].values, latest['id'].values)
+
+    counts = raw_data.groupby('id').size()
+    np.testing.assert_array_equal(history.index()[0], counts.index.values)
+    np.testing.assert_array_equal(history.counts(), counts.values)
+    assert len(history.sales) == len(raw_data)
+
+
+def test_history_equals_per_id_filter(sales):
+    history, cleaned = sales
+    repeated = history.index()[0][history.counts() > 1]
+
+    for house_id in list(repeated[:60]) + list(history.index()[0][:20]):
+        found = history.history(house_id, ['id', 'date', 'price'])
+        expected = naive_history(cleaned, house_id)[['id', 'date', 'price']]
+        pd.testing.assert_frame_equal(found.reset_index(drop=True), expected.reset_index(drop=True),
+                                      check_dtype=False)
+
+    assert len(history.history(-1)) == 0
+    np.testing.assert_array_equal(history.positions([repeated[0], -1]),
+                                  [np.searchsorted(history.index()[0], repeated[0]), -1])
+
+
+def test_holdings_and_repeat_sales_equal_per_id_groupby(sales):
+    history, cleaned = sales
+    ordered = pd.concat([naive_history(cleaned, house_id) for house_id in history.index()[0][history.counts() > 1]])
+
+    grouped = ordered.groupby('id', sort=True)
+    holdings = history.holdings().loc[grouped.size().index]
+    first, last = grouped.first(), grouped.last()
+    np.testing.assert_allclose(holdings['appreciation'], last['price'] / first['price'] - 1.)
+    np.testing.assert_allclose(holdings['holding_days'], (last['date'] - first['date']).dt.days)
+    assert history.holdings()['holding_days'].notna().sum() == len(first)
+
+    pairs = history.repeat_sales()
+    previous = grouped['price'].shift()
+    expected = ordered[previous.notna()].assign(buy_price=previous[previous.notna()])
+    assert len(pairs) == len(expected) == 177
+    np.testing.assert_array_equal(pairs['id'].values, expected['id'].values)
+    np.testing.assert_allclose(pairs['buy_price'].values, expected['buy_price'].values)
+    np.testing.assert_allclose(pairs['sell_price'].values, expected['price'].values)
+
+
+def test_appended_equals_history_of_all_sales(sales):
+    history, cleaned = sales
+    head = SaleHistory(*arrange_sales(cleaned.iloc[:15000]))
+
+    appended = head.appended(cleaned.iloc[15000:])
+
+    pd.testing.assert_frame_equal(appended.sales, history.sales, check_dtype=False, check_categorical=False)
+    assert appended.n_latest == history.n_latest and len(head.sales) == 15000
+
+
+def test_repeat_sales_index_equals_least_squares():
+    rng = np.random.default_rng(0)
+    n_pairs, n_groups, n_periods, prior = 400, 3, 6, 5.
+    groups = rng.integers(0, n_groups, n_pairs)
+    buy = rng.integers(0, n_periods - 1, n_pairs)
+    sell = buy + 1 + rng.integers(0, n_periods - 1 - buy)
+    ratios = np.exp(0.02 * (sell - buy) + rng.normal(0, 0.05, n_pairs))
+
+    index = RepeatSalesIndex(groups, buy, sell, ratios, n_groups, n_periods, prior)
+
+    design = np.zeros((n_pairs, n_periods))
+    design[np.arange(n_pairs), sell] += 1.
+    design[np.arange(n_pairs), buy] -= 1.
+    logs = np.log(ratios)
+
+    county = np.linalg.lstsq(design[:, 1:], logs, rcond=None)[0]
+    np.testing.assert_allclose(np.log(index.index[-1, 1:]), county, atol=1e-6)
+
+    ## --- the betas of a group minimize its squared errors plus prior times the squared distance to the county
+    for group in range(n_groups):
+        rows = groups == group
+        penalty = np.sqrt(prior) * np.eye(n_periods - 1)
+        betas = np.linalg.lstsq(np.vstack([design[rows, 1:], penalty]),
+                                np.concatenate([logs[rows], np.sqrt(prior) * county]), rcond=None)[0]
+        np.testing.assert_allclose(np.log(index.index[group, 1:]), betas, atol=1e-6)
+
+    assert index.index[:, 0].tolist() == [1.] * (n_groups + 1)
+    np.testing.assert_array_equal(index.counts, np.append(np.bincount(groups, minlength=n_groups), n_pairs))
@@ -0,0 +1,91 @@
+import numpy  as np
+import pandas as pd
+import pytest
+
+import my_methods as mm
+from caching     import registered_fingerprint
+from sales_store import SalesStore
+
+SPLIT = 20000
+
+
+def load(raw, folder):
+    folder.mkdir(exist_ok=True)
+    path = str(folder / 'sales.csv')
+    raw.to_csv(path, index=False)
+    return mm.load_dataset.__wrapped__(path, str(folder / 'cache'))[0]
+
+
+@pytest.fixture(scope='module')
+def batches(raw_data):
+    """
+        The first sales, and a batch of the others plus a sale replacing an
+        earlier one in the same zipcode and a sale moving an id to another
+        zipcode.
+    """
+    head, tail = raw_data.iloc[:SPLIT], raw_data.iloc[SPLIT:]
+
+    replaced = head.iloc[[10]].copy()
+    replaced['price'] = replaced['price'] * 0.5
+    moved = head.iloc[[20]].copy()
+    moved['zipcode'] = head.loc[head['zipcode'] != moved['zipcode'].iloc[0], 'zipcode'].iloc[0]
+
+    return head, pd.concat([tail, replaced, moved], ignore_index=True)
+
+
+def test_append_equals_full_rebuild(batches, tmp_path):
+    head, batch = batches
+    store = SalesStore(load(head, tmp_path / 'head'))
+
+    stats = store.append(batch)
+    rebuilt = load(pd.concat([head, batch], ignore_index=True), tmp_path / 'all')
+
+    assert stats['updated'] == 2 and stats['inserted'] == batch['id'].nunique() - 2
+    assert len(store) == len(rebuilt)
+
+    zip_cube, season_cube = mm.get_cubes.__wrapped__(rebuilt)
+    pd.testing.assert_frame_equal(store.zip_cube, zip_cube, check_dtype=False, check_index_type=False)
+    pd.testing.assert_frame_equal(store.season_cube, season_cube, check_dtype=False, check_index_type=False,
+                                  check_categorical=False)
+
+    to_buy, *totals = store.opportunities()
+    expected, *expected_totals = mm.display_houses_tobuy.__wrapped__(rebuilt, zip_cube)
+    assert sorted(to_buy['id']) == sorted(expected['id'])
+    np.testing.assert_allclose(totals, expected_totals)
+
+
+def test_replaced_and_moved_sales(batches, tmp_path):
+    head, batch = batches
+    store = SalesStore(load(head, tmp_path))
+    replaced, moved = batch.iloc[-2], batch.iloc[-1]
+    old_zipcode = head.loc[head['id'] == moved['id'], 'zipcode'].iloc[-1]
+    sales = len(store.history.sales)
+
+    stats = store.append(batch.iloc[-2:])
+
+    current = store.data.set_index('id')
+    assert current.loc[replaced['id'], 'price'] == replaced['price']
+    assert current.loc[moved['id'], 'zipcode'] == moved['zipcode']
+    assert {int(old_zipcode), int(moved['zipcode'])} <= set(stats['zipcodes'])
+    ## --- the replaced sales stay in the history
+    assert stats['sales'] == sales + 2
+
+    counts = store.zip_cube[('price', 'count')]
+    expected = store.data['zipcode'].astype(np.int64).value_counts()
+    assert (counts.values == expected.reindex(counts.index.astype(np.int64)).values).all()
+
+
+def test_fingerprints_follow_the_batches(batches, tmp_path):
+    head, batch = batches
+    data = load(head, tmp_path)
+    first, second, third = SalesStore(data), SalesStore(data), SalesStore(data)
+
+    first.append(batch.iloc[:100])
+    second.append(batch.iloc[100:200])
+    third.append(batch.iloc[:100])
+
+    assert registered_fingerprint(first.data) != registered_fingerprint(second.data)
+    assert registered_fingerprint(first.data) == registered_fingerprint(third.data)
+
+    frame = data.copy()
+    assert registered_fingerprint(SalesStore(frame).data) != registered_fingerprint(SalesStore(frame).data)
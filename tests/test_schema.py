@@ -0,0 +1,39 @@
+import numpy  as np
+import pandas as pd
+import pytest
+
+import my_methods as mm
+from conftest import DATA_PATH
+
+
+def bytes_per_row(data):
+    return data.memory_usage(index=True, deep=True).sum() / len(data)
+
+
+def test_compact_dtypes_beat_inferred(raw_data, tmp_path):
+    data, _ = mm.check_integers(mm.hand_nonunique(raw_data, 'id'),
+                                ['bedrooms', 'bathrooms', 'floors', 'yr_built', 'yr_renovated', 'zipcode'])
+    inferred = mm.build_features(data)
+    compact, mute = mm.load_dataset.__wrapped__(DATA_PATH, str(tmp_path))
+
+    assert mute == 1
+    before, after = bytes_per_row(inferred), bytes_per_row(compact)
+    print('bytes per row: {:.0f} inferred, {:.0f} compact'.format(before, after))
+    assert after < 0.5 * before
+    for col, dtype in mm.CACHE_SCHEMA.items():
+        assert str(compact[col].dtype) == dtype
+
+
+def test_apply_schema_keeps_values():
+    data = pd.DataFrame({'price': [221900.25, 538000.], 'bedrooms': [3, 120]})
+    compact = mm.apply_schema(data)
+
+    np.testing.assert_array_equal(compact['price'].values, data['price'].values)
+    assert compact['bedrooms'].dtype == np.int8
+
+
+def test_apply_schema_rejects_lossy_casts():
+    with pytest.raises(ValueError):
+        mm.apply_schema(pd.DataFrame({'bedrooms': [3, 200]}))
+    with pytest.raises(ValueError):
+        mm.apply_schema(pd.DataFrame({'sqft_living': [1180.5, 2570.]}))
@@ -0,0 +1,53 @@
+import numpy  as np
+import pandas as pd
+
+import my_methods as mm
+from sell_timing import TimingIndex
+
+
+def naive_index(data, period, prior):
+    """
+        The zipcode x period index of TimingIndex from groupby means.
+    """
+    frame = pd.DataFrame({'zipcode': np.asarray(data['zipcode']), 'period': period,
+                          'value': np.asarray(data['price_sqft'], dtype=np.float64)})
+    frame['ratio'] = frame['value'] / frame.groupby('zipcode')['value'].transform('mean')
+
+    county = frame.groupby('period')['ratio'].mean()
+    cells = frame.groupby(['zipcode', 'period'])['ratio'].agg(['sum', 'count']).unstack(fill_value=0)
+    shrunk = (cells['sum'] + prior * county) / (cells['count'] + prior)
+
+    return shrunk, county
+
+
+def test_shrinkage_equals_groupby_means(dataset):
+    timing = mm.get_sell_timing.__wrapped__(dataset)
+    months = np.asarray(dataset['month'], dtype=np.int64) - 1
+
+    for name, period in [('month', months), ('season', mm.SEASON_OF_MONTH[months])]:
+        shrunk, county = naive_index(dataset, period, mm.TIMING_PRIOR)
+        index = timing[name]
+
+        assert list(timing['zipcodes']) == list(shrunk.index)
+        np.testing.assert_allclose(index.index[:-1], shrunk.values, rtol=1e-9)
+        np.testing.assert_allclose(index.index[-1], county.values, rtol=1e-9)
+        np.testing.assert_array_equal(index.best_periods[:-1], shrunk.values.argmax(axis=1))
+
+
+def test_prior_weights_the_county():
+    groups, periods = np.array([0, 0, 0, 1, 1, 1]), np.array([0, 1, 1, 0, 1, 0])
+    values = np.array([1., 2., 3., 4., 4., 4.])
+
+    followed = TimingIndex(groups, periods, values, n_periods=2, prior=1e9)
+    own = TimingIndex(groups, periods, values, n_periods=2, prior=0.)
+
+    np.testing.assert_allclose(followed.index[:-1], np.tile(followed.index[-1], (2, 1)))
+    np.testing.assert_allclose(own.index[0], [0.5, 1.25])
+
+
+def test_best_prices_and_unknown_groups():
+    index = TimingIndex([0, 0, 1, 1], [0, 1, 0, 1], [1., 3., 2., 2.], n_periods=2, prior=0.)
+    periods, prices = index.best([0, 1, -1], [0, 0, 0], [100., 100., 100.])
+
+    np.testing.assert_array_equal(periods, [1, 0, 1])
+    np.testing.assert_allclose(prices, [300., 100., 100. * index.index[-1, 1] / index.index[-1, 0]])
@@ -0,0 +1,68 @@
+import multiprocessing
+
+from multiprocessing import shared_memory
+
+import pandas as pd
+import pytest
+
+import my_methods as mm
+import sharding
+
+
+@pytest.fixture(scope='module')
+def sample(dataset):
+    return dataset.iloc[:3000]
+
+
+def test_sharded_analysis_equals_serial_path(sample):
+    zip_cube, season_cube, (to_buy, *totals) = sharding.sharded_analysis(sample, workers=2)
+
+    serial_zip, serial_season = mm.get_cubes.__wrapped__(sample)
+    serial_buy, *serial_totals = mm.display_houses_tobuy.__wrapped__(sample, serial_zip)
+
+    pd.testing.assert_frame_equal(zip_cube, serial_zip, check_exact=True)
+    pd.testing.assert_frame_equal(season_cube, serial_season, check_exact=True)
+    pd.testing.assert_frame_equal(to_buy, serial_buy, check_exact=True)
+    assert totals == serial_totals
+
+
+def allocated_blocks(monkeypatch):
+    names = []
+    allocate = sharding.allocate_arrays
+
+    def recording(dtypes, length):
+        blocks, specs, arrays = allocate(dtypes, length)
+        names.extend(block.name for block in blocks.values())
+        return (blocks, specs, arrays)
+
+    monkeypatch.setattr(sharding, 'allocate_arrays', recording)
+    return names
+
+
+def assert_unlinked(names):
+    assert names
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+
+def test_shared_memory_is_unlinked(sample, monkeypatch):
+    names = allocated_blocks(monkeypatch)
+    sharding.sharded_analysis(sample, workers=2)
+
+    assert_unlinked(names)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='workers must inherit the patched module')
+def test_shared_memory_is_unlinked_when_a_worker_fails(sample, monkeypatch):
+    names = allocated_blocks(monkeypatch)
+
+    def failing(*args, **kwargs):
+        raise RuntimeError('worker failed')
+
+    ## --- workers are forked after the patch and inherit it
+    monkeypatch.setattr(sharding, 'build_cube', failing)
+    with pytest.raises(RuntimeError):
+        sharding.sharded_analysis(sample, workers=2)
+
+    assert_unlinked(names)
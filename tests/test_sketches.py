@@ -0,0 +1,80 @@
+import numpy  as np
+import pandas as pd
+import pytest
+
+import my_methods as mm
+from sketches import KLLSketch, build_sketches, describe_sketches, load_sketches, merge_sketches, save_sketches
+
+QUANTILES = np.linspace(0.01, 0.99, 99)
+COLUMNS = ['price', 'sqft_living', 'sqft_lot', 'yr_built', 'bedrooms']
+
+
+def rank_error(sketch, values):
+    """
+        Largest distance, in fraction of the count, between the rank of each
+        quantile and the ranks of its estimate.
+    """
+    values = np.sort(values)
+    estimates = sketch.quantile(QUANTILES)
+    low = np.searchsorted(values, estimates, side='left') / len(values)
+    high = np.searchsorted(values, estimates, side='right') / len(values)
+
+    return np.maximum(0., np.maximum(low - QUANTILES, QUANTILES - high)).max()
+
+
+@pytest.mark.parametrize('column', COLUMNS)
+def test_quantiles_within_rank_error(dataset, column):
+    values = np.asarray(dataset[column], dtype=np.float64)
+
+    single = KLLSketch(200).update(values)
+    chunked = KLLSketch(200)
+    for chunk in np.array_split(values, 200):
+        chunked.update(chunk)
+    merged = KLLSketch(200, seed=1).update(values[:5000]).merge(KLLSketch(200, seed=2).update(values[5000:]))
+
+    for sketch in (single, chunked, merged):
+        assert sketch.count == len(values)
+        assert sum(len(items) for items in sketch.levels) <= 3 * 200
+        assert rank_error(sketch, values) <= 0.015
+
+    ## --- the estimates lie between the exact quantiles a little beyond that rank error
+    estimates = single.quantile(QUANTILES)
+    assert np.all(np.quantile(values, np.clip(QUANTILES - 0.02, 0., 1.)) <= estimates)
+    assert np.all(estimates <= np.quantile(values, np.clip(QUANTILES + 0.02, 0., 1.)))
+
+
+def test_moments_equal_describe(dataset):
+    exact = dataset[COLUMNS].describe()
+    chunks = np.array_split(np.arange(len(dataset)), 7)
+
+    sketches = build_sketches(dataset.iloc[chunks[0]], COLUMNS)
+    for chunk in chunks[1:]:
+        merge_sketches(sketches, build_sketches(dataset.iloc[chunk], COLUMNS))
+    described = describe_sketches(sketches)
+
+    for stat in ['count', 'mean', 'std', 'min', 'max']:
+        np.testing.assert_allclose(described.loc[stat, COLUMNS].astype(float), exact.loc[stat, COLUMNS], rtol=1e-9)
+
+
+def test_save_and_load(dataset, tmp_path):
+    sketches = build_sketches(dataset, COLUMNS)
+    path = str(tmp_path / 'sketches.json')
+    save_sketches(sketches, path)
+
+    pd.testing.assert_frame_equal(describe_sketches(load_sketches(path)), describe_sketches(sketches))
+
+
+def test_empty_sketch():
+    sketch = KLLSketch().update([np.nan])
+
+    assert sketch.count == 0 and np.isnan(sketch.quantile(0.5))
+    assert describe_sketches(build_sketches(pd.DataFrame({'a': [np.nan]}))).loc['count', 'a'] == 0
+
+
+def test_display_descriptive_matches_exact(dataset):
+    approx = mm.display_descriptive.__wrapped__(dataset, [], 0.25)[0]
+    exact = mm.display_descriptive.__wrapped__(dataset, [], 0.25, exact=True)[0]
+
+    ## --- describe sums the float32 columns (price_sqft, to_renovate) with less precision than the sketches
+    np.testing.assert_allclose(approx.loc[['# entries', 'Mean', 'Std Dev', 'Min', 'Max']],
+                               exact.loc[['# entries', 'Mean', 'Std Dev', 'Min', 'Max']], rtol=1e-6)
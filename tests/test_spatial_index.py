@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from spatial_index import SpatialIndex, haversine_km
+
+
+def points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 47.2 + 0.6 * rng.random(n), -122.5 + 0.8 * rng.random(n)
+
+
+def brute_nearest(lat, long, qlat, qlong, k, exclude=None):
+    dist = haversine_km(qlat, qlong, lat, long)
+    if exclude is not None:
+        dist[exclude] = np.inf
+    order = np.argsort(dist, kind='stable')[:k]
+    return dist[order]
+
+
+@pytest.mark.parametrize('cell_km', [0.5, 2.])
+def test_queries_match_brute_force(cell_km):
+    lat, long = points(2000)
+    index = SpatialIndex(lat, long, cell_km)
+
+    for qlat, qlong in zip(*points(20, seed=1)):
+        found, dist = index.within(qlat, qlong, 3.)
+        expected = np.flatnonzero(haversine_km(qlat, qlong, lat, long) <= 3.)
+        assert sorted(found) == sorted(expected)
+        assert np.all(np.diff(dist) >= 0)
+
+        found, dist = index.nearest(qlat, qlong, 7)
+        np.testing.assert_allclose(dist, brute_nearest(lat, long, qlat, qlong, 7))
+        np.testing.assert_allclose(haversine_km(qlat, qlong, lat[found], long[found]), dist)
+
+    found = index.bbox(47.4, 47.5, -122.3, -122.1)
+    expected = np.flatnonzero((lat >= 47.4) & (lat <= 47.5) & (long >= -122.3) & (long <= -122.1))
+    assert sorted(found) == sorted(expected)
+
+
+def test_nearest_from_outside_the_grid():
+    lat, long = points(300)
+    index = SpatialIndex(lat, long)
+
+    found, dist = index.nearest(46.9, -121.5, 5)
+    np.testing.assert_allclose(dist, brute_nearest(lat, long, 46.9, -121.5, 5))
+
+
+@pytest.mark.parametrize('n, k', [(500, 5), (12, 11), (12, 30), (2, 1), (1, 1), (1, 4)])
+def test_neighbours_match_brute_force(n, k):
+    lat, long = points(n)
+    positions, distances = SpatialIndex(lat, long).neighbours(k)
+
+    k = min(k, n - 1)
+    assert positions.shape == distances.shape == (n, k)
+    for i in range(n):
+        assert i not in positions[i]
+        np.testing.assert_allclose(distances[i], brute_nearest(lat, long, lat[i], long[i], k, exclude=i))
+
+
+def test_nearest_with_a_single_point():
+    index = SpatialIndex([47.5], [-122.2])
+
+    assert len(index.nearest(47.5, -122.2, 3, exclude=0)[0]) == 0
+    np.testing.assert_array_equal(index.nearest(47.6, -122.2, 3)[0], [0])
@@ -0,0 +1,73 @@
+"""
+    Build the figures and maps of a first visit of the dashboard ahead of
+    time, e.g. at deploy time, and store them in the figure store shared by
+    the dashboard processes (see cache_figure in caching.py). Sessions then
+    read them instead of building them.
+
+    Run it from the directory the dashboard is served from, or point
+    --figure-dir at the KC_FIGURE_DIR of the dashboard.
+
+    Usage: python warm_figures.py [kc_house_data.csv] [--cache-dir .cache]
+                                  [--figure-dir .cache/figures] [--clear] [--skip-maps]
+                                  [--fetch-boundaries]
+
+    --fetch-boundaries downloads the zipcode boundaries of the density map to
+    geodata/kc_zipcodes.geojson, the only network access of the dashboard,
+    to be committed along with it. Without that file, the map is drawn over
+    zipcode areas approximated from the sales.
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Store the figures of the dashboard ahead of the first visit.')
+    parser.add_argument('input', nargs='?', default='kc_house_data.csv', help='sales csv file served by the dashboard')
+    parser.add_argument('--cache-dir', default='.cache', help='directory of the cleaned Feather files')
+    parser.add_argument('--figure-dir', default=None, help='directory of the stored figures (default: KC_FIGURE_DIR)')
+    parser.add_argument('--clear', action='store_true', help='remove the stored figures first, e.g. of older datasets')
+    parser.add_argument('--skip-maps', action='store_true', help='do not build the folium maps')
+    parser.add_argument('--fetch-boundaries', action='store_true', help='download the zipcode boundaries first')
+    args = parser.parse_args(argv)
+
+    ## --- read by caching.py when it is imported
+    if args.figure_dir is not None:
+        os.environ['KC_FIGURE_DIR'] = args.figure_dir
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    import my_methods as mm
+    import my_plots   as mp
+    from caching import FIGURE_DIR
+
+    if args.clear:
+        for path in glob.glob(os.path.join(FIGURE_DIR, '*.json')):
+            os.remove(path)
+
+    start = time.perf_counter()
+    data, mute = mm.load_dataset(args.input, args.cache_dir)
+    if mute == 0:
+        print('{} could not be read or cleaned.'.format(args.input))
+        return 1
+
+    zip_cube, season_cube = mm.get_cubes(data)
+    figures = mp.warm_figures(data, season_cube)
+
+    if not args.skip_maps:
+        import my_maps as mg
+
+        if args.fetch_boundaries:
+            mg.fetch_geo_source()
+        mg.markers_map_html(data)
+        mg.density_map_html(data, zip_cube)
+        figures += 2
+
+    print('{} figures stored in {} in {:.2f} s'.format(figures, FIGURE_DIR, time.perf_counter() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())